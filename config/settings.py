@@ -11,8 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,12 +44,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its total covers every other middleware
+    'store.instrumentation.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Needs request.user: staff can profile a single request on demand
+    'store.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -68,6 +73,20 @@ TEMPLATES = [
             ],
         },
     },
+    {
+        # Outgoing emails always go through the cached loader, even with
+        # DEBUG on, since send_outbox renders them in bulk
+        'NAME': 'emails',
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [BASE_DIR / 'store' / 'templates'],
+        'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                ]),
+            ],
+        },
+    },
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
@@ -176,7 +195,97 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@authorstore.com')
+# Outbox worker throttle; Gmail SMTP rejects bursts well below this
+EMAIL_OUTBOX_RATE_PER_SECOND = config('EMAIL_OUTBOX_RATE_PER_SECOND', default=5, cast=float)
+
+# Pending (unpaid) orders hold their stock until released. Stripe Checkout
+# sessions expire after 24 hours, so nothing can be paid past this TTL.
+PENDING_ORDER_TTL_HOURS = config('PENDING_ORDER_TTL_HOURS', default=24, cast=float)
+
+# Point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached in production so
+# cached analytics and their recompute locks are shared between processes
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='vollmond'),
+    }
+}
+
+# Seconds each analytics dashboard section is served before it is
+# recomputed in the background; stale data is kept for ANALYTICS_CACHE_MAX_STALE
+ANALYTICS_CACHE_TTLS = {
+    'default': config('ANALYTICS_CACHE_TTL', default=60, cast=int),
+    'recent_orders': 15,
+    'top_products': 300,
+    'customers': 300,
+    'reviews': 300,
+}
+ANALYTICS_CACHE_MAX_STALE = config('ANALYTICS_CACHE_MAX_STALE', default=3600, cast=int)
+
+# Dashboard sections are computed concurrently on a shared pool of this many
+# threads, each with its own DB connection (0 computes them one by one). A
+# section not done within ANALYTICS_SECTION_TIMEOUT seconds is reported as
+# unavailable instead of holding up the response.
+ANALYTICS_DASHBOARD_WORKERS = config('ANALYTICS_DASHBOARD_WORKERS', default=4, cast=int)
+ANALYTICS_SECTION_TIMEOUT = config('ANALYTICS_SECTION_TIMEOUT', default=10, cast=float)
+
+# Per-request timing (store.instrumentation.PerformanceMiddleware). Every
+# request is logged as a JSON line on the store.performance logger; slower
+# ones are logged again with their most repeated SQL. The Server-Timing
+# header is always sent to staff, and to everyone when enabled.
+PERFORMANCE_SLOW_REQUEST_MS = config('PERFORMANCE_SLOW_REQUEST_MS', default=1000, cast=float)
+PERFORMANCE_SERVER_TIMING = config('PERFORMANCE_SERVER_TIMING', default=DEBUG, cast=bool)
+
+# Prometheus metrics at /metrics (store.metrics). Only METRICS_ALLOWED_IPS
+# may scrape it, sending "Authorization: Bearer <METRICS_BEARER_TOKEN>":
+# behind a local reverse proxy every request comes from 127.0.0.1, so the
+# address alone proves nothing. Without a token the endpoint only answers
+# when DEBUG is on. With several worker processes, point METRICS_DIR at a
+# directory they all share (emptied on deploy) so every process is counted.
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+METRICS_BEARER_TOKEN = config('METRICS_BEARER_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=1, cast=float)
+
+# On-demand profiling (store.profiling.ProfilerMiddleware and the
+# profile_endpoint command): collapsed-stack files for flamegraphs are
+# written here, sampling the request's stack every PROFILER_INTERVAL seconds
+PROFILER_DIR = config('PROFILER_DIR', default=os.path.join(tempfile.gettempdir(), 'vollmond-profiles'))
+PROFILER_INTERVAL = config('PROFILER_INTERVAL', default=0.005, cast=float)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'store.performance': {
+            'handlers': ['console'],
+            'level': config('PERFORMANCE_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'store.analytics': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'store.webhooks': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
 CRONJOBS = [
     ('0 9 * * *', 'store.management.commands.check_inventory.Command', ['--send-email']),
+    ('*/15 * * * *', 'store.management.commands.release_stale_orders.Command'),
+    ('* * * * *', 'store.management.commands.process_webhook_events.Command'),
+    ('* * * * *', 'store.management.commands.send_outbox.Command'),
+    # Safety net for the incrementally maintained sales rollup
+    ('30 3 * * *', 'store.management.commands.rebuild_sales_rollup.Command', ['--days', '3']),
+    ('0 4 * * *', 'store.management.commands.build_cohorts.Command'),
 ]
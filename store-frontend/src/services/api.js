@@ -124,7 +124,7 @@ export const cart = {
 
 // Order endpoint
 export const orders = {
-    getAll: () => api.get('/orders/'),
+    getAll: () => api.get('/orders/', { params: { include_archived: 1 } }),
     getById: (id) => api.get(`/orders/${id}/`),
     getTracking: (id) => api.get(`/orders/${id}/tracking/`),
 };
@@ -1,5 +1,18 @@
 from django.contrib import admin
-from .models import Category, Product, Cart, CartItem, Order, OrderItem, Coupon, ProductReview
+from .models import (
+    Category,
+    Product,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    Coupon,
+    ProductReview,
+    ArchivedOrder,
+    ArchivedOrderItem,
+    StripeEvent,
+    OutboxEmail,
+)
 
 admin.site.site_header = "Adminstración El Mercado de Vollmond"
 admin.site.site_title = "El Mercado de Vollmond Admin"
@@ -46,6 +59,10 @@ class ProductAdmin(admin.ModelAdmin):
 
     readonly_fields = ["created_at", "updated_at"]
 
+    def get_queryset(self, request):
+        # review_count from one annotation instead of a query per row
+        return super().get_queryset(request).for_display()
+
     def stock_status(self, obj):
         """Display stock status with color coding"""
         if obj.is_out_of_stock:
@@ -112,6 +129,10 @@ class CartAdmin(admin.ModelAdmin):
 
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        # total_items and subtotal read the prefetched lines and products
+        return super().get_queryset(request).select_related("user").prefetch_related("items__product")
+
     def total_items(self, obj):
         return obj.total_items
     total_items.short_description = "Items"
@@ -244,44 +265,200 @@ class OrderAdmin(admin.ModelAdmin):
         self.message_user(request, f"{updated} order(s) marked as processing.")
     mark_as_processing.short_description = "Mark selected orders as Processing"
     
+    def transition_orders(self, request, queryset, status, email_label):
+        """Set-based status change shared by the shipped/delivered actions"""
+        from django.contrib import messages
+        from store.fulfillment import FulfillmentService
+
+        batches = []
+        updated, skipped = FulfillmentService.transition(
+            queryset,
+            status,
+            progress=lambda done, total: batches.append(done),
+        )
+
+        self.message_user(
+            request,
+            f"{updated} of {updated + skipped} order(s) marked as {status} in "
+            f"{len(batches)} batch(es); {email_label} emails queued for sending."
+        )
+        if skipped:
+            self.message_user(
+                request,
+                f"{skipped} order(s) were already {status} and were left unchanged.",
+                messages.WARNING,
+            )
+
     def mark_as_shipped(self, request, queryset):
         """Bulk action: Mark orders as shipped"""
-        from django.utils import timezone
-        from store.email_service import EmailService
-        
-        updated = 0
-        for order in queryset:
-            order.status = 'shipped'
-            if not order.shipped_at:
-                order.shipped_at = timezone.now()
-            order.save()
-            
-            # Send shipping notification email
-            EmailService.send_shipping_notification(order)
-            updated += 1
-            
-        self.message_user(request, f'{updated} order(s) marked as shipped and emails sent.')
+        self.transition_orders(request, queryset, 'shipped', 'shipping')
     mark_as_shipped.short_description = 'Mark selected orders as Shipped (sends email)'
     
     def mark_as_delivered(self, request, queryset):
         """Bulk action: Mark orders as delivered"""
-        from django.utils import timezone
-        from store.email_service import EmailService
-        
-        updated = 0
-        for order in queryset:
-            order.status = 'delivered'
-            if not order.delivered_at:
-                order.delivered_at = timezone.now()
-            order.save()
-            
-            # Send delivery notification email
-            EmailService.send_order_delivered_notification(order)
-            updated += 1
-            
-        self.message_user(request, f'{updated} order(s) marked as delivered and emails sent.')
+        self.transition_orders(request, queryset, 'delivered', 'delivery')
     mark_as_delivered.short_description = 'Mark selected orders as Delivered (sends email)'
 
+    def changelist_view(self, request, extra_context=None):
+        """
+        Collect list_editable rows in save_model and write them with one
+        bulk_update, instead of a full-row save() per changed order
+        """
+        from django.db import transaction
+
+        request._pending_order_saves = {"orders": [], "fields": set()}
+        with transaction.atomic():
+            response = super().changelist_view(request, extra_context)
+            self.flush_pending_saves(request._pending_order_saves)
+        return response
+
+    def save_model(self, request, obj, form, change):
+        pending = getattr(request, "_pending_order_saves", None)
+        if pending is not None and change:
+            pending["orders"].append(obj)
+            pending["fields"].update(form.changed_data)
+            return
+
+        super().save_model(request, obj, form, change)
+
+        # Keep the sales rollup in step with manual payment corrections/refunds
+        if "payment_status" in form.changed_data:
+            from store.rollups import SalesRollupService
+
+            was_completed = change and form.initial.get("payment_status") == "completed"
+            is_completed = obj.payment_status == "completed"
+            if is_completed and not was_completed:
+                SalesRollupService.record_orders([obj.pk])
+            elif was_completed and not is_completed:
+                SalesRollupService.record_orders([obj.pk], sign=-1)
+
+    def flush_pending_saves(self, pending):
+        """Write the collected list_editable changes in one UPDATE per batch"""
+        from django.utils import timezone
+
+        if not pending["orders"]:
+            return
+        now = timezone.now()
+        for order in pending["orders"]:
+            order.updated_at = now
+        Order.objects.bulk_update(
+            pending["orders"],
+            sorted(pending["fields"]) + ["updated_at"],
+            batch_size=500,
+        )
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    """Show archived items inside the ArchivedOrder admin page"""
+    model = ArchivedOrderItem
+    extra = 0
+    readonly_fields = ["product", "product_name", "product_price", "quantity"]
+    can_delete = False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only admin interface for orders moved out by archive_orders"""
+    list_display = [
+        "order_number",
+        "user",
+        "email",
+        "total",
+        "status",
+        "payment_status",
+        "created_at",
+        "archived_at"
+    ]
+    list_filter = ["status", "payment_status"]
+    search_fields = ["order_number", "email", "user__username"]
+    date_hierarchy = "created_at"
+    show_full_result_count = False
+
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """Admin interface for the Stripe webhook inbox"""
+    list_display = [
+        "event_id",
+        "event_type",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "received_at",
+        "processed_at"
+    ]
+    list_filter = ["status", "event_type"]
+    search_fields = ["event_id"]
+    readonly_fields = [
+        "event_id",
+        "event_type",
+        "payload",
+        "attempts",
+        "last_error",
+        "received_at",
+        "processed_at"
+    ]
+
+    actions = ["requeue_events"]
+
+    def requeue_events(self, request, queryset):
+        """Bulk action: Retry failed events"""
+        from django.utils import timezone
+
+        updated = queryset.exclude(status="processed").update(
+            status="pending",
+            attempts=0,
+            next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} event(s) queued for retry.")
+    requeue_events.short_description = "Retry selected events"
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    """Admin interface for the outgoing email queue"""
+    list_display = [
+        "message_type",
+        "recipient",
+        "order",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+        "sent_at"
+    ]
+    list_filter = ["status", "message_type"]
+    search_fields = ["recipient", "order__order_number", "archived_order__order_number"]
+    readonly_fields = [
+        "message_type",
+        "recipient",
+        "order",
+        "archived_order",
+        "context",
+        "attempts",
+        "last_error",
+        "created_at",
+        "sent_at"
+    ]
+
+    actions = ["requeue_emails"]
+
+    def requeue_emails(self, request, queryset):
+        """Bulk action: Retry dead or pending emails"""
+        from django.utils import timezone
+
+        updated = queryset.exclude(status="sent").update(
+            status="pending",
+            attempts=0,
+            next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} email(s) queued for retry.")
+    requeue_emails.short_description = "Retry selected emails"
+
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
     """
@@ -366,6 +543,7 @@ class ProductReviewAdmin(admin.ModelAdmin):
         'is_verified_purchase',
         'created_at'
     ]
+    list_select_related = ['product', 'user']
     
     list_filter = [
         'rating',
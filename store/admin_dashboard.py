@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.urls import path
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from .analytics import AnalyticsService
+from .analytics_cache import AnalyticsCache
 
 
 @staff_member_required
@@ -14,7 +14,7 @@ def dashboard_view(request):
     context = {
         **admin.site.each_context(request),
         'title': 'Dashboard',
-        'dashboard_data': AnalyticsService.get_complete_dashboard(),
+        'dashboard_data': AnalyticsCache.get_dashboard(),
     }
     return render(request, 'admin/dashboard.html', context)
 
@@ -1,9 +1,33 @@
 # store/analytics.py
-from django.db.models import Sum, Count, Avg, Q, F
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import (
+    Sum, Count, Avg, Max, Q, F, Exists, OuterRef, Case, When, Value, DateField
+)
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-from .models import Order, Product, OrderItem, User, ProductReview
+from .models import (
+    Order,
+    Product,
+    OrderItem,
+    User,
+    ProductReview,
+    ArchivedOrder,
+    ArchivedOrderItem,
+    DailySalesRollup,
+    DailyProductSales,
+)
+
+logger = logging.getLogger(__name__)
+
+_section_executor = None
+_section_executor_lock = threading.Lock()
 
 
 class AnalyticsService:
@@ -25,79 +49,133 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def get_sales_overview():
+    def get_order_models(include_archived=False):
+        """Live order/item models, plus the archive tables when asked"""
+        if include_archived:
+            return [(Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)]
+        return [(Order, OrderItem)]
+    
+    @staticmethod
+    def get_order_rollup(include_archived=False):
+        """
+        Order counts per (status, payment_status)
+        One grouped query per order table; both status breakdowns are
+        derived from its rows
+        """
+        rows = []
+        for order_model, _ in AnalyticsService.get_order_models(include_archived):
+            rows.extend(
+                order_model.objects.values('status', 'payment_status')
+                .annotate(orders=Count('id'))
+                .order_by()
+            )
+        return rows
+    
+    @staticmethod
+    def get_sales_rollup(days=30):
+        """
+        Completed sales from the daily rollup table, in one grouped query
+        Days inside the window come back one row each; everything older
+        collapses into a single row with day=None, so all-time totals
+        never need a second query. Covers at least the last 30 days.
+        """
+        window_start = timezone.localdate() - timedelta(days=max(days, 30))
+        
+        return list(
+            DailySalesRollup.objects.values(
+                day=Case(
+                    When(date__gte=window_start, then=F('date')),
+                    default=Value(None),
+                    output_field=DateField(),
+                )
+            ).annotate(
+                orders=Sum('orders'),
+                revenue=Sum('revenue'),
+                units=Sum('units'),
+            ).order_by()
+        )
+    
+    @staticmethod
+    def get_sales_overview(sales=None):
         """Get overall sales statistics"""
-        dates = AnalyticsService.get_date_ranges()
+        if sales is None:
+            sales = AnalyticsService.get_sales_rollup()
+        
+        today = timezone.localdate()
+        periods = {
+            'today': today,
+            'this_week': today - timedelta(days=7),
+            'this_month': today - timedelta(days=30),
+        }
         
-        # Total completed orders
-        total_orders = Order.objects.filter(payment_status='completed').count()
-        
-        # Orders by time period
-        orders_today = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=dates['today_start']
-        ).count()
-        
-        orders_this_week = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=dates['week_start']
-        ).count()
-        
-        orders_this_month = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=dates['month_start']
-        ).count()
-        
-        # Total revenue
-        total_revenue = Order.objects.filter(
-            payment_status='completed'
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        # Revenue by time period
-        revenue_today = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=dates['today_start']
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        revenue_this_week = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=dates['week_start']
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
-        
-        revenue_this_month = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=dates['month_start']
-        ).aggregate(total=Sum('total'))['total'] or Decimal('0')
+        stats = {
+            'total_orders': 0,
+            'orders_today': 0,
+            'orders_this_week': 0,
+            'orders_this_month': 0,
+            'total_revenue': Decimal('0'),
+            'revenue_today': Decimal('0'),
+            'revenue_this_week': Decimal('0'),
+            'revenue_this_month': Decimal('0'),
+        }
+        
+        for row in sales:
+            stats['total_orders'] += row['orders']
+            stats['total_revenue'] += row['revenue']
+            if row['day'] is None:
+                continue
+            for period, start in periods.items():
+                if row['day'] >= start:
+                    stats[f'orders_{period}'] += row['orders']
+                    stats[f'revenue_{period}'] += row['revenue']
         
         # Average order value
-        avg_order_value = Order.objects.filter(
-            payment_status='completed'
-        ).aggregate(avg=Avg('total'))['avg'] or Decimal('0')
+        avg_order_value = (
+            stats['total_revenue'] / stats['total_orders']
+            if stats['total_orders'] else Decimal('0')
+        )
         
         return {
-            'total_orders': total_orders,
-            'orders_today': orders_today,
-            'orders_this_week': orders_this_week,
-            'orders_this_month': orders_this_month,
-            'total_revenue': float(total_revenue),
-            'revenue_today': float(revenue_today),
-            'revenue_this_week': float(revenue_this_week),
-            'revenue_this_month': float(revenue_this_month),
+            'total_orders': stats['total_orders'],
+            'orders_today': stats['orders_today'],
+            'orders_this_week': stats['orders_this_week'],
+            'orders_this_month': stats['orders_this_month'],
+            'total_revenue': float(stats['total_revenue']),
+            'revenue_today': float(stats['revenue_today']),
+            'revenue_this_week': float(stats['revenue_this_week']),
+            'revenue_this_month': float(stats['revenue_this_month']),
             'average_order_value': float(avg_order_value),
         }
     
     @staticmethod
-    def get_top_products(limit=5):
-        """Get top-selling products"""
-        top_products = OrderItem.objects.filter(
-            order__payment_status='completed'
-        ).values(
-            'product_id',
-            'product_name'
+    def get_top_products(limit=5, start=None, end=None, category=None, rank_by='units'):
+        """
+        Get top-selling products, optionally between two dates (inclusive)
+        and within a category (slug), ranked by units sold or revenue
+        Read from the per-product daily counters; the date range and
+        category filters use their indexes and the database does the ranking
+        """
+        if rank_by not in ('units', 'revenue'):
+            raise ValueError("rank_by must be 'units' or 'revenue'")
+        
+        counters = DailyProductSales.objects.all()
+        if start:
+            counters = counters.filter(date__gte=start)
+        if end:
+            counters = counters.filter(date__lte=end)
+        if category:
+            counters = counters.filter(category__slug=category)
+        
+        top_products = counters.values(
+            'product_id'
         ).annotate(
-            total_sold=Sum('quantity'),
-            revenue=Sum(F('quantity') * F('product_price'))
-        ).order_by('-total_sold')[:limit]
+            product_name=Max('product_name'),
+            total_sold=Sum('units'),
+            revenue=Sum('revenue')
+        ).order_by(
+            '-total_sold' if rank_by == 'units' else '-revenue',
+            'product_id'
+        )[:limit]
         
         return list(top_products)
     
@@ -107,108 +185,119 @@ class AnalyticsService:
         return Order.objects.select_related('user').order_by('-created_at')[:limit]
     
     @staticmethod
-    def get_order_status_breakdown():
+    def get_order_status_breakdown(include_archived=False, rollup=None):
         """Get count of orders by status"""
-        breakdown = Order.objects.values('status').annotate(
-            count=Count('id')
-        ).order_by('status')
+        if rollup is None:
+            rollup = AnalyticsService.get_order_rollup(include_archived)
         
-        return {item['status']: item['count'] for item in breakdown}
+        result = {}
+        for row in rollup:
+            result[row['status']] = result.get(row['status'], 0) + row['orders']
+        
+        return dict(sorted(result.items()))
     
     @staticmethod
-    def get_payment_status_breakdown():
+    def get_payment_status_breakdown(include_archived=False, rollup=None):
         """Get count of orders by payment status"""
-        breakdown = Order.objects.values('payment_status').annotate(
-            count=Count('id')
-        ).order_by('payment_status')
+        if rollup is None:
+            rollup = AnalyticsService.get_order_rollup(include_archived)
+        
+        result = {}
+        for row in rollup:
+            key = row['payment_status']
+            result[key] = result.get(key, 0) + row['orders']
         
-        return {item['payment_status']: item['count'] for item in breakdown}
+        return dict(sorted(result.items()))
     
     @staticmethod
-    def get_customer_statistics():
+    def get_customer_statistics(include_archived=False):
         """Get customer statistics"""
-        total_customers = User.objects.filter(is_staff=False).count()
+        dates = AnalyticsService.get_date_ranges()
         
         # Customers with orders
-        customers_with_orders = User.objects.filter(
-            orders__payment_status='completed'
-        ).distinct().count()
+        has_orders = Q(Exists(
+            Order.objects.filter(user=OuterRef('pk'), payment_status='completed')
+        ))
+        if include_archived:
+            has_orders |= Q(Exists(
+                ArchivedOrder.objects.filter(user=OuterRef('pk'), payment_status='completed')
+            ))
         
-        # New customers this month
-        dates = AnalyticsService.get_date_ranges()
-        new_customers_this_month = User.objects.filter(
-            is_staff=False,
-            date_joined__gte=dates['month_start']
-        ).count()
+        stats = User.objects.aggregate(
+            total_customers=Count('id', filter=Q(is_staff=False)),
+            customers_with_orders=Count('id', filter=has_orders),
+            new_customers_this_month=Count('id', filter=Q(
+                is_staff=False,
+                date_joined__gte=dates['month_start']
+            )),
+        )
         
         return {
-            'total_customers': total_customers,
-            'customers_with_orders': customers_with_orders,
-            'new_customers_this_month': new_customers_this_month,
+            'total_customers': stats['total_customers'],
+            'customers_with_orders': stats['customers_with_orders'],
+            'new_customers_this_month': stats['new_customers_this_month'],
         }
     
     @staticmethod
     def get_inventory_alerts():
         """Get products with low stock or out of stock"""
-        low_stock = Product.objects.filter(
-            Q(stock__lte=F('low_stock_threshold')),
-            Q(stock__gt=0),
-            is_available=True
-        ).count()
-        
-        out_of_stock = Product.objects.filter(
-            stock=0
-        ).count()
+        stats = Product.objects.aggregate(
+            low_stock_count=Count('id', filter=Q(
+                stock__lte=F('low_stock_threshold'),
+                stock__gt=0,
+                is_available=True
+            )),
+            out_of_stock_count=Count('id', filter=Q(stock=0)),
+        )
         
         return {
-            'low_stock_count': low_stock,
-            'out_of_stock_count': out_of_stock,
+            'low_stock_count': stats['low_stock_count'],
+            'out_of_stock_count': stats['out_of_stock_count'],
         }
     
     @staticmethod
     def get_review_statistics():
         """Get review statistics"""
-        total_reviews = ProductReview.objects.count()
-        approved_reviews = ProductReview.objects.filter(is_approved=True).count()
-        pending_reviews = ProductReview.objects.filter(is_approved=False).count()
-        
-        avg_rating = ProductReview.objects.filter(
-            is_approved=True
-        ).aggregate(avg=Avg('rating'))['avg']
+        stats = ProductReview.objects.aggregate(
+            total_reviews=Count('id'),
+            approved_reviews=Count('id', filter=Q(is_approved=True)),
+            pending_reviews=Count('id', filter=Q(is_approved=False)),
+            avg_rating=Avg('rating', filter=Q(is_approved=True)),
+        )
+        avg_rating = stats['avg_rating']
         
         return {
-            'total_reviews': total_reviews,
-            'approved_reviews': approved_reviews,
-            'pending_reviews': pending_reviews,
+            'total_reviews': stats['total_reviews'],
+            'approved_reviews': stats['approved_reviews'],
+            'pending_reviews': stats['pending_reviews'],
             'average_rating': round(float(avg_rating), 1) if avg_rating else 0,
         }
     
     @staticmethod
-    def get_daily_sales(days=30):
+    def get_daily_sales(days=30, sales=None):
         """Get daily sales for the last N days"""
-        from django.db.models.functions import TruncDate
+        if sales is None:
+            sales = AnalyticsService.get_sales_rollup(days)
         
-        dates = AnalyticsService.get_date_ranges()
-        start_date = timezone.now() - timedelta(days=days)
-        
-        daily_sales = Order.objects.filter(
-            payment_status='completed',
-            created_at__gte=start_date
-        ).annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(
-            orders=Count('id'),
-            revenue=Sum('total')
-        ).order_by('date')
+        start_date = timezone.localdate() - timedelta(days=days)
         
-        return list(daily_sales)
+        return [
+            {
+                'date': row['day'],
+                'orders': row['orders'],
+                'revenue': row['revenue'],
+                'units': row['units'],
+            }
+            for row in sorted(
+                (row for row in sales if row['day'] and row['day'] >= start_date),
+                key=lambda row: row['day'],
+            )
+        ]
     
     @staticmethod
-    def get_complete_dashboard():
-        """Get all dashboard data in one call"""
+    def get_recent_orders_section():
+        """Recent orders, serialized for the dashboard"""
         return {
-            'sales_overview': AnalyticsService.get_sales_overview(),
-            'top_products': AnalyticsService.get_top_products(),
             'recent_orders': [
                 {
                     'id': order.id,
@@ -222,10 +311,131 @@ class AnalyticsService:
                 }
                 for order in AnalyticsService.get_recent_orders()
             ],
-            'order_status_breakdown': AnalyticsService.get_order_status_breakdown(),
-            'payment_status_breakdown': AnalyticsService.get_payment_status_breakdown(),
-            'customer_statistics': AnalyticsService.get_customer_statistics(),
-            'inventory_alerts': AnalyticsService.get_inventory_alerts(),
-            'review_statistics': AnalyticsService.get_review_statistics(),
-            'daily_sales': AnalyticsService.get_daily_sales(30),
         }
+    
+    @staticmethod
+    def get_sales_section():
+        """Sales overview and the 30-day chart, from one rollup query"""
+        sales = AnalyticsService.get_sales_rollup(30)
+        return {
+            'sales_overview': AnalyticsService.get_sales_overview(sales),
+            'daily_sales': AnalyticsService.get_daily_sales(30, sales),
+        }
+    
+    @staticmethod
+    def get_order_status_section(include_archived=False):
+        """Both status breakdowns, from one grouped query per order table"""
+        rollup = AnalyticsService.get_order_rollup(include_archived)
+        return {
+            'order_status_breakdown': AnalyticsService.get_order_status_breakdown(rollup=rollup),
+            'payment_status_breakdown': AnalyticsService.get_payment_status_breakdown(rollup=rollup),
+        }
+    
+    @staticmethod
+    def get_dashboard_sections(include_archived=False):
+        """
+        The dashboard split into independently computable sections
+        Maps section name to a callable returning that part of the data
+        """
+        return {
+            'sales': AnalyticsService.get_sales_section,
+            'top_products': lambda: {
+                'top_products': AnalyticsService.get_top_products(),
+            },
+            'recent_orders': AnalyticsService.get_recent_orders_section,
+            'order_status': lambda: AnalyticsService.get_order_status_section(include_archived),
+            'customers': lambda: {
+                'customer_statistics': AnalyticsService.get_customer_statistics(include_archived),
+            },
+            'inventory': lambda: {
+                'inventory_alerts': AnalyticsService.get_inventory_alerts(),
+            },
+            'reviews': lambda: {
+                'review_statistics': AnalyticsService.get_review_statistics(),
+            },
+        }
+    
+    @staticmethod
+    def get_section_executor():
+        """Thread pool shared by every dashboard request, created on first use"""
+        global _section_executor
+        with _section_executor_lock:
+            if _section_executor is None:
+                _section_executor = ThreadPoolExecutor(
+                    max_workers=settings.ANALYTICS_DASHBOARD_WORKERS,
+                    thread_name_prefix='dashboard-section',
+                )
+            return _section_executor
+    
+    @staticmethod
+    def time_section(compute):
+        """Run one section in a worker thread on its own DB connection"""
+        close_old_connections()
+        started = time.perf_counter()
+        try:
+            return compute(), round((time.perf_counter() - started) * 1000, 1)
+        finally:
+            close_old_connections()
+    
+    @staticmethod
+    def run_sections(tasks, timeout=None):
+        """
+        Run independent sections concurrently, each on its own thread and
+        DB connection, and wait at most timeout seconds for all of them
+        Returns (results, timings_ms, unavailable): a section that times
+        out or fails is reported as unavailable instead of holding up or
+        breaking the rest. ANALYTICS_DASHBOARD_WORKERS=0 runs them inline.
+        """
+        timeout = settings.ANALYTICS_SECTION_TIMEOUT if timeout is None else timeout
+        results, timings, unavailable = {}, {}, []
+        
+        if not settings.ANALYTICS_DASHBOARD_WORKERS:
+            for name, compute in tasks.items():
+                started = time.perf_counter()
+                try:
+                    results[name] = compute()
+                except Exception:
+                    logger.exception("Dashboard section %s failed", name)
+                    unavailable.append(name)
+                    continue
+                timings[name] = round((time.perf_counter() - started) * 1000, 1)
+            return results, timings, unavailable
+        
+        executor = AnalyticsService.get_section_executor()
+        futures = {
+            name: executor.submit(AnalyticsService.time_section, compute)
+            for name, compute in tasks.items()
+        }
+        deadline = time.monotonic() + timeout
+        for name, future in futures.items():
+            try:
+                results[name], timings[name] = future.result(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except FutureTimeoutError:
+                # The thread can't be stopped; its result is just not waited for
+                logger.error("Dashboard section %s timed out after %ss", name, timeout)
+                unavailable.append(name)
+            except Exception:
+                logger.exception("Dashboard section %s failed", name)
+                unavailable.append(name)
+        
+        return results, timings, unavailable
+    
+    @staticmethod
+    def get_complete_dashboard(include_archived=False):
+        """
+        Get all dashboard data in one call
+        Sections are computed concurrently; section_timings_ms and
+        unavailable_sections report how each one went
+        """
+        results, timings, unavailable = AnalyticsService.run_sections(
+            AnalyticsService.get_dashboard_sections(include_archived)
+        )
+        
+        data = {}
+        for section_data in results.values():
+            data.update(section_data)
+        data['section_timings_ms'] = timings
+        data['unavailable_sections'] = unavailable
+        return data
@@ -0,0 +1,167 @@
+# store/analytics_cache.py
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from .analytics import AnalyticsService
+from .metrics import MetricsService
+
+
+class AnalyticsCache:
+    """
+    Stale-while-revalidate cache for the analytics dashboard
+
+    Each dashboard section is cached on its own with a TTL from
+    settings.ANALYTICS_CACHE_TTLS. Past its TTL a section is still served
+    while one background thread recomputes it; a lock key taken with
+    cache.add() makes sure only one recompute runs per section, however
+    many requests arrive. Locks are only shared across processes when the
+    cache backend is (Redis, Memcached, database).
+    """
+    KEY_PREFIX = 'analytics'
+    # Recompute lock; also how long a cold-cache request waits for another
+    # request's recompute before doing the work itself
+    LOCK_SECONDS = 30
+    POLL_SECONDS = 0.05
+
+    @staticmethod
+    def get_key(section, include_archived):
+        return f'{AnalyticsCache.KEY_PREFIX}:{section}:{int(include_archived)}'
+
+    @staticmethod
+    def get_ttl(section):
+        ttls = settings.ANALYTICS_CACHE_TTLS
+        return ttls.get(section, ttls['default'])
+
+    @staticmethod
+    def compute(key, section, compute):
+        """Run a section and store it; the caller must hold the lock"""
+        try:
+            now = timezone.now()
+            started = time.perf_counter()
+            data = compute()
+            entry = {
+                'data': data,
+                'computed_at': now,
+                'fresh_until': time.time() + AnalyticsCache.get_ttl(section),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+            }
+            cache.set(key, entry, timeout=settings.ANALYTICS_CACHE_MAX_STALE)
+            return entry
+        finally:
+            cache.delete(f'{key}:lock')
+
+    @staticmethod
+    def refresh_in_background(key, section, compute):
+        """Recompute a stale section in a thread, unless one already is"""
+        if not cache.add(f'{key}:lock', 1, timeout=AnalyticsCache.LOCK_SECONDS):
+            return
+
+        def run():
+            try:
+                AnalyticsCache.compute(key, section, compute)
+            finally:
+                # Threads get their own DB connection; don't leak it
+                connection.close()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    @staticmethod
+    def refresh_if_stale(key, section, compute, entry):
+        """Start a background recompute of a cached entry past its TTL; counts the lookup"""
+        if time.time() >= entry['fresh_until']:
+            MetricsService.inc('store_cache_requests_total', cache='analytics', section=section, result='stale')
+            AnalyticsCache.refresh_in_background(key, section, compute)
+        else:
+            MetricsService.inc('store_cache_requests_total', cache='analytics', section=section, result='hit')
+
+    @staticmethod
+    def get_section(section, compute, include_archived=False):
+        """Cached entry for one section: {'data', 'computed_at', 'fresh_until', 'duration_ms'}"""
+        key = AnalyticsCache.get_key(section, include_archived)
+        entry = cache.get(key)
+
+        if entry is not None:
+            AnalyticsCache.refresh_if_stale(key, section, compute, entry)
+            return entry
+
+        MetricsService.inc('store_cache_requests_total', cache='analytics', section=section, result='miss')
+        # Cold cache: one request computes, the rest wait for its result
+        deadline = time.monotonic() + AnalyticsCache.LOCK_SECONDS
+        while not cache.add(f'{key}:lock', 1, timeout=AnalyticsCache.LOCK_SECONDS):
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            if time.monotonic() >= deadline:
+                # The computing request died or hung; do it ourselves
+                break
+            time.sleep(AnalyticsCache.POLL_SECONDS)
+        else:
+            # Got the lock just as another request finished
+            entry = cache.get(key)
+            if entry is not None:
+                cache.delete(f'{key}:lock')
+                return entry
+
+        return AnalyticsCache.compute(key, section, compute)
+
+    @staticmethod
+    def get_dashboard(include_archived=False):
+        """
+        Dashboard data assembled from cached sections
+        Sections missing from the cache are computed concurrently, see
+        AnalyticsService.run_sections. computed_at is the time of the oldest
+        section in the response and section_timings_ms how long each one
+        took when it was computed.
+        """
+        sections = AnalyticsService.get_dashboard_sections(include_archived)
+        keys = {
+            section: AnalyticsCache.get_key(section, include_archived)
+            for section in sections
+        }
+        cached = cache.get_many(list(keys.values()))
+
+        entries = {}
+        cold = {}
+        for section, compute in sections.items():
+            entry = cached.get(keys[section])
+            if entry is None:
+                cold[section] = (
+                    lambda section=section, compute=compute:
+                    AnalyticsCache.get_section(section, compute, include_archived)
+                )
+                continue
+            AnalyticsCache.refresh_if_stale(keys[section], section, compute, entry)
+            entries[section] = entry
+
+        computed, _, unavailable = AnalyticsService.run_sections(cold)
+        entries.update(computed)
+
+        data = {}
+        computed_at = None
+        timings = {}
+        for section in sections:
+            entry = entries.get(section)
+            if entry is None:
+                continue
+            data.update(entry['data'])
+            timings[section] = entry.get('duration_ms')
+            if computed_at is None or entry['computed_at'] < computed_at:
+                computed_at = entry['computed_at']
+
+        data['computed_at'] = computed_at
+        data['section_timings_ms'] = timings
+        data['unavailable_sections'] = unavailable
+        return data
+
+    @staticmethod
+    def invalidate():
+        """Drop every cached section, e.g. after rebuilding the sales rollup"""
+        cache.delete_many([
+            AnalyticsCache.get_key(section, include_archived)
+            for section in AnalyticsService.get_dashboard_sections()
+            for include_archived in [False, True]
+        ])
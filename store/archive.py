@@ -0,0 +1,123 @@
+# store/archive.py
+from django.db import transaction
+from django.db.models import F
+from .models import (
+    Order,
+    OrderItem,
+    ArchivedOrder,
+    ArchivedOrderItem,
+    OutboxEmail,
+    StripeObjectLink,
+)
+
+
+class ArchiveService:
+    """
+    Service class for moving finished orders into the archive tables
+    """
+    ARCHIVABLE_STATUSES = ["delivered", "cancelled"]
+
+    # Columns copied verbatim, by attname (user_id, coupon_id, ...)
+    ORDER_FIELDS = [f.attname for f in Order._meta.concrete_fields]
+    ORDER_ITEM_FIELDS = [f.attname for f in OrderItem._meta.concrete_fields]
+
+    @staticmethod
+    def archivable_orders(cutoff):
+        """
+        Delivered or cancelled orders created before the cutoff
+        Orders referenced by a review stay hot so the review keeps its
+        verified-purchase link
+        """
+        return Order.objects.filter(
+            status__in=ArchiveService.ARCHIVABLE_STATUSES,
+            created_at__lt=cutoff,
+            reviews__isnull=True,
+        )
+
+    @staticmethod
+    def archive_batch(cutoff, batch_size=500):
+        """
+        Move one batch of orders (and their items) into the archive
+
+        Copy and delete happen in the same transaction, so an order is
+        always in exactly one of the two tables. Stripe session links and
+        outbox emails are repointed at the archived copy, which keeps the
+        id, so by-session lookups, late webhooks and email history still
+        find the order. Returns the number of orders moved; 0 means
+        nothing is left to archive.
+        """
+        with transaction.atomic():
+            order_ids = list(
+                ArchiveService.archivable_orders(cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not order_ids:
+                return 0
+
+            orders = Order.objects.filter(id__in=order_ids).values(
+                *ArchiveService.ORDER_FIELDS
+            )
+            ArchivedOrder.objects.bulk_create(
+                [ArchivedOrder(**row) for row in orders]
+            )
+
+            items = OrderItem.objects.filter(order_id__in=order_ids).values(
+                *ArchiveService.ORDER_ITEM_FIELDS
+            )
+            ArchivedOrderItem.objects.bulk_create(
+                [ArchivedOrderItem(**row) for row in items],
+                batch_size=1000,
+            )
+
+            for model in (StripeObjectLink, OutboxEmail):
+                model.objects.filter(order_id__in=order_ids).update(
+                    archived_order_id=F("order_id"), order=None
+                )
+
+            OrderItem.objects.filter(order_id__in=order_ids).delete()
+            Order.objects.filter(id__in=order_ids).delete()
+
+        return len(order_ids)
+
+
+class ChainedQuerySet:
+    """
+    Read-only, sliceable view over several querysets, one after another
+    Lets DRF pagination page through live orders followed by archived
+    ones without loading either table into memory
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def _get_counts(self):
+        if self._counts is None:
+            self._counts = [qs.count() for qs in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self._get_counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        for queryset in self.querysets:
+            yield from queryset
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop, _ = index.indices(self.count())
+        results = []
+        offset = 0
+        for queryset, count in zip(self.querysets, self._get_counts()):
+            if start < offset + count and stop > offset:
+                results.extend(
+                    queryset[max(start - offset, 0):min(stop - offset, count)]
+                )
+            offset += count
+        return results
@@ -0,0 +1,91 @@
+# store/benchmarking.py
+import logging
+import os
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize_latencies(seconds):
+    """p50/p95/p99/max of a list of durations, in milliseconds"""
+    return {
+        'count': len(seconds),
+        'p50_ms': round(percentile(seconds, 50) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 99) * 1000, 3),
+        'max_ms': round(max(seconds) * 1000, 3) if seconds else 0,
+    }
+
+
+def git_commit():
+    """Current commit hash, so results can be lined up with history"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def quiet_logs(name):
+    """Silence a logger's info lines for the block; warnings still log"""
+    logger = logging.getLogger(name)
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+def quiet_request_logs():
+    """Silence the per-request lines of the store.performance logger; slow requests still log"""
+    return quiet_logs('store.performance')
+
+
+@contextmanager
+def throwaway_database(test_environment=True):
+    """
+    Run the block against a freshly migrated test database
+
+    Benchmarks use this so they never touch real data. SQLite gets a
+    temporary file instead of the shared in-memory database so several
+    threads can write to it at once. test_environment=False skips
+    Django's test instrumentation (locmem email, template render
+    signals) for benchmarks that time rendering itself.
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    temp_path = None
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        fd, temp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        test_settings['NAME'] = temp_path
+
+    if test_environment:
+        setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if test_environment:
+            teardown_test_environment()
+        if temp_path:
+            test_settings.pop('NAME', None)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
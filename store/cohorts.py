@@ -0,0 +1,186 @@
+# store/cohorts.py
+from datetime import date
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+from .models import Order, ArchivedOrder, CustomerCohort
+
+
+class CohortService:
+    """
+    Service class for customer cohort, retention and lifetime value analytics
+    Customers are registered users (checkout requires an account) and
+    belong to the cohort of the month of their first completed order
+    """
+    CHUNK_SIZE = 50000
+
+    @staticmethod
+    def month_index(value):
+        """Months since year 0, so month arithmetic is integer arithmetic"""
+        return value.year * 12 + value.month - 1
+
+    @staticmethod
+    def month_start(index):
+        return date(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def get_completed_orders(order_model):
+        return order_model.objects.filter(payment_status='completed', user__isnull=False)
+
+    @staticmethod
+    def get_month_range():
+        """First and last month index with a completed order, or None"""
+        bounds = []
+        for order_model in [Order, ArchivedOrder]:
+            row = CohortService.get_completed_orders(order_model).aggregate(
+                first=Min('created_at'), last=Max('created_at')
+            )
+            if row['first']:
+                bounds.extend([row['first'], row['last']])
+        if not bounds:
+            return None
+
+        months = [CohortService.month_index(timezone.localtime(value)) for value in bounds]
+        return min(months), max(months)
+
+    @staticmethod
+    def get_order_rows():
+        """
+        (user_id, month index, total) for every completed order, live and
+        archived, ordered by customer so each customer's orders are adjacent
+        """
+        querysets = [
+            CohortService.get_completed_orders(order_model)
+            .annotate(month=ExtractYear('created_at') * 12 + ExtractMonth('created_at') - 1)
+            .values_list('user_id', 'month', 'total')
+            .order_by()
+            for order_model in [Order, ArchivedOrder]
+        ]
+        return querysets[0].union(querysets[1], all=True).order_by('user_id')
+
+    @staticmethod
+    def build(chunk_size=None):
+        """
+        Recompute every cohort and replace the stored ones
+
+        Orders are streamed from the database in chunks and turned into
+        (user, month, total) arrays. Memory is bounded by the chunk size
+        and the cohort matrices (months x months), not by the number of
+        orders. Returns the number of cohorts stored.
+        """
+        chunk_size = chunk_size or CohortService.CHUNK_SIZE
+        month_range = CohortService.get_month_range()
+        if month_range is None:
+            CustomerCohort.objects.all().delete()
+            return 0
+
+        first_month, last_month = month_range
+        size = last_month - first_month + 1
+
+        # Per cohort, and per (cohort, months since cohort month)
+        customers = np.zeros(size, dtype=np.int64)
+        repeat_customers = np.zeros(size, dtype=np.int64)
+        active = np.zeros((size, size), dtype=np.int64)
+        orders = np.zeros((size, size), dtype=np.int64)
+        revenue = np.zeros((size, size))
+
+        def add_customers(rows):
+            """Accumulate rows holding every order of the customers in them"""
+            users = rows[:, 0].astype(np.int64)
+            months = rows[:, 1].astype(np.int64) - first_month
+
+            starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+            counts = np.diff(np.r_[starts, len(users)])
+            cohorts = np.minimum.reduceat(months, starts)
+            row_cohorts = np.repeat(cohorts, counts)
+            offsets = months - row_cohorts
+
+            np.add.at(customers, cohorts, 1)
+            np.add.at(repeat_customers, cohorts[counts > 1], 1)
+            np.add.at(orders, (row_cohorts, offsets), 1)
+            np.add.at(revenue, (row_cohorts, offsets), rows[:, 2])
+
+            # A customer counts as active once per month, however many orders
+            pairs = np.unique(np.stack([users, months, row_cohorts]), axis=1)
+            np.add.at(active, (pairs[2], pairs[1] - pairs[2]), 1)
+
+        rows = CohortService.get_order_rows().iterator(chunk_size=chunk_size)
+        carry = np.empty((0, 3))
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                if len(carry):
+                    add_customers(carry)
+                break
+
+            data = np.vstack([carry, np.array(chunk, dtype=np.float64)])
+            # The last customer's orders may continue in the next chunk
+            split = np.searchsorted(data[:, 0], data[-1, 0])
+            if split:
+                add_customers(data[:split])
+            carry = data[split:]
+
+        now = timezone.now()
+        cohorts = [
+            CustomerCohort(
+                cohort_month=CohortService.month_start(first_month + i),
+                customers=int(customers[i]),
+                repeat_customers=int(repeat_customers[i]),
+                active_customers=active[i, :size - i].tolist(),
+                orders=orders[i, :size - i].tolist(),
+                revenue=np.round(revenue[i, :size - i], 2).tolist(),
+                computed_at=now,
+            )
+            for i in range(size)
+            if customers[i]
+        ]
+        with transaction.atomic():
+            CustomerCohort.objects.all().delete()
+            CustomerCohort.objects.bulk_create(cohorts)
+
+        return len(cohorts)
+
+    @staticmethod
+    def get_report():
+        """Stored cohorts with retention rates and cumulative lifetime value"""
+        cohorts = list(CustomerCohort.objects.all())
+        if not cohorts:
+            return {
+                'computed_at': None,
+                'customers': 0,
+                'repeat_purchase_rate': 0,
+                'average_lifetime_value': 0,
+                'cohorts': [],
+            }
+
+        total_customers = sum(cohort.customers for cohort in cohorts)
+        total_repeat = sum(cohort.repeat_customers for cohort in cohorts)
+        total_revenue = sum(sum(cohort.revenue) for cohort in cohorts)
+
+        report = []
+        for cohort in cohorts:
+            size = cohort.customers
+            report.append({
+                'cohort': cohort.cohort_month.strftime('%Y-%m'),
+                'customers': size,
+                'repeat_customers': cohort.repeat_customers,
+                'repeat_purchase_rate': round(cohort.repeat_customers / size, 4),
+                # Share of the cohort ordering N months after joining
+                'retention': np.round(np.array(cohort.active_customers) / size, 4).tolist(),
+                'orders': cohort.orders,
+                'revenue': cohort.revenue,
+                # Revenue per customer to date, N months after joining
+                'lifetime_value': np.round(np.cumsum(cohort.revenue) / size, 2).tolist(),
+            })
+
+        return {
+            'computed_at': cohorts[0].computed_at,
+            'customers': total_customers,
+            'repeat_purchase_rate': round(total_repeat / total_customers, 4),
+            'average_lifetime_value': round(total_revenue / total_customers, 2),
+            'cohorts': report,
+        }
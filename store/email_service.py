@@ -1,133 +1,278 @@
-from django.core.mail import send_mail, EmailMultiAlternatives
-from django.template.loader import render_to_string
+import time
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template import engines
 from django.conf import settings
-from django.utils.html import strip_tags
+from django.utils import timezone
+from .instrumentation import timed
+from .metrics import MetricsService
+from .models import OutboxEmail, Product
 
 class EmailService:
     """
     Service class for sending emails
+    The send_* methods queue messages in the outbox; the send_outbox
+    worker renders them and delivers over one reused SMTP connection
     """
+    MAX_ATTEMPTS = 5
+    BASE_BACKOFF_SECONDS = 60
+    MAX_BACKOFF_SECONDS = 3600
+    # A claimed message is retried if its worker dies before finishing
+    LEASE_SECONDS = 300
+
+    @staticmethod
+    def queue(message_type, recipient, order=None, context=None):
+        """
+        Add a message to the outbox
+        Called inside the caller's transaction, so the email is only sent
+        if the change that triggered it commits
+        """
+        OutboxEmail.objects.create(
+            message_type=message_type,
+            recipient=recipient,
+            order=order,
+            context=context or {},
+        )
+        return True
+
+    @staticmethod
+    def queue_many(message_type, recipients):
+        """
+        Add one message per (order_id, recipient) pair to the outbox, in a
+        single INSERT
+        """
+        OutboxEmail.objects.bulk_create([
+            OutboxEmail(
+                message_type=message_type,
+                recipient=recipient,
+                order_id=order_id,
+            )
+            for order_id, recipient in recipients
+        ])
+        return len(recipients)
+
     @staticmethod
     def send_order_confirmation(order):
         """
         Send order confirmation email to customer
         """
+        return EmailService.queue("order_confirmation", order.email, order=order)
+
+    @staticmethod
+    def send_shipping_notification(order):
+        """
+        Send shipping notification emailto customer
+        """
+        return EmailService.queue("shipping_notification", order.email, order=order)
+
+    @staticmethod
+    def send_order_delivered_notification(order):
+        """
+        Send delivery confirmation email to customer
+        """
+        return EmailService.queue("order_delivered", order.email, order=order)
+
+    @staticmethod
+    def send_low_stock_alert(products):
+        """
+        Send low stock alert email to admin
+        """
+        # Send to admin email
+        admin_email = settings.EMAIL_HOST_USER
+
+        return EmailService.queue(
+            "low_stock_alert",
+            admin_email,
+            context={"product_ids": [product.id for product in products]},
+        )
+
+    @staticmethod
+    def render_template(name, context):
+        """
+        Render the HTML and plain-text versions of an email template
+        Both come from the cached "emails" template engine, so each
+        template is parsed once per process
+        """
+        engine = engines["emails"]
+        html_message = engine.get_template(f"emails/{name}.html").render(context)
+        plain_message = engine.get_template(f"emails/{name}.txt").render(context)
+        return html_message, plain_message
+
+    @staticmethod
+    def render_order_confirmation(email):
+        order = email.linked_order
         subject = f"Order Confirmation - {order.order_number}"
 
+        # Prices are formatted here once; localizing every Decimal inside
+        # the item loop dominated render time for large orders
+        items = [
+            {
+                "product_name": item.product_name,
+                "quantity": str(item.quantity),
+                "product_price": str(item.product_price),
+                "total_price": str(item.total_price),
+            }
+            for item in order.items.all()
+        ]
+
         # Context for email template
         context = {
             "order": order,
-            "items": order.items.all(),
+            "items": items,
             "customer_name": f"{order.first_name} {order.last_name}",
         }
-
-        # Render HTML email
-        html_message = render_to_string("emails/order_confirmation.html", context)
-        plain_message = strip_tags(html_message)
-
-        try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[order.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            print(f"✅ Order confirmation email sent to {order.email}")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
-            return False
+        return subject, EmailService.render_template("order_confirmation", context)
 
     @staticmethod
-    def send_shipping_notification(order):
-        """
-        Send shipping notification emailto customer
-        """
+    def render_shipping_notification(email):
+        order = email.linked_order
         subject = f"Your Order Has Shipped = {order.order_number}"
 
         context = {
             "order": order,
             "customer_name": f"{order.first_name} {order.last_name}",
         }
-
-        html_message = render_to_string("emails/shipping_notification.html", context)
-        plain_message = strip_tags(html_message)
-
-        try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[order.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            print(f"✅ Shipping notification sent to {order.email}")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
-            return False
+        return subject, EmailService.render_template("shipping_notification", context)
 
     @staticmethod
-    def send_order_delivered_notification(order):
-        """
-        Send delivery confirmation email to customer
-        """
+    def render_order_delivered(email):
+        order = email.linked_order
         subject = f'Your Order Has Been Delivered - {order.order_number}'
-        
+
         context = {
             "order": order,
             "customer_name": f"{order.first_name} {order.last_name}",
         }
-        
-        html_message = render_to_string("emails/order_delivered.html", context)
-        plain_message = strip_tags(html_message)
+        return subject, EmailService.render_template("order_delivered", context)
 
-        try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[order.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            print(f"✅ Delivery notification sent to {order.email}")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
-            return False
-        
     @staticmethod
-    def send_low_stock_alert(products):
-        """
-        Send low stock alert email to admin
-        """
+    def render_low_stock_alert(email):
+        products = Product.objects.filter(
+            id__in=email.context.get("product_ids", [])
+        ).select_related("category")
         subject = f"Low Stock Alert - {len(products)} Products"
 
         context = {
             "products": products,
         }
+        return subject, EmailService.render_template("low_stock_alert", context)
+
+    @staticmethod
+    def build_message(email, connection=None):
+        """Render a queued email into a multipart message"""
+        renderers = {
+            "order_confirmation": EmailService.render_order_confirmation,
+            "shipping_notification": EmailService.render_shipping_notification,
+            "order_delivered": EmailService.render_order_delivered,
+            "low_stock_alert": EmailService.render_low_stock_alert,
+        }
+        subject, (html_message, plain_message) = renderers[email.message_type](email)
+
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email.recipient],
+            connection=connection,
+        )
+        message.attach_alternative(html_message, "text/html")
+        return message
+
+    @staticmethod
+    def get_backoff(attempts):
+        """Exponential backoff between retries, capped"""
+        return timedelta(seconds=min(
+            EmailService.BASE_BACKOFF_SECONDS * 2 ** (attempts - 1),
+            EmailService.MAX_BACKOFF_SECONDS,
+        ))
+
+    @staticmethod
+    def claim_batch(batch_size):
+        """Lease a batch of due messages to this worker, oldest first"""
+        now = timezone.now()
+        due_ids = list(
+            OutboxEmail.objects.filter(
+                status__in=["pending", "sending"],
+                next_attempt_at__lte=now,
+            ).order_by("created_at").values_list("id", flat=True)[:batch_size]
+        )
+
+        claimed = []
+        for email_id in due_ids:
+            if OutboxEmail.objects.filter(
+                id=email_id,
+                status__in=["pending", "sending"],
+                next_attempt_at__lte=now,
+            ).update(
+                status="sending",
+                next_attempt_at=now + timedelta(seconds=EmailService.LEASE_SECONDS),
+            ):
+                claimed.append(email_id)
+
+        # Orders and their items for the whole batch in one go
+        return list(
+            OutboxEmail.objects.filter(id__in=claimed)
+            .select_related("order", "archived_order")
+            .prefetch_related("order__items", "archived_order__items")
+            .order_by("created_at")
+        )
+
+    @staticmethod
+    def send_batch(batch_size=100, rate_per_second=None):
+        """
+        Render and send one batch of queued messages over a single
+        connection, at most rate_per_second messages per second
+        Returns (sent, failed) counts for the batch
+        """
+        emails = EmailService.claim_batch(batch_size)
+        if not emails:
+            return 0, 0
+
+        interval = 1 / rate_per_second if rate_per_second else 0
+        connection = get_connection(fail_silently=False)
+        needs_open = True
+        sent = failed = 0
+        last_send = 0
 
-        html_message = render_to_string("emails/low_stock_alert.html", context)
-        plain_message = strip_tags(html_message)
-        
-        # Send to admin email
-        admin_email = settings.EMAIL_HOST_USER
-        
         try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[admin_email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            print(f"✅ Low stock alert sent to admin")
-            return True
-        except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
-            return False
+            for email in emails:
+                wait = last_send + interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                last_send = time.monotonic()
+
+                try:
+                    if needs_open:
+                        connection.open()
+                        needs_open = False
+                    message = EmailService.build_message(email, connection=connection)
+                    with timed("email"):
+                        connection.send_messages([message])
+                except Exception as e:
+                    email.attempts += 1
+                    email.last_error = str(e)
+                    if email.attempts >= EmailService.MAX_ATTEMPTS:
+                        # Dead letter: left for a human in the admin
+                        email.status = "dead"
+                    else:
+                        email.status = "pending"
+                        email.next_attempt_at = timezone.now() + EmailService.get_backoff(email.attempts)
+                    email.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+                    MetricsService.inc("store_emails_total", message_type=email.message_type, result="failed")
+                    failed += 1
+
+                    # The connection may be dead; start the next message on a fresh one
+                    connection.close()
+                    needs_open = True
+                    continue
+
+                email.status = "sent"
+                email.sent_at = timezone.now()
+                email.save(update_fields=["status", "sent_at"])
+                MetricsService.inc("store_emails_total", message_type=email.message_type, result="sent")
+                sent += 1
+        finally:
+            connection.close()
+
+        return sent, failed
@@ -0,0 +1,157 @@
+# store/exports.py
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+class LineBuffer:
+    """File-like object whose write() hands the formatted line back"""
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+    """
+    Service class for streaming order exports
+    Rows are read with values_list().iterator(), so no model instances
+    are built and memory stays flat however large the range is
+    """
+    FORMATS = ['csv', 'jsonl']
+    CHUNK_SIZE = 2000
+
+    ORDER_COLUMNS = [
+        ('id', 'id'),
+        ('order_number', 'order_number'),
+        ('created_at', 'created_at'),
+        ('status', 'status'),
+        ('payment_status', 'payment_status'),
+        ('user_id', 'user_id'),
+        ('email', 'email'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('city', 'city'),
+        ('state', 'state'),
+        ('postal_code', 'postal_code'),
+        ('country', 'country'),
+        ('coupon', 'coupon__code'),
+        ('subtotal', 'subtotal'),
+        ('discount_amount', 'discount_amount'),
+        ('shipping_cost', 'shipping_cost'),
+        ('tax', 'tax'),
+        ('total', 'total'),
+        ('carrier', 'carrier'),
+        ('tracking_number', 'tracking_number'),
+        ('shipped_at', 'shipped_at'),
+        ('delivered_at', 'delivered_at'),
+    ]
+
+    LINE_COLUMNS = [
+        ('order_id', 'order_id'),
+        ('order_number', 'order__order_number'),
+        ('order_created_at', 'order__created_at'),
+        ('order_status', 'order__status'),
+        ('payment_status', 'order__payment_status'),
+        ('product_id', 'product_id'),
+        ('product_name', 'product_name'),
+        ('product_price', 'product_price'),
+        ('quantity', 'quantity'),
+        ('line_total', 'line_total'),
+    ]
+
+    @staticmethod
+    def get_columns(lines=False):
+        return ExportService.LINE_COLUMNS if lines else ExportService.ORDER_COLUMNS
+
+    @staticmethod
+    def get_querysets(start=None, end=None, statuses=None, payment_statuses=None,
+                      lines=False, include_archived=False):
+        """Filtered order (or order line) querysets, live table first"""
+        filters = {}
+        if start:
+            filters['created_at__gte'] = timezone.make_aware(datetime.combine(start, time.min))
+        if end:
+            filters['created_at__lt'] = timezone.make_aware(
+                datetime.combine(end + timedelta(days=1), time.min)
+            )
+        if statuses:
+            filters['status__in'] = statuses
+        if payment_statuses:
+            filters['payment_status__in'] = payment_statuses
+
+        models = [(Order, OrderItem)]
+        if include_archived:
+            models.append((ArchivedOrder, ArchivedOrderItem))
+
+        fields = [field for _, field in ExportService.get_columns(lines)]
+        querysets = []
+        for order_model, item_model in models:
+            if lines:
+                queryset = item_model.objects.filter(
+                    **{f'order__{key}': value for key, value in filters.items()}
+                ).annotate(
+                    line_total=F('quantity') * F('product_price')
+                ).order_by('order_id', 'id')
+            else:
+                queryset = order_model.objects.filter(**filters).order_by('id')
+            querysets.append(queryset.values_list(*fields))
+        return querysets
+
+    @staticmethod
+    def iter_rows(querysets, chunk_size=None):
+        chunk_size = chunk_size or ExportService.CHUNK_SIZE
+        for queryset in querysets:
+            yield from queryset.iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def format_value(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def stream(output='csv', chunk_size=None, **filters):
+        """
+        The export as an iterator of text chunks of chunk_size lines
+        Raises ValueError for an unknown output format up front, before
+        anything is streamed
+        """
+        if output not in ExportService.FORMATS:
+            raise ValueError(f"output must be one of {', '.join(ExportService.FORMATS)}")
+        for name, choices in [
+            ('statuses', Order.STATUS_CHOICES),
+            ('payment_statuses', Order.PAYMENT_STATUS_CHOICES),
+        ]:
+            unknown = set(filters.get(name) or []) - {value for value, _ in choices}
+            if unknown:
+                raise ValueError(f"Unknown {name.replace('_', ' ')[:-2]}: {', '.join(sorted(unknown))}")
+        return ExportService.iter_chunks(output, chunk_size or ExportService.CHUNK_SIZE, filters)
+
+    @staticmethod
+    def iter_chunks(output, chunk_size, filters):
+        columns = [name for name, _ in ExportService.get_columns(filters.get('lines', False))]
+        rows = ExportService.iter_rows(ExportService.get_querysets(**filters), chunk_size)
+        format_value = ExportService.format_value
+
+        if output == 'csv':
+            writer = csv.writer(LineBuffer())
+            format_row = lambda row: writer.writerow([format_value(value) for value in row])
+            yield writer.writerow(columns)
+        else:
+            format_row = lambda row: json.dumps(
+                dict(zip(columns, (format_value(value) for value in row))),
+                default=str,
+            ) + '\n'
+
+        lines = []
+        for row in rows:
+            lines.append(format_row(row))
+            if len(lines) >= chunk_size:
+                yield ''.join(lines)
+                lines = []
+        if lines:
+            yield ''.join(lines)
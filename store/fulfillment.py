@@ -0,0 +1,65 @@
+# store/fulfillment.py
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .email_service import EmailService
+from .models import Order
+
+
+class FulfillmentService:
+    """
+    Service class for moving orders through shipping and delivery in bulk
+    """
+    BATCH_SIZE = 500
+
+    # status -> (timestamp field, notification message type)
+    TRANSITIONS = {
+        'shipped': ('shipped_at', 'shipping_notification'),
+        'delivered': ('delivered_at', 'order_delivered'),
+    }
+
+    @staticmethod
+    def transition(queryset, status, batch_size=None, progress=None):
+        """
+        Move the selected orders to status with set-based UPDATEs
+
+        Each batch locks the orders not already in status, updates them in
+        one UPDATE (Coalesce keeps an existing shipped_at/delivered_at) and
+        queues their notifications with one INSERT, so nothing is emailed
+        inside the request. Orders already in status are skipped and get
+        no second email. progress(done, total) is called after each batch.
+        Returns (updated, skipped) counts.
+        """
+        timestamp_field, message_type = FulfillmentService.TRANSITIONS[status]
+        batch_size = batch_size or FulfillmentService.BATCH_SIZE
+
+        order_ids = list(queryset.order_by().values_list('id', flat=True))
+        updated = skipped = 0
+
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start:start + batch_size]
+
+            with transaction.atomic():
+                pending = list(
+                    Order.objects.select_for_update()
+                    .filter(id__in=batch)
+                    .exclude(status=status)
+                    .order_by()
+                    .values_list('id', 'email')
+                )
+                if pending:
+                    now = timezone.now()
+                    Order.objects.filter(id__in=[order_id for order_id, _ in pending]).update(**{
+                        'status': status,
+                        timestamp_field: Coalesce(timestamp_field, Value(now)),
+                        'updated_at': now,
+                    })
+                    EmailService.queue_many(message_type, pending)
+
+            updated += len(pending)
+            skipped += len(batch) - len(pending)
+            if progress:
+                progress(start + len(batch), len(order_ids))
+
+        return updated, skipped
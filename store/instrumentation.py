@@ -0,0 +1,161 @@
+# store/instrumentation.py
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from .metrics import MetricsService
+
+logger = logging.getLogger('store.performance')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Where one request's time went; filled in while the request runs"""
+
+    # Server-Timing metric names, in header order
+    PHASES = {
+        'serialize': 'ser',
+        'stripe': 'stripe',
+        'email': 'email',
+    }
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+        self.phases = Counter()
+        # Nesting depth of timed() per phase, so nested serializers count once
+        self.depth = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: count and time every query"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.db_queries += 1
+            self.statements[sql] += 1
+
+    def repeated_statements(self, limit=5):
+        """The most repeated SQL (parameters are separate, so N+1s group together)"""
+        return [
+            {'count': count, 'sql': sql}
+            for sql, count in self.statements.most_common(limit)
+            if count > 1
+        ]
+
+    def server_timing(self, total_seconds):
+        """The Server-Timing header value"""
+        entries = [
+            f'total;dur={total_seconds * 1000:.1f}',
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+        ]
+        for phase, name in self.PHASES.items():
+            if phase in self.phases:
+                entries.append(f'{name};dur={self.phases[phase] * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def current_metrics():
+    """The metrics of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the block's duration to a phase of the current request
+    Free outside a request; nested blocks of one phase count once
+    """
+    metrics = _current.get()
+    if metrics is None or metrics.depth[phase]:
+        yield
+        return
+    metrics.depth[phase] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] += time.perf_counter() - started
+        metrics.depth[phase] -= 1
+
+
+class TimedSerializerMixin:
+    """Counts to_representation towards the current request's serializer time"""
+
+    def to_representation(self, instance):
+        # Runs once per object: skip the context manager outside requests
+        if _current.get() is None:
+            return super().to_representation(instance)
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class PerformanceMiddleware:
+    """
+    Times every request: total, database queries and time, serializer time
+    and external calls (Stripe, SMTP)
+
+    Each request is logged as one JSON line on the store.performance
+    logger; requests over PERFORMANCE_SLOW_REQUEST_MS are logged again as
+    a warning with their most repeated SQL. The Server-Timing header is
+    sent when PERFORMANCE_SERVER_TIMING is on, and always to staff.
+    Only queries on this request's thread are counted. Latency and query
+    counts also go to the Prometheus metrics, per view and method.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - metrics.started
+
+        user = getattr(request, 'user', None)
+        if settings.PERFORMANCE_SERVER_TIMING or (user is not None and user.is_staff):
+            response['Server-Timing'] = metrics.server_timing(total)
+
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label, so scanners can't blow up the series
+        view = match.view_name if match else 'unmatched'
+        MetricsService.inc(
+            'store_http_requests_total', view=view, method=request.method, status=str(response.status_code)
+        )
+        MetricsService.observe('store_http_request_duration_seconds', total, view=view, method=request.method)
+        MetricsService.observe('store_http_request_db_queries', metrics.db_queries, view=view, method=request.method)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_queries': metrics.db_queries,
+            'db_ms': round(metrics.db_seconds * 1000, 1),
+            **{
+                f'{phase}_ms': round(metrics.phases[phase] * 1000, 1)
+                for phase in RequestMetrics.PHASES
+            },
+        }
+        logger.info(json.dumps(record))
+        if total * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS:
+            logger.warning(json.dumps({
+                **record,
+                'slow': True,
+                'repeated_sql': metrics.repeated_statements(),
+            }))
+        return response
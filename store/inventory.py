@@ -0,0 +1,66 @@
+# store/inventory.py
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import Order, OrderItem, Product
+
+
+class InventoryService:
+    """
+    Service class for returning reserved stock to the shelf
+    """
+
+    @staticmethod
+    def stale_pending_orders(cutoff):
+        """Unpaid orders created before the cutoff (uses the payment_status/created_at index)"""
+        return Order.objects.filter(
+            payment_status='pending',
+            created_at__lt=cutoff,
+        )
+
+    @staticmethod
+    def release_orders(order_ids):
+        """
+        Cancel still-pending orders and put their items back in stock
+
+        Orders that were paid or released in the meantime are skipped, so
+        running this twice (or racing the Stripe webhook) never restores
+        the same stock twice. Stock goes back with one UPDATE per distinct
+        quantity instead of a save() per item. Returns the number of
+        orders released.
+        """
+        with transaction.atomic():
+            claimed_ids = list(
+                Order.objects.select_for_update()
+                .filter(id__in=order_ids, payment_status='pending')
+                .values_list('id', flat=True)
+            )
+            if not claimed_ids:
+                return 0
+
+            Order.objects.filter(id__in=claimed_ids).update(
+                payment_status='failed',
+                status='cancelled',
+                updated_at=timezone.now(),
+            )
+
+            quantities = (
+                OrderItem.objects.filter(order_id__in=claimed_ids, product__isnull=False)
+                .values('product_id')
+                .annotate(quantity=Sum('quantity'))
+                .order_by()
+            )
+
+            # Products that get the same increment share one UPDATE
+            products_by_quantity = defaultdict(list)
+            for row in quantities:
+                products_by_quantity[row['quantity']].append(row['product_id'])
+
+            for quantity, product_ids in products_by_quantity.items():
+                Product.objects.filter(id__in=product_ids).update(
+                    stock=F('stock') + quantity
+                )
+
+        return len(claimed_ids)
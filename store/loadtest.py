@@ -0,0 +1,310 @@
+# store/loadtest.py
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import stripe
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.settings import api_settings
+from .benchmarking import percentile, quiet_request_logs, summarize_latencies
+from .models import Category, Product, Coupon
+
+LOADTEST_COUPON = 'LOADTEST10'
+LOADTEST_STOCK = 100000
+
+# How often each journey is picked
+JOURNEY_WEIGHTS = {
+    'browse_products': 35,
+    'view_product': 30,
+    'add_to_cart': 12,
+    'apply_coupon': 6,
+    'create_order': 8,
+    'view_orders': 9,
+}
+
+# Default budgets per endpoint; '*' applies to every endpoint. Query budgets
+# hold the current query counts (including the session and user lookups)
+# plus one, so a regression fails the run; tighten them as endpoints get
+# faster. No endpoint's queries grow with the cart or the reviews any more
+# (QueryBudgetTests keeps it that way), so all are budgeted on the maximum;
+# add_item and create_order vary by a few queries with a new cart or a
+# coupon. Latency budgets are deliberately loose: they depend on the machine.
+DEFAULT_BUDGETS = {
+    '*': {'p95_ms': 500, 'error_rate': 0.01},
+    'GET /api/categories/': {'max_queries': 5},
+    'GET /api/products/': {'max_queries': 5},
+    'GET /api/products/?category=': {'max_queries': 5},
+    'GET /api/products/{slug}/': {'max_queries': 4},
+    'GET /api/products/{slug}/reviews/': {'max_queries': 6},
+    'POST /api/cart/add_item/': {'max_queries': 14},
+    'GET /api/cart/current/': {'max_queries': 6},
+    'POST /api/cart/apply_coupon/': {'max_queries': 7},
+    'POST /api/cart/create_order/': {'max_queries': 17},
+    'GET /api/orders/': {'max_queries': 6},
+    'GET /api/orders/{id}/': {'max_queries': 5},
+}
+
+SHIPPING_ADDRESS = {
+    'first_name': 'Load',
+    'last_name': 'Test',
+    'address_line1': '1 Calle Luna',
+    'city': 'San Juan',
+    'state': 'PR',
+    'postal_code': '00901',
+    'country': 'US',
+    'phone': '787-555-0100',
+}
+
+
+def fake_checkout_session(**kwargs):
+    """Stands in for stripe.checkout.Session.create; no network"""
+    session_id = f"cs_loadtest_{kwargs['client_reference_id']}_{kwargs['idempotency_key'][:8]}"
+    return SimpleNamespace(id=session_id, url=f'https://checkout.stripe.test/{session_id}')
+
+
+def prepare_store():
+    """
+    A coupon every cart can use and enough stock for every checkout, so the
+    journeys measure the success paths
+    """
+    Product.objects.filter(stock__lt=LOADTEST_STOCK).update(stock=LOADTEST_STOCK)
+    today = timezone.localdate()
+    Coupon.objects.update_or_create(
+        code=LOADTEST_COUPON,
+        defaults={
+            'description': 'Load test coupon',
+            'discount_type': 'percentage',
+            'discount_value': Decimal('10'),
+            'valid_from': today - timedelta(days=1),
+            'valid_until': today + timedelta(days=365),
+            'max_uses': 10 ** 9,
+            'is_active': True,
+        },
+    )
+
+
+class Session:
+    """
+    One virtual shopper: a test client that times every request and
+    counts the queries it runs
+    """
+
+    def __init__(self, samples):
+        self.client = Client()
+        self.samples = samples
+        self.user = None
+
+    def login(self, user):
+        self.client.force_login(user)
+        self.user = user
+
+    def request(self, endpoint, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(path, data)
+            else:
+                response = self.client.post(path, data or {}, content_type='application/json')
+            elapsed = time.perf_counter() - started
+
+        sample = self.samples[endpoint]
+        sample['latencies'].append(elapsed)
+        sample['queries'].append(len(queries))
+        sample['statuses'][response.status_code] += 1
+        return response
+
+
+class Journeys:
+    """The user journeys the load test mixes, sharing one catalogue"""
+
+    def __init__(self, rng, products, categories):
+        self.rng = rng
+        self.products = products
+        self.categories = categories
+        # Zipf popularity, like real traffic
+        self.weights = [1 / rank ** 1.1 for rank in range(1, len(products) + 1)]
+        # The product list is paginated over the same available products;
+        # pages past the last one are 404s, not load
+        self.pages = max(math.ceil(len(products) / api_settings.PAGE_SIZE), 1)
+
+    def pick_product(self):
+        return self.rng.choices(self.products, weights=self.weights)[0]
+
+    def browse_products(self, session):
+        session.request('GET /api/categories/', 'GET', '/api/categories/')
+        page = min(int(self.rng.expovariate(0.7)) + 1, 5, self.pages)
+        session.request('GET /api/products/', 'GET', '/api/products/', {'page': page})
+        session.request(
+            'GET /api/products/?category=', 'GET', '/api/products/',
+            {'category': self.rng.choice(self.categories)},
+        )
+
+    def view_product(self, session):
+        product_id, slug = self.pick_product()
+        session.request('GET /api/products/{slug}/', 'GET', f'/api/products/{slug}/')
+        if self.rng.random() < 0.5:
+            session.request(
+                'GET /api/products/{slug}/reviews/', 'GET', f'/api/products/{slug}/reviews/'
+            )
+        return product_id
+
+    def add_to_cart(self, session):
+        product_id = self.view_product(session)
+        session.request(
+            'POST /api/cart/add_item/', 'POST', '/api/cart/add_item/',
+            {'product_id': product_id, 'quantity': self.rng.choice([1, 1, 1, 2])},
+        )
+        session.request('GET /api/cart/current/', 'GET', '/api/cart/current/')
+
+    def apply_coupon(self, session):
+        self.add_to_cart(session)
+        session.request(
+            'POST /api/cart/apply_coupon/', 'POST', '/api/cart/apply_coupon/',
+            {'code': LOADTEST_COUPON},
+        )
+
+    def create_order(self, session):
+        for _ in range(self.rng.randint(1, 3)):
+            self.add_to_cart(session)
+        data = {**SHIPPING_ADDRESS, 'email': session.user.email or 'loadtest@example.com'}
+        if self.rng.random() < 0.3:
+            data['coupon_code'] = LOADTEST_COUPON
+        session.request('POST /api/cart/create_order/', 'POST', '/api/cart/create_order/', data)
+
+    def view_orders(self, session):
+        response = session.request('GET /api/orders/', 'GET', '/api/orders/')
+        results = response.json().get('results', []) if response.status_code == 200 else []
+        if results:
+            order_id = self.rng.choice(results)['id']
+            session.request('GET /api/orders/{id}/', 'GET', f'/api/orders/{order_id}/')
+
+
+def run_worker(worker, config):
+    """
+    Run one worker's share of the journeys in this process
+    Returns raw samples per endpoint, so percentiles can be computed over
+    every worker together
+    """
+    # Forked from the parent: never share its database connection
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+
+    rng = random.Random(config['seed'] * 1000 + worker)
+    products = list(
+        Product.objects.filter(is_available=True).order_by('id').values_list('id', 'slug')
+    )
+    rng.shuffle(products)
+    categories = list(Category.objects.values_list('slug', flat=True))
+    # Workers use disjoint customers so their carts never collide
+    user_ids = list(
+        User.objects.filter(is_staff=False, orders__isnull=False)
+        .distinct().order_by('id').values_list('id', flat=True)[:config['users']]
+    )[worker::config['workers']]
+    if not products or not user_ids:
+        raise RuntimeError('The store needs products and customers with orders; run seed_store first')
+
+    journeys = Journeys(rng, products, categories)
+    names = list(JOURNEY_WEIGHTS)
+    weights = list(JOURNEY_WEIGHTS.values())
+    samples = defaultdict(lambda: {'latencies': [], 'queries': [], 'statuses': Counter()})
+    warmup = defaultdict(lambda: {'latencies': [], 'queries': [], 'statuses': Counter()})
+    session = Session(warmup)
+    counts = Counter()
+
+    with quiet_request_logs(), \
+            mock.patch.object(stripe.checkout.Session, 'create', side_effect=fake_checkout_session):
+        for iteration in range(config['warmup'] + config['iterations']):
+            if iteration == config['warmup']:
+                session.samples = samples
+                started = time.perf_counter()
+            if iteration % config['journeys_per_login'] == 0:
+                session.login(User.objects.get(id=rng.choice(user_ids)))
+            name = rng.choices(names, weights=weights)[0]
+            getattr(journeys, name)(session)
+            if iteration >= config['warmup']:
+                counts[name] += 1
+        seconds = time.perf_counter() - started if config['iterations'] else 0
+
+    connection.close()
+    return {
+        'seconds': seconds,
+        'journeys': dict(counts),
+        'samples': {
+            endpoint: {**sample, 'statuses': dict(sample['statuses'])}
+            for endpoint, sample in samples.items()
+        },
+    }
+
+
+def summarize(results):
+    """Combine worker results into per-endpoint and overall statistics"""
+    merged = defaultdict(lambda: {'latencies': [], 'queries': [], 'statuses': Counter()})
+    journeys = Counter()
+    for result in results:
+        journeys.update(result['journeys'])
+        for endpoint, sample in result['samples'].items():
+            merged[endpoint]['latencies'].extend(sample['latencies'])
+            merged[endpoint]['queries'].extend(sample['queries'])
+            merged[endpoint]['statuses'].update(sample['statuses'])
+
+    # Workers run side by side: throughput is over the slowest one
+    seconds = max((result['seconds'] for result in results), default=0)
+    endpoints = {}
+    for endpoint in sorted(merged):
+        sample = merged[endpoint]
+        count = len(sample['latencies'])
+        errors = sum(n for code, n in sample['statuses'].items() if int(code) >= 400)
+        endpoints[endpoint] = {
+            **summarize_latencies(sample['latencies']),
+            'requests_per_second': round(count / seconds, 1) if seconds else 0,
+            'errors': errors,
+            'error_rate': round(errors / count, 4) if count else 0,
+            'statuses': {str(code): n for code, n in sorted(sample['statuses'].items())},
+            'queries_mean': round(sum(sample['queries']) / count, 2) if count else 0,
+            'queries_p95': percentile(sample['queries'], 95),
+            'queries_max': max(sample['queries'], default=0),
+        }
+
+    requests = sum(endpoint['count'] for endpoint in endpoints.values())
+    errors = sum(endpoint['errors'] for endpoint in endpoints.values())
+    return {
+        'totals': {
+            'requests': requests,
+            'errors': errors,
+            'seconds': round(seconds, 3),
+            'requests_per_second': round(requests / seconds, 1) if seconds else 0,
+            'journeys': dict(journeys),
+        },
+        'endpoints': endpoints,
+    }
+
+
+def check_budgets(endpoints, budgets):
+    """Budget violations as readable strings (empty when within budget)"""
+    limits = {
+        'p50_ms': 'p50_ms',
+        'p95_ms': 'p95_ms',
+        'p99_ms': 'p99_ms',
+        'max_queries': 'queries_max',
+        'mean_queries': 'queries_mean',
+        'error_rate': 'error_rate',
+    }
+    violations = []
+    for endpoint, stats in endpoints.items():
+        budget = {**budgets.get('*', {}), **budgets.get(endpoint, {})}
+        for name, limit in budget.items():
+            if name not in limits:
+                raise ValueError(f'Unknown budget {name!r} for {endpoint}')
+            value = stats[limits[name]]
+            if value > limit:
+                violations.append(f'{endpoint}: {name} {value} > {limit}')
+    return violations
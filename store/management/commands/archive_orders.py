@@ -0,0 +1,48 @@
+# store/management/commands/archive_orders.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store.archive import ArchiveService
+
+
+class Command(BaseCommand):
+    help = 'Move delivered or cancelled orders older than a cutoff into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Archive orders created more than this many days ago (default: 365)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Orders moved per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many orders would be archived',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        self.stdout.write(f'Archiving orders created before {cutoff:%Y-%m-%d}...\n')
+
+        if options['dry_run']:
+            count = ArchiveService.archivable_orders(cutoff).count()
+            self.stdout.write(self.style.WARNING(f'{count} order(s) would be archived'))
+            return
+
+        total = 0
+        while True:
+            moved = ArchiveService.archive_batch(cutoff, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f'  → Archived {total} order(s)')
+
+        self.stdout.write(self.style.SUCCESS(f'\n✨ Archived {total} order(s)\n'))
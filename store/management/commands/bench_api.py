@@ -0,0 +1,190 @@
+# store/management/commands/bench_api.py
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from store.benchmarking import git_commit, throwaway_database
+from store.loadtest import (
+    DEFAULT_BUDGETS,
+    JOURNEY_WEIGHTS,
+    check_budgets,
+    prepare_store,
+    run_worker,
+    summarize,
+)
+from store.seeding import StoreSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the shop API with realistic user journeys and report latency, '
+        'throughput and queries per request for each endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker processes running journeys side by side (default: 4)')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Measured journeys per worker (default: 200)')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Unmeasured journeys per worker first (default: 20)')
+        parser.add_argument('--journeys-per-login', type=int, default=10,
+                            help='Journeys each virtual customer runs before switching (default: 10)')
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Seeded customers the workers log in as (default: 1000)')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed for the seeded store and the journeys (default: 42)')
+        parser.add_argument('--orders', type=int, default=20000,
+                            help='Orders in the seeded throwaway store (default: 20000)')
+        parser.add_argument('--products', type=int, default=500,
+                            help='Products in the seeded throwaway store (default: 500)')
+        parser.add_argument('--use-database', action='store_true',
+                            help='Run against the configured database (seeded with seed_store) '
+                                 'instead of a throwaway one; orders, carts and stock are written to it')
+        parser.add_argument('--output',
+                            help='Write the results as JSON to this file')
+        parser.add_argument('--baseline',
+                            help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--budgets',
+                            help='JSON file of budgets replacing the defaults, e.g. '
+                                 '{"*": {"p95_ms": 300}, "GET /api/products/": {"max_queries": 4}}')
+        parser.add_argument('--no-budgets', action='store_true',
+                            help="Report only; don't fail on exceeded budgets")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['iterations'] < 1:
+            raise CommandError('--workers and --iterations must be at least 1')
+        budgets = DEFAULT_BUDGETS
+        if options['budgets']:
+            with open(options['budgets']) as f:
+                budgets = json.load(f)
+
+        if options['use_database']:
+            setup_test_environment()
+            try:
+                results = self.run(options)
+            finally:
+                teardown_test_environment()
+        else:
+            database = connections['default'].settings_dict
+            if database['ENGINE'] == 'django.db.backends.sqlite3':
+                # Several processes write to one SQLite file: take the write
+                # lock up front and wait for it, instead of failing with
+                # "database is locked" when a read transaction upgrades
+                database.setdefault('OPTIONS', {}).update(transaction_mode='IMMEDIATE', timeout=30)
+            with throwaway_database():
+                self.stdout.write(
+                    f"Seeding a throwaway store with {options['orders']:,} orders...\n"
+                )
+                StoreSeeder(seed=options['seed']).run(
+                    categories=10,
+                    products=options['products'],
+                    users=max(options['users'], options['workers']),
+                    orders=options['orders'],
+                    coupons=20,
+                    reviews=options['orders'] // 4,
+                    carts=0,
+                )
+                results = self.run(options)
+
+        try:
+            violations = check_budgets(results['endpoints'], budgets)
+        except ValueError as e:
+            raise CommandError(str(e))
+        results['budgets'] = budgets
+        results['budget_violations'] = violations
+
+        self.report(results)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                self.compare(results, json.load(f))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"\nResults written to {options['output']}")
+
+        if not violations:
+            self.stdout.write(self.style.SUCCESS('\n✨ All endpoints within budget\n'))
+            return
+        self.stdout.write('')
+        for violation in violations:
+            self.stdout.write(self.style.ERROR(f'  ✗ {violation}'))
+        if not options['no_budgets']:
+            raise CommandError(f'{len(violations)} budget(s) exceeded')
+
+    def run(self, options):
+        prepare_store()
+        config = {
+            'seed': options['seed'],
+            'workers': options['workers'],
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'journeys_per_login': options['journeys_per_login'],
+            'users': options['users'],
+        }
+
+        self.stdout.write(
+            f"Running {options['iterations']} journeys in each of {options['workers']} "
+            f"worker process(es)...\n"
+        )
+        # Forked workers inherit the (throwaway) database settings; they
+        # must not inherit an open connection
+        connections.close_all()
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork'),
+        ) as pool:
+            futures = [pool.submit(run_worker, worker, config) for worker in range(options['workers'])]
+            worker_results = [future.result() for future in futures]
+        wall = time.perf_counter() - started
+
+        results = summarize(worker_results)
+        return {
+            'git_commit': git_commit(),
+            'finished_at': timezone.now().isoformat(),
+            'database': connections['default'].vendor,
+            'config': {**config, 'journey_weights': JOURNEY_WEIGHTS},
+            'wall_seconds': round(wall, 3),
+            **results,
+        }
+
+    def report(self, results):
+        totals = results['totals']
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{totals['requests']:,} requests in {totals['seconds']}s: "
+            f"{totals['requests_per_second']:,} req/s, {totals['errors']} error(s)"
+        ))
+        self.stdout.write(
+            f"\n  {'endpoint':<36} {'count':>6} {'req/s':>7} {'p50':>8} {'p95':>8} "
+            f"{'p99':>8} {'queries':>8} {'errors':>6}"
+        )
+        for endpoint, stats in results['endpoints'].items():
+            self.stdout.write(
+                f"  {endpoint:<36} {stats['count']:>6} {stats['requests_per_second']:>7} "
+                f"{stats['p50_ms']:>6.1f}ms {stats['p95_ms']:>6.1f}ms {stats['p99_ms']:>6.1f}ms "
+                f"{stats['queries_mean']:>8} {stats['errors']:>6}"
+            )
+
+    def compare(self, results, baseline):
+        self.stdout.write(self.style.SUCCESS(
+            f"\nCompared with {baseline.get('git_commit') or 'baseline'}"
+        ))
+        for endpoint, stats in results['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(endpoint)
+            if not before:
+                self.stdout.write(f'  {endpoint:<36} new')
+                continue
+            change = (
+                (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                if before['p95_ms'] else 0
+            )
+            self.stdout.write(
+                f"  {endpoint:<36} p95 {before['p95_ms']:.1f} → {stats['p95_ms']:.1f}ms "
+                f"({change:+.0f}%)  queries {before['queries_mean']} → {stats['queries_mean']}"
+            )
@@ -0,0 +1,113 @@
+# store/management/commands/bench_email_render.py
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from store.benchmarking import throwaway_database
+from store.email_service import EmailService
+from store.models import Category, Product, Order, OrderItem, OutboxEmail
+
+
+def legacy_render(order):
+    """The previous path: uncached render_to_string, lazy items, regex-stripped text"""
+    context = {
+        "order": order,
+        "items": order.items.all(),
+        "customer_name": f"{order.first_name} {order.last_name}",
+    }
+    html_message = render_to_string("emails/order_confirmation.html", context)
+    return html_message, strip_tags(html_message)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order email rendering, legacy path vs cached templates with preloaded orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500,
+                            help='Orders to render emails for (default: 500)')
+        parser.add_argument('--items', type=int, default=20,
+                            help='Line items per order (default: 20)')
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='Timed rounds; the best one is reported (default: 3)')
+
+    def handle(self, *args, **options):
+        with throwaway_database(test_environment=False):
+            self.create_orders(options)
+
+            legacy = self.best_of(options['rounds'], self.run_legacy)
+            self.report('legacy (render_to_string + strip_tags, lazy items)', legacy, options)
+
+            for message_type in ['order_confirmation', 'shipping_notification', 'order_delivered']:
+                result = self.best_of(options['rounds'], lambda: self.run_outbox(message_type))
+                self.report(f'outbox {message_type} (cached html + txt, prefetched)', result, options)
+
+    def create_orders(self, options):
+        user = User.objects.create_user(username='email-bench')
+        category = Category.objects.create(name='Email bench', slug='email-bench')
+        products = Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=f'Book {i}',
+                slug=f'email-bench-book-{i}',
+                description='Benchmark product',
+                price=Decimal('12.50'),
+                stock=100,
+            )
+            for i in range(options['items'])
+        ])
+
+        orders = []
+        for _ in range(options['orders']):
+            orders.append(Order.objects.create(
+                user=user,
+                email='reader@example.com',
+                first_name="Ana",
+                last_name="O'Neill",
+                address_line1='1 Test St',
+                city='Testville',
+                state='TS',
+                postal_code='00000',
+                phone='555-0000',
+                subtotal=Decimal('250.00'),
+                total=Decimal('275.00'),
+                tracking_number='1Z999',
+                carrier='UPS',
+            ))
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=product,
+                product_name=product.name,
+                product_price=product.price,
+                quantity=2,
+            )
+            for order in orders
+            for product in products
+        ])
+
+    def best_of(self, rounds, run):
+        return min(run() for _ in range(rounds))
+
+    def run_legacy(self):
+        started = time.perf_counter()
+        for order in Order.objects.all():
+            legacy_render(order)
+        return time.perf_counter() - started
+
+    def run_outbox(self, message_type):
+        """Same queryset shape as EmailService.claim_batch, then build every message"""
+        started = time.perf_counter()
+        orders = Order.objects.prefetch_related('items')
+        for order in orders:
+            email = OutboxEmail(message_type=message_type, recipient=order.email, order=order)
+            EmailService.build_message(email)
+        return time.perf_counter() - started
+
+    def report(self, label, seconds, options):
+        rate = options['orders'] / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(f'\n{label}'))
+        self.stdout.write(f'  {options["orders"]} emails in {seconds:.3f}s → {rate:,.0f} emails/s')
@@ -0,0 +1,114 @@
+# store/management/commands/bench_order_numbers.py
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from store.order_numbers import OrderNumberGenerator
+
+
+def legacy_order_number():
+    """The previous scheme: date plus 8 random hex characters"""
+    date_str = datetime.now().strftime("%Y%m%d")
+    return f"ORD-{date_str}-{str(uuid.uuid4())[:8].upper()}"
+
+
+class Command(BaseCommand):
+    help = 'Compare unique-index insert rates of the legacy and time-ordered order number schemes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--existing',
+            type=int,
+            default=1_000_000,
+            help='Rows already in the table before measuring (default: 1,000,000)',
+        )
+        parser.add_argument(
+            '--inserts',
+            type=int,
+            default=50_000,
+            help='Rows inserted during the measured phase (default: 50,000)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Rows per committed transaction while measuring (default: 100)',
+        )
+        parser.add_argument(
+            '--cache-pages',
+            type=int,
+            default=2000,
+            help='SQLite page cache size, kept small so the index does not fit (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        ulid_generator = OrderNumberGenerator()
+        schemes = [
+            ('legacy (date + uuid4[:8])', legacy_order_number),
+            ('time-ordered (date + ULID)', ulid_generator.new_order_number),
+        ]
+
+        self.stdout.write(
+            f"Pre-filling {options['existing']:,} rows, then inserting "
+            f"{options['inserts']:,} in batches of {options['batch_size']}\n"
+        )
+
+        for label, make_number in schemes:
+            result = self._run_scheme(make_number, options)
+            self.stdout.write(self.style.SUCCESS(f'\n{label}'))
+            self.stdout.write(f"  insert rate:     {result['rate']:,.0f} rows/s")
+            self.stdout.write(f"  elapsed:         {result['elapsed']:.2f}s")
+            self.stdout.write(f"  collisions:      {result['collisions']}")
+            self.stdout.write(f"  database size:   {result['size_mb']:.1f} MB")
+
+    def _run_scheme(self, make_number, options):
+        """Build a fresh table with a unique index and time the measured inserts"""
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(path)
+            conn.execute(f"PRAGMA cache_size = {options['cache_pages']}")
+            conn.execute(
+                'CREATE TABLE bench_order ('
+                'id INTEGER PRIMARY KEY, '
+                'order_number VARCHAR(100) NOT NULL UNIQUE, '
+                'created_at TEXT NOT NULL)'
+            )
+
+            now = datetime.now().isoformat()
+            with conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO bench_order (order_number, created_at) VALUES (?, ?)',
+                    ((make_number(), now) for _ in range(options['existing'])),
+                )
+
+            collisions = 0
+            batch_size = options['batch_size']
+            remaining = options['inserts']
+            started = time.perf_counter()
+            while remaining > 0:
+                count = min(batch_size, remaining)
+                with conn:
+                    for _ in range(count):
+                        cursor = conn.execute(
+                            'INSERT OR IGNORE INTO bench_order (order_number, created_at) VALUES (?, ?)',
+                            (make_number(), now),
+                        )
+                        if cursor.rowcount == 0:
+                            collisions += 1
+                remaining -= count
+            elapsed = time.perf_counter() - started
+            conn.close()
+
+            return {
+                'rate': options['inserts'] / elapsed if elapsed else 0,
+                'elapsed': elapsed,
+                'collisions': collisions,
+                'size_mb': os.path.getsize(path) / (1024 * 1024),
+            }
+        finally:
+            os.remove(path)
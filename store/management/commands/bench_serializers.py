@@ -0,0 +1,296 @@
+# store/management/commands/bench_serializers.py
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from decimal import Decimal
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Prefetch
+from django.utils import timezone
+from store.benchmarking import git_commit, throwaway_database
+from store.models import Category, Product, Cart, CartItem, Order, OrderItem, Coupon
+from store.pricing import PricingService
+from store.serializers import ProductSerializer, CartSerializer, OrderSerializer
+from store.views import CartViewSet, ProductViewSet
+
+
+class DatabaseTimer:
+    """execute_wrapper that counts queries and adds up the time spent in them"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Microbenchmark the hot Python paths (serializers, coupon discounts, order totals) '
+        'on preloaded instances and track the results over time'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000,
+                            help='Products serialized by ProductSerializer (default: 1000)')
+        parser.add_argument('--cart-lines', type=int, default=100,
+                            help='Lines in the cart serialized by CartSerializer (default: 100)')
+        parser.add_argument('--orders', type=int, default=100,
+                            help='Orders serialized by OrderSerializer (default: 100)')
+        parser.add_argument('--order-items', type=int, default=5,
+                            help='Line items per order (default: 5)')
+        parser.add_argument('--values', type=int, default=10000,
+                            help='Subtotals run through the discount and totals math (default: 10000)')
+        parser.add_argument('--rounds', type=int, default=7,
+                            help='Timed rounds per benchmark; median and best are reported (default: 7)')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed for prices and subtotals (default: 42)')
+        parser.add_argument('--output',
+                            help='Write the results as JSON to this file')
+        parser.add_argument('--history',
+                            help='JSON lines file to append the results to; the previous '
+                                 'entry is shown for comparison')
+
+    def handle(self, *args, **options):
+        if options['rounds'] < 1:
+            raise CommandError('--rounds must be at least 1')
+        self.rng = random.Random(options['seed'])
+
+        with throwaway_database(test_environment=False):
+            self.create_fixtures(options)
+            benchmarks = self.load_benchmarks(options)
+            self.stdout.write(
+                f"Running {len(benchmarks)} benchmarks, {options['rounds']} rounds each...\n"
+            )
+            results = {
+                name: self.measure(run, size, options['rounds'])
+                for name, (size, run) in benchmarks.items()
+            }
+
+        run = {
+            'git_commit': git_commit(),
+            'finished_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'config': {
+                key: options[key]
+                for key in ['products', 'cart_lines', 'orders', 'order_items', 'values', 'rounds', 'seed']
+            },
+            'benchmarks': results,
+        }
+
+        self.report(results)
+        if options['history']:
+            previous = self.last_entry(options['history'])
+            if previous:
+                self.compare(results, previous)
+            with open(options['history'], 'a') as f:
+                f.write(json.dumps(run) + '\n')
+            self.stdout.write(f"\nAppended to {options['history']}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(f"\nResults written to {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS('\n✨ Benchmarks complete\n'))
+
+    def create_fixtures(self, options):
+        category = Category.objects.create(name='Serializer bench', slug='serializer-bench')
+        count = max(options['products'], options['cart_lines'], options['order_items'])
+        products = Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=f'Book {i}',
+                slug=f'serializer-bench-book-{i}',
+                description='Benchmark product',
+                short_description='Benchmark',
+                price=Decimal(self.rng.randint(300, 6000)) / 100,
+                stock=100,
+            )
+            for i in range(count)
+        ])
+
+        user = User.objects.create_user(username='serializer-bench')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=self.rng.randint(1, 3))
+            for product in products[:options['cart_lines']]
+        ])
+
+        coupon = Coupon.objects.create(
+            code='BENCH10',
+            discount_type='percentage',
+            discount_value=Decimal('10'),
+            valid_from=timezone.localdate(),
+            valid_until=timezone.localdate(),
+        )
+        orders = Order.objects.bulk_create([
+            Order(
+                user=user,
+                order_number=f'BENCH-{i:06d}',
+                email='reader@example.com',
+                first_name='Ana',
+                last_name="O'Neill",
+                address_line1='1 Test St',
+                city='Testville',
+                state='TS',
+                postal_code='00000',
+                phone='555-0000',
+                coupon=coupon if i % 3 == 0 else None,
+                subtotal=Decimal('100.00'),
+                total=Decimal('113.00'),
+            )
+            for i in range(options['orders'])
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=product,
+                product_name=product.name,
+                product_price=product.price,
+                quantity=2,
+            )
+            for order in orders
+            for product in products[:options['order_items']]
+        ])
+
+    def load_benchmarks(self, options):
+        """
+        Every benchmark as name → (items per run, callable)
+        Instances are loaded once, through the views' own querysets, so the
+        runs only pay for what the serializers and models do on their own
+        """
+        products = list(
+            ProductViewSet.queryset.for_display().order_by('id')[:options['products']]
+        )
+        cart = Cart.objects.prefetch_related(*CartViewSet.line_prefetches()).get()
+        orders = list(
+            Order.objects.select_related('coupon').prefetch_related(
+                Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+            ).order_by('id')
+        )
+
+        subtotals = [
+            Decimal(self.rng.randint(100, 50000)) / 100 for _ in range(options['values'])
+        ]
+        percentage = Coupon(discount_type='percentage', discount_value=Decimal('15'))
+        fixed = Coupon(discount_type='fixed', discount_value=Decimal('10.00'))
+        discounts = [percentage.calculate_discount(subtotal) for subtotal in subtotals]
+        priced = list(zip(subtotals, discounts))
+
+        return {
+            'ProductSerializer': (
+                len(products),
+                lambda: ProductSerializer(products, many=True).data,
+            ),
+            'CartSerializer': (
+                options['cart_lines'],
+                lambda: CartSerializer(cart).data,
+            ),
+            'OrderSerializer': (
+                len(orders),
+                lambda: OrderSerializer(orders, many=True).data,
+            ),
+            'Coupon.calculate_discount (percentage)': (
+                len(subtotals),
+                lambda: [percentage.calculate_discount(subtotal) for subtotal in subtotals],
+            ),
+            'Coupon.calculate_discount (fixed)': (
+                len(subtotals),
+                lambda: [fixed.calculate_discount(subtotal) for subtotal in subtotals],
+            ),
+            'PricingService.order_totals': (
+                len(priced),
+                lambda: [PricingService.order_totals(subtotal, discount) for subtotal, discount in priced],
+            ),
+        }
+
+    def measure(self, run, size, rounds):
+        """
+        Median and best of the timed rounds, with the garbage collector off
+        Any query made while serializing is counted and its time is
+        reported apart from the Python time; with the views' querysets
+        there should be none
+        """
+        run()
+        samples = []
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(rounds):
+                timer = DatabaseTimer()
+                with connection.execute_wrapper(timer):
+                    started = time.perf_counter()
+                    run()
+                    elapsed = time.perf_counter() - started
+                samples.append((elapsed, timer.seconds, timer.queries))
+        finally:
+            if gc_enabled:
+                gc.enable()
+                gc.collect()
+
+        median = statistics.median(elapsed for elapsed, _, _ in samples)
+        best = min(elapsed for elapsed, _, _ in samples)
+        db_seconds = statistics.median(seconds for _, seconds, _ in samples)
+        python_seconds = statistics.median(elapsed - seconds for elapsed, seconds, _ in samples)
+        return {
+            'items': size,
+            'rounds': rounds,
+            'median_ms': round(median * 1000, 3),
+            'best_ms': round(best * 1000, 3),
+            'python_ms': round(python_seconds * 1000, 3),
+            'db_ms': round(db_seconds * 1000, 3),
+            'queries': samples[-1][2],
+            'python_us_per_item': round(python_seconds / size * 1e6, 3) if size else 0,
+        }
+
+    def last_entry(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            lines = [line for line in f if line.strip()]
+        return json.loads(lines[-1]) if lines else None
+
+    def report(self, results):
+        self.stdout.write(
+            f"  {'benchmark':<40} {'items':>6} {'median':>10} {'best':>10} "
+            f"{'python':>10} {'db':>9} {'queries':>7} {'µs/item':>9}"
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f"  {name:<40} {stats['items']:>6} {stats['median_ms']:>8.2f}ms "
+                f"{stats['best_ms']:>8.2f}ms {stats['python_ms']:>8.2f}ms {stats['db_ms']:>7.2f}ms "
+                f"{stats['queries']:>7} {stats['python_us_per_item']:>9.2f}"
+            )
+
+    def compare(self, results, previous):
+        self.stdout.write(self.style.SUCCESS(
+            f"\nCompared with {previous.get('git_commit') or 'previous run'} "
+            f"({previous.get('finished_at', '?')[:19]})"
+        ))
+        for name, stats in results.items():
+            before = previous.get('benchmarks', {}).get(name)
+            if not before:
+                self.stdout.write(f'  {name:<40} new')
+                continue
+            change = (
+                (stats['python_ms'] - before['python_ms']) / before['python_ms'] * 100
+                if before['python_ms'] else 0
+            )
+            self.stdout.write(
+                f"  {name:<40} python {before['python_ms']:.2f} → {stats['python_ms']:.2f}ms "
+                f"({change:+.0f}%)  queries {before['queries']} → {stats['queries']}"
+            )
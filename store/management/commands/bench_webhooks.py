@@ -0,0 +1,329 @@
+# store/management/commands/bench_webhooks.py
+import hashlib
+import hmac
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client, override_settings
+from store.benchmarking import quiet_logs, quiet_request_logs, summarize_latencies, throwaway_database
+from store.models import Category, Product, Order, OrderItem, OutboxEmail, StripeObjectLink
+from store.webhooks import WebhookService
+
+BENCH_PREFIX = 'webhook-bench'
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header for a payload, as Stripe would"""
+    timestamp = timestamp or int(time.time())
+    signed = f'{timestamp}.{payload}'.encode()
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def build_event(event_id, event_type, order):
+    """A minimal checkout.session.* event for an order"""
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'data': {
+            'object': {
+                'id': f'cs_{BENCH_PREFIX}_{order.id}',
+                'object': 'checkout.session',
+                'client_reference_id': str(order.id),
+                'metadata': {'order_number': order.order_number},
+            },
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Load-test the Stripe webhook with signed, duplicated and reordered events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200,
+                            help='Pending orders to generate events for (default: 200)')
+        parser.add_argument('--products', type=int, default=20,
+                            help='Products the orders draw items from (default: 20)')
+        parser.add_argument('--expired-ratio', type=float, default=0.25,
+                            help='Share of orders that get checkout.session.expired (default: 0.25)')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.3,
+                            help='Share of events delivered more than once (default: 0.3)')
+        parser.add_argument('--late-replay-ratio', type=float, default=0.2,
+                            help='Share of events redelivered after processing (default: 0.2)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent senders (default: 8)')
+        parser.add_argument('--secret', default='whsec_local_benchmark',
+                            help='Webhook signing secret (must match the server with --url)')
+        parser.add_argument('--url',
+                            help='POST to a running server instead of the Django test client; '
+                                 'fixtures are created in the configured database')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed for event order and duplicates (default: 42)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+
+        if options['url']:
+            self.run(options)
+            return
+
+        with throwaway_database():
+            with override_settings(STRIPE_WEBHOOK_SECRET=options['secret']):
+                self.run(options)
+
+    def run(self, options):
+        orders, initial_stock = self.create_fixtures(options)
+        expired_count = int(len(orders) * options['expired_ratio'])
+        expired_ids = {order.id for order in orders[:expired_count]}
+
+        events = [
+            build_event(
+                f'evt_{BENCH_PREFIX}_{order.id}',
+                'checkout.session.expired' if order.id in expired_ids else 'checkout.session.completed',
+                order,
+            )
+            for order in orders
+        ]
+
+        # Duplicates interleaved with originals, all shuffled out of order
+        deliveries = list(events)
+        for event in events:
+            if self.rng.random() < options['duplicate_ratio']:
+                deliveries.extend([event] * self.rng.randint(1, 2))
+        self.rng.shuffle(deliveries)
+
+        try:
+            self.stdout.write(
+                f'Sending {len(deliveries)} deliveries of {len(events)} events '
+                f'with {options["concurrency"]} senders...\n'
+            )
+            ingest = self.send(deliveries, options)
+            drain = self.drain()
+
+            late = [e for e in events if self.rng.random() < options['late_replay_ratio']]
+            replay = self.send(late, options) if late else None
+            self.drain()
+
+            problems = self.verify(orders, expired_ids, initial_stock, options)
+        finally:
+            if options['url']:
+                self.delete_fixtures()
+
+        self.report(ingest, drain, replay, problems)
+        if problems:
+            raise CommandError(f'{len(problems)} correctness problem(s) found')
+
+    def create_fixtures(self, options):
+        """Pending orders whose stock has already been reserved"""
+        self.delete_fixtures()
+        user = User.objects.create_user(username=BENCH_PREFIX, email=f'{BENCH_PREFIX}@example.com')
+        category = Category.objects.create(name=BENCH_PREFIX, slug=BENCH_PREFIX)
+        products = [
+            Product.objects.create(
+                category=category,
+                name=f'{BENCH_PREFIX} product {i}',
+                slug=f'{BENCH_PREFIX}-product-{i}',
+                description='Benchmark product',
+                price=Decimal('10.00'),
+                stock=1000,
+            )
+            for i in range(options['products'])
+        ]
+
+        orders = []
+        for _ in range(options['orders']):
+            order = Order.objects.create(
+                user=user,
+                email=user.email,
+                first_name='Bench',
+                last_name='Mark',
+                address_line1='1 Test St',
+                city='Testville',
+                state='TS',
+                postal_code='00000',
+                phone='555-0000',
+                subtotal=Decimal('0'),
+                total=Decimal('0'),
+            )
+            for product in self.rng.sample(products, k=min(3, len(products))):
+                OrderItem.objects.create(
+                    order=order,
+                    product=product,
+                    product_name=product.name,
+                    product_price=product.price,
+                    quantity=self.rng.randint(1, 3),
+                )
+            StripeObjectLink.objects.create(
+                stripe_id=f'cs_{BENCH_PREFIX}_{order.id}',
+                order=order,
+            )
+            orders.append(order)
+
+        initial_stock = dict(Product.objects.filter(category=category).values_list('id', 'stock'))
+        return orders, initial_stock
+
+    def delete_fixtures(self):
+        Order.objects.filter(user__username=BENCH_PREFIX).delete()
+        Category.objects.filter(slug=BENCH_PREFIX).delete()
+        User.objects.filter(username=BENCH_PREFIX).delete()
+
+    def send(self, deliveries, options):
+        """POST every delivery from concurrent senders; returns timing stats"""
+        work = queue.Queue()
+        for event in deliveries:
+            work.put(event)
+
+        latencies = []
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def sender():
+            client = None if options['url'] else Client()
+            session = None
+            if options['url']:
+                import requests
+                session = requests.Session()
+            try:
+                while True:
+                    try:
+                        event = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    payload = json.dumps(event)
+                    headers = {'HTTP_STRIPE_SIGNATURE': sign_payload(payload, options['secret'])}
+                    started = time.perf_counter()
+                    if session:
+                        response = session.post(
+                            options['url'],
+                            data=payload,
+                            headers={
+                                'Content-Type': 'application/json',
+                                'Stripe-Signature': headers['HTTP_STRIPE_SIGNATURE'],
+                            },
+                        )
+                        status = response.status_code
+                    else:
+                        status = client.post(
+                            '/api/stripe/webhook/',
+                            payload,
+                            content_type='application/json',
+                            **headers,
+                        ).status_code
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[status] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sender) for _ in range(options['concurrency'])]
+        # In-process requests would each log a line, and time the logging too
+        with quiet_request_logs():
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+
+        return {
+            'deliveries': len(deliveries),
+            'seconds': wall,
+            'events_per_second': len(deliveries) / wall if wall else 0,
+            'latency': summarize_latencies(latencies),
+            'statuses': dict(statuses),
+        }
+
+    def drain(self):
+        """Run the inbox worker until nothing is due"""
+        started = time.perf_counter()
+        total = 0
+        # One info line per order would flood the output and the timings
+        with quiet_logs('store.webhooks'):
+            while True:
+                processed, failed = WebhookService.process_pending(batch_size=500)
+                total += processed + failed
+                if not processed and not failed:
+                    break
+        wall = time.perf_counter() - started
+        return {
+            'events': total,
+            'seconds': wall,
+            'events_per_second': total / wall if wall else 0,
+        }
+
+    def verify(self, orders, expired_ids, initial_stock, options):
+        """Compare final state with what exactly-once processing would give"""
+        problems = []
+
+        restored = Counter()
+        for row in OrderItem.objects.filter(order_id__in=expired_ids).values('product_id').annotate(
+            quantity=Sum('quantity')
+        ):
+            restored[row['product_id']] = row['quantity']
+
+        for product_id, stock in Product.objects.filter(id__in=initial_stock).values_list('id', 'stock'):
+            expected = initial_stock[product_id] + restored[product_id]
+            if stock != expected:
+                problems.append(
+                    f'product {product_id}: stock {stock}, expected {expected} '
+                    f'(restored {(stock - initial_stock[product_id])} of {restored[product_id]})'
+                )
+
+        final = dict(Order.objects.filter(id__in=[o.id for o in orders]).values_list('id', 'payment_status'))
+        for order in orders:
+            expected = 'failed' if order.id in expired_ids else 'completed'
+            if final.get(order.id) != expected:
+                problems.append(f'order {order.id}: payment_status {final.get(order.id)}, expected {expected}')
+
+        queued = Counter(
+            OutboxEmail.objects.filter(
+                order_id__in=[o.id for o in orders],
+                message_type='order_confirmation',
+            ).values_list('order_id', flat=True)
+        )
+        for order in orders:
+            expected = 0 if order.id in expired_ids else 1
+            if queued[order.id] != expected:
+                problems.append(
+                    f'order {order.id}: {queued[order.id]} confirmation email(s), expected {expected}'
+                )
+
+        return problems
+
+    def report(self, ingest, drain, replay, problems):
+        self.stdout.write(self.style.SUCCESS('\nWebhook ingestion'))
+        self.stdout.write(f"  deliveries:      {ingest['deliveries']}")
+        self.stdout.write(f"  throughput:      {ingest['events_per_second']:,.0f} events/s")
+        latency = ingest['latency']
+        self.stdout.write(
+            f"  latency:         p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  "
+            f"p99 {latency['p99_ms']}ms  max {latency['max_ms']}ms"
+        )
+        self.stdout.write(f"  status codes:    {ingest['statuses']}")
+
+        self.stdout.write(self.style.SUCCESS('\nInbox worker'))
+        self.stdout.write(f"  events applied:  {drain['events']}")
+        self.stdout.write(f"  throughput:      {drain['events_per_second']:,.0f} events/s")
+
+        if replay:
+            self.stdout.write(self.style.SUCCESS('\nLate replays'))
+            self.stdout.write(f"  deliveries:      {replay['deliveries']}  {replay['statuses']}")
+
+        self.stdout.write(self.style.SUCCESS('\nCorrectness'))
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  ✗ {problem}'))
+        else:
+            self.stdout.write('  ✓ no double-applied stock, status or email changes')
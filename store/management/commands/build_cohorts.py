@@ -0,0 +1,20 @@
+# store/management/commands/build_cohorts.py
+from django.core.management.base import BaseCommand
+from store.cohorts import CohortService
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer cohorts, retention and lifetime value for /api/analytics/cohorts/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CohortService.CHUNK_SIZE,
+            help=f'Orders read from the database per chunk (default: {CohortService.CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building customer cohorts...\n')
+        count = CohortService.build(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'\n✨ Stored {count} cohort(s)\n'))
@@ -61,11 +61,11 @@ class Command(BaseCommand):
         
         # Send email alert if requested and there are low stock products
         if options['send_email'] and low_stock_products.exists():
-            self.stdout.write('\n📧 Sending email alert...')
+            self.stdout.write('\n📧 Queueing email alert...')
             result = EmailService.send_low_stock_alert(low_stock_products)
             if result:
-                self.stdout.write(self.style.SUCCESS('✅ Email sent successfully'))
+                self.stdout.write(self.style.SUCCESS('✅ Email queued for send_outbox'))
             else:
-                self.stdout.write(self.style.ERROR('❌ Failed to send email'))
+                self.stdout.write(self.style.ERROR('❌ Failed to queue email'))
         
         self.stdout.write(self.style.SUCCESS('\n✨ Inventory check complete!\n'))
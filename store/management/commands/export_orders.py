@@ -0,0 +1,70 @@
+# store/management/commands/export_orders.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from store.exports import ExportService
+
+
+class Command(BaseCommand):
+    help = 'Export orders or order lines as CSV or JSONL, streamed to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First order date, YYYY-MM-DD (default: no limit)')
+        parser.add_argument('--end', help='Last order date, YYYY-MM-DD (default: no limit)')
+        parser.add_argument(
+            '--status',
+            action='append',
+            default=[],
+            help='Only orders with this status; repeat for several (default: all)',
+        )
+        parser.add_argument(
+            '--payment-status',
+            action='append',
+            default=[],
+            help='Only orders with this payment status; repeat for several (default: all)',
+        )
+        parser.add_argument('--lines', action='store_true', help='Export one row per order line')
+        parser.add_argument('--include-archived', action='store_true', help='Include archived orders')
+        parser.add_argument(
+            '--format',
+            choices=ExportService.FORMATS,
+            default='csv',
+            help='Output format (default: csv)',
+        )
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=ExportService.CHUNK_SIZE,
+            help=f'Rows read and written per chunk (default: {ExportService.CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ['start', 'end']:
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if not dates[name]:
+                    raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+
+        try:
+            chunks = ExportService.stream(
+                output=options['format'],
+                chunk_size=options['chunk_size'],
+                statuses=options['status'],
+                payment_statuses=options['payment_status'],
+                lines=options['lines'],
+                include_archived=options['include_archived'],
+                **dates
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'✅ Wrote {options["output"]}'))
@@ -0,0 +1,48 @@
+# store/management/commands/process_webhook_events.py
+import time
+
+from django.core.management.base import BaseCommand
+from store.webhooks import WebhookService
+
+
+class Command(BaseCommand):
+    help = 'Apply pending Stripe webhook events from the inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Events claimed per batch (default: 100)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll the inbox instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to sleep between polls of an empty inbox with --loop (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        total_processed = total_failed = 0
+
+        while True:
+            processed, failed = WebhookService.process_pending(options['batch_size'])
+            total_processed += processed
+            total_failed += failed
+
+            if processed or failed:
+                self.stdout.write(f'  → {processed} processed, {failed} failed')
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✨ Processed {total_processed} event(s), {total_failed} failure(s)\n'
+        ))
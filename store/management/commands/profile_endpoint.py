@@ -0,0 +1,147 @@
+# store/management/commands/profile_endpoint.py
+import json
+import time
+from collections import Counter
+from unittest import mock
+
+import stripe
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from store.benchmarking import quiet_request_logs, summarize_latencies, throwaway_database
+from store.loadtest import fake_checkout_session, prepare_store
+from store.profiling import StackSampler, write_profile
+from store.seeding import StoreSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Profile one endpoint against a seeded store and write a collapsed-stack '
+        'file for flamegraph.pl, speedscope or inferno'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to request, e.g. /api/products/')
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'],
+                            help='HTTP method (default: GET)')
+        parser.add_argument('--data',
+                            help='JSON body for POST/PUT/PATCH, or query parameters for GET')
+        parser.add_argument('--user',
+                            help='Username to log in as (default: a customer with orders)')
+        parser.add_argument('--staff', action='store_true',
+                            help='Log in as a staff user instead (default user only)')
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Profiled requests; their samples are added up (default: 20)')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Unprofiled requests first (default: 2)')
+        parser.add_argument('--interval', type=float, default=0.001,
+                            help='Seconds between stack samples (default: 0.001)')
+        parser.add_argument('--output',
+                            help='Collapsed-stack file to write (default: a new file in PROFILER_DIR)')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed for the seeded throwaway store (default: 42)')
+        parser.add_argument('--orders', type=int, default=5000,
+                            help='Orders in the seeded throwaway store (default: 5000)')
+        parser.add_argument('--products', type=int, default=500,
+                            help='Products in the seeded throwaway store (default: 500)')
+        parser.add_argument('--use-database', action='store_true',
+                            help='Run against the configured database (seeded with seed_store) '
+                                 'instead of a throwaway one; POSTs write to it')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        try:
+            options['data'] = json.loads(options['data']) if options['data'] else None
+        except ValueError as e:
+            raise CommandError(f'--data is not valid JSON: {e}')
+
+        if options['use_database']:
+            setup_test_environment()
+            try:
+                self.run(options)
+            finally:
+                teardown_test_environment()
+            return
+
+        with throwaway_database():
+            self.stdout.write(f"Seeding a throwaway store with {options['orders']:,} orders...\n")
+            StoreSeeder(seed=options['seed']).run(
+                categories=10,
+                products=options['products'],
+                users=200,
+                orders=options['orders'],
+                coupons=20,
+                reviews=options['orders'] // 4,
+                carts=50,
+            )
+            self.run(options)
+
+    def get_user(self, options):
+        if options['user']:
+            try:
+                return User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}")
+        if options['staff']:
+            user = User.objects.filter(is_staff=True).order_by('id').first()
+            if user is None:
+                user = User.objects.create_user(username='profiler', is_staff=True)
+            return user
+        user = User.objects.filter(is_staff=False, orders__isnull=False).order_by('id').first()
+        if user is None:
+            raise CommandError('No customer with orders; seed the store first or pass --user')
+        return user
+
+    def request(self, client, options):
+        method = options['method'].lower()
+        if method == 'get':
+            return client.get(options['path'], options['data'])
+        return getattr(client, method)(options['path'], options['data'] or {}, content_type='application/json')
+
+    def run(self, options):
+        prepare_store()
+        client = Client()
+        user = self.get_user(options)
+        client.force_login(user)
+
+        with quiet_request_logs(), \
+                mock.patch.object(stripe.checkout.Session, 'create', side_effect=fake_checkout_session):
+            for _ in range(options['warmup']):
+                self.request(client, options)
+
+            statuses = Counter()
+            latencies = []
+            with StackSampler(interval=options['interval']) as sampler:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    response = self.request(client, options)
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] += 1
+
+        name = f"{options['method']} {options['path']}"
+        if options['output']:
+            path = options['output']
+            with open(path, 'w') as f:
+                f.write(sampler.collapsed())
+        else:
+            path = write_profile(sampler, name)
+
+        stats = summarize_latencies(latencies)
+        self.stdout.write(self.style.SUCCESS(f'\n✨ Profiled {name} as {user.username}\n'))
+        self.stdout.write(
+            f"  → {stats['count']} request(s): p50 {stats['p50_ms']:.1f}ms, "
+            f"p95 {stats['p95_ms']:.1f}ms, statuses {dict(statuses)}"
+        )
+        self.stdout.write(f'  → {sampler.samples:,} samples written to {path}')
+
+        # Where the time is spent, by innermost frame
+        leaves = Counter()
+        for stack, weight in sampler.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += weight
+        total = sum(leaves.values())
+        if total:
+            self.stdout.write('\n  Hottest frames (self time):')
+            for frame, weight in leaves.most_common(10):
+                self.stdout.write(f'  {weight / total:>6.1%}  {frame}')
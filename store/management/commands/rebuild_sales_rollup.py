@@ -0,0 +1,61 @@
+# store/management/commands/rebuild_sales_rollup.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+from store.models import Order, ArchivedOrder, DailySalesRollup, DailyProductSales
+from store.analytics_cache import AnalyticsCache
+from store.rollups import SalesRollupService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup tables from the live and archived orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Only rebuild the last N days (default: all order history)',
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=30,
+            help='Days recomputed per transaction (default: 30)',
+        )
+
+    def handle(self, *args, **options):
+        end_date = timezone.localdate() + timedelta(days=1)
+
+        if options['days']:
+            start_date = end_date - timedelta(days=options['days'])
+        else:
+            first_orders = [
+                order_model.objects.filter(payment_status='completed').aggregate(
+                    first=Min('created_at')
+                )['first']
+                for order_model in [Order, ArchivedOrder]
+            ]
+            first_orders = [first for first in first_orders if first]
+            if not first_orders:
+                self.stdout.write(self.style.WARNING('No completed orders to roll up'))
+                return
+            start_date = timezone.localdate(min(first_orders))
+
+            # Nothing sold before the first order; clear any leftovers
+            DailySalesRollup.objects.filter(date__lt=start_date).delete()
+            DailyProductSales.objects.filter(date__lt=start_date).delete()
+
+        self.stdout.write(f'Rebuilding sales rollup from {start_date} to {end_date - timedelta(days=1)}...\n')
+
+        total = 0
+        chunk_start = start_date
+        while chunk_start < end_date:
+            chunk_end = min(chunk_start + timedelta(days=options['chunk_days']), end_date)
+            total += SalesRollupService.rebuild(chunk_start, chunk_end)
+            self.stdout.write(f'  → {chunk_start} to {chunk_end - timedelta(days=1)}')
+            chunk_start = chunk_end
+
+        AnalyticsCache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'\n✨ Rebuilt {total} day(s) with sales\n'))
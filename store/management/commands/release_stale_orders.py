@@ -0,0 +1,58 @@
+# store/management/commands/release_stale_orders.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store.inventory import InventoryService
+
+
+class Command(BaseCommand):
+    help = 'Cancel pending orders past their TTL and restore the stock they reserved'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=float,
+            default=settings.PENDING_ORDER_TTL_HOURS,
+            help='Release orders still pending after this many hours '
+                 f'(default: {settings.PENDING_ORDER_TTL_HOURS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Orders released per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many orders would be released',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale_orders = InventoryService.stale_pending_orders(cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'{stale_orders.count()} pending order(s) would be released'
+            ))
+            return
+
+        self.stdout.write('Releasing stale pending orders...\n')
+
+        total = 0
+        while True:
+            order_ids = list(
+                stale_orders.order_by('created_at').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not order_ids:
+                break
+            released = InventoryService.release_orders(order_ids)
+            if not released:
+                break
+            total += released
+            self.stdout.write(f'  → Released {total} order(s)')
+
+        self.stdout.write(self.style.SUCCESS(f'\n✨ Released {total} stale order(s)\n'))
@@ -0,0 +1,112 @@
+# store/management/commands/seed_store.py
+import time
+from datetime import date
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from store.models import Product, Order, ArchivedOrder
+from store.seeding import StoreSeeder
+
+
+class Command(BaseCommand):
+    help = 'Fill an empty store with a large, realistic synthetic dataset for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed; the same seed, counts and --end give the same data (default: 42)',
+        )
+        parser.add_argument('--categories', type=int, default=10, help='Categories (default: 10)')
+        parser.add_argument('--products', type=int, default=500, help='Products (default: 500)')
+        parser.add_argument('--users', type=int, default=5000, help='Customer accounts (default: 5000)')
+        parser.add_argument('--orders', type=int, default=50000, help='Orders (default: 50000)')
+        parser.add_argument('--coupons', type=int, default=50, help='Coupons (default: 50)')
+        parser.add_argument(
+            '--reviews',
+            type=int,
+            default=5000,
+            help='Reviews, at most one per customer and product they received (default: 5000)',
+        )
+        parser.add_argument('--carts', type=int, default=500, help='Open carts (default: 500)')
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=730,
+            help='Days of order history (default: 730)',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last day of the history, YYYY-MM-DD (default: today, up to now)',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Zipf exponent of product popularity; higher is more skewed (default: 1.1)',
+        )
+        parser.add_argument(
+            '--password',
+            default='password',
+            help='Password of every seeded account (default: password)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=StoreSeeder.BATCH_SIZE,
+            help=f'Rows per bulk insert and orders per transaction (default: {StoreSeeder.BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--skip-rollups',
+            action='store_true',
+            help="Don't rebuild the sales rollup and cohorts afterwards",
+        )
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() or Order.objects.exists() or ArchivedOrder.objects.exists():
+            raise CommandError(
+                'The store already has products or orders; seed an empty database '
+                '(e.g. after manage.py flush)'
+            )
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        seeder = StoreSeeder(
+            seed=options['seed'],
+            end=options['end'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            popularity_skew=options['skew'],
+            password=options['password'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(
+            f"Seeding {options['days']} day(s) of history up to {seeder.end_date} "
+            f"with seed {options['seed']}...\n"
+        )
+
+        started = time.perf_counter()
+        counts = seeder.run(
+            categories=options['categories'],
+            products=options['products'],
+            users=options['users'],
+            orders=options['orders'],
+            coupons=options['coupons'],
+            reviews=options['reviews'],
+            carts=options['carts'],
+        )
+
+        if not options['skip_rollups'] and counts['orders']:
+            self.stdout.write('')
+            call_command('rebuild_sales_rollup', stdout=self.stdout)
+            call_command('build_cohorts', stdout=self.stdout)
+
+        elapsed = time.perf_counter() - started
+        rows = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✨ Seeded {rows:,} row(s) in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)\n'
+        ))
+        for name, count in counts.items():
+            self.stdout.write(f'  {name + ":":<14} {count:,}')
@@ -0,0 +1,59 @@
+# store/management/commands/send_outbox.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from store.email_service import EmailService
+
+
+class Command(BaseCommand):
+    help = 'Render and send queued outbox emails over a reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Messages sent per connection (default: 100)',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=settings.EMAIL_OUTBOX_RATE_PER_SECOND,
+            help='Maximum messages per second, 0 for unlimited '
+                 f'(default: {settings.EMAIL_OUTBOX_RATE_PER_SECOND})',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll the outbox instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep between polls of an empty outbox with --loop (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+
+        while True:
+            sent, failed = EmailService.send_batch(
+                batch_size=options['batch_size'],
+                rate_per_second=options['rate'] or None,
+            )
+            total_sent += sent
+            total_failed += failed
+
+            if sent or failed:
+                self.stdout.write(f'  → {sent} sent, {failed} failed')
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✨ Sent {total_sent} email(s), {total_failed} failure(s)\n'
+        ))
@@ -0,0 +1,217 @@
+# store/metrics.py
+import atexit
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 900, 3600, 21600)
+
+# name → (type, help, buckets); exposed in this order
+METRICS = {
+    'store_http_requests_total': (
+        'counter', 'Requests by view, method and status', None),
+    'store_http_request_duration_seconds': (
+        'histogram', 'Request latency by view and method', REQUEST_BUCKETS),
+    'store_http_request_db_queries': (
+        'histogram', 'Database queries per request by view and method', QUERY_BUCKETS),
+    'store_checkouts_total': (
+        'counter', 'Checkouts that created an order (success) or failed after validation (error)', None),
+    'store_stock_reservation_conflicts_total': (
+        'counter', 'Checkouts that failed because stock ran out while reserving it', None),
+    'store_webhook_processing_lag_seconds': (
+        'histogram', 'Time from receiving a Stripe event to applying it, by event type', LAG_BUCKETS),
+    'store_webhook_events_total': (
+        'counter', 'Stripe events applied or failed, by event type', None),
+    'store_emails_total': (
+        'counter', 'Outbox emails by message type and result (sent, failed)', None),
+    'store_cache_requests_total': (
+        'counter', 'Cache lookups by cache, section and result (hit, stale, miss)', None),
+    'store_cache_hit_ratio': (
+        'gauge', 'Share of cache lookups served from the cache, fresh or stale', None),
+}
+
+_lock = threading.Lock()
+_pid = None
+_counters = defaultdict(float)
+# (name, labels) → [bucket counts..., +Inf count, sum]
+_histograms = {}
+_last_flush = 0.0
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _reset_after_fork():
+    """A forked worker starts from zero; its parent's counts are the parent's"""
+    global _pid, _last_flush
+    if _pid != os.getpid():
+        if _pid is None:
+            atexit.register(MetricsService.flush)
+        _pid = os.getpid()
+        _counters.clear()
+        _histograms.clear()
+        _last_flush = 0.0
+
+
+class MetricsService:
+    """
+    Service class for Prometheus metrics
+
+    Counters and histograms live in process memory behind one lock, so
+    recording costs a dict update. With settings.METRICS_DIR set, each
+    process also writes its values to <pid>.json there, at most every
+    METRICS_FLUSH_SECONDS and at exit, and /metrics adds up every file:
+    that way gunicorn/uwsgi workers and the cron commands are all counted,
+    whichever process serves the scrape. Files of exited processes are
+    kept so counters never go backwards; empty the directory on deploy.
+    """
+
+    @staticmethod
+    def inc(name, amount=1, **labels):
+        with _lock:
+            _reset_after_fork()
+            _counters[(name, _key(labels))] += amount
+        MetricsService.maybe_flush()
+
+    @staticmethod
+    def observe(name, value, **labels):
+        buckets = METRICS[name][2]
+        with _lock:
+            _reset_after_fork()
+            key = (name, _key(labels))
+            series = _histograms.get(key)
+            if series is None:
+                series = _histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(buckets)] += 1
+            series[-1] += value
+        MetricsService.maybe_flush()
+
+    @staticmethod
+    def snapshot():
+        """This process's values in a JSON-friendly shape"""
+        with _lock:
+            _reset_after_fork()
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+                'histograms': [[name, labels, list(series)] for (name, labels), series in _histograms.items()],
+            }
+
+    @staticmethod
+    def maybe_flush():
+        global _last_flush
+        if not settings.METRICS_DIR or time.monotonic() - _last_flush < settings.METRICS_FLUSH_SECONDS:
+            return
+        _last_flush = time.monotonic()
+        MetricsService.flush()
+
+    @staticmethod
+    def flush():
+        """Write this process's values to METRICS_DIR, atomically"""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(MetricsService.snapshot(), f)
+        os.replace(temp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+    @staticmethod
+    def collect():
+        """Values of every process added up: (counters, histograms)"""
+        snapshots = [MetricsService.snapshot()]
+        directory = settings.METRICS_DIR
+        if directory and os.path.isdir(directory):
+            own = f'{os.getpid()}.json'
+            for filename in os.listdir(directory):
+                if not filename.endswith('.json') or filename == own:
+                    continue
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    # Removed or being replaced while we read it
+                    continue
+
+        counters = defaultdict(float)
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                counters[(name, tuple(map(tuple, labels)))] += value
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], series)]
+                else:
+                    histograms[key] = list(series)
+        return counters, histograms
+
+    @staticmethod
+    def cache_hit_ratios(counters):
+        """store_cache_hit_ratio series derived from the cache lookup counters"""
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for (name, labels), value in counters.items():
+            if name != 'store_cache_requests_total':
+                continue
+            labels = dict(labels)
+            key = _key({'cache': labels.get('cache', ''), 'section': labels.get('section', '')})
+            totals[key][1] += value
+            if labels.get('result') in ('hit', 'stale'):
+                totals[key][0] += value
+        return {
+            ('store_cache_hit_ratio', key): hits / total
+            for key, (hits, total) in totals.items()
+            if total
+        }
+
+    @staticmethod
+    def render():
+        """Every metric in the Prometheus text exposition format"""
+        counters, histograms = MetricsService.collect()
+        counters.update(MetricsService.cache_hit_ratios(counters))
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind != 'histogram':
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                continue
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + [math.inf], series):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else format_value(bound)
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(series[-1])}')
+                lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_session_links(apps, schema_editor):
+    """Link existing orders to the checkout session id stored on them"""
+    Order = apps.get_model('store', 'Order')
+    StripeObjectLink = apps.get_model('store', 'StripeObjectLink')
+
+    orders = Order.objects.exclude(stripe_payment_intent_id='').values_list(
+        'id', 'stripe_payment_intent_id'
+    )
+    StripeObjectLink.objects.bulk_create(
+        [
+            StripeObjectLink(stripe_id=stripe_id, order_id=order_id)
+            for order_id, stripe_id in orders.iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_category_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeObjectLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_id', models.CharField(max_length=255, unique=True)),
+                ('object_type', models.CharField(choices=[('checkout_session', 'Checkout Session'), ('payment_intent', 'Payment Intent')], default='checkout_session', max_length=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_links', to='store.order')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(backfill_session_links, migrations.RunPython.noop),
+    ]
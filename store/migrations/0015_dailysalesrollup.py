@@ -0,0 +1,105 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:05
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    """Roll up the completed orders already in the live and archive tables"""
+    DailySalesRollup = apps.get_model('store', 'DailySalesRollup')
+    DailyProductSales = apps.get_model('store', 'DailyProductSales')
+
+    days, products = {}, {}
+    for order_name, item_name in [('Order', 'OrderItem'), ('ArchivedOrder', 'ArchivedOrderItem')]:
+        orders = apps.get_model('store', order_name).objects.filter(payment_status='completed')
+        items = apps.get_model('store', item_name).objects.filter(order__payment_status='completed')
+
+        for row in (
+            orders.annotate(date=TruncDate('created_at'))
+            .values('date')
+            .annotate(orders=Count('id'), revenue=Sum('total'))
+            .order_by()
+        ):
+            totals = days.setdefault(row['date'], {'orders': 0, 'revenue': Decimal('0'), 'units': 0})
+            totals['orders'] += row['orders']
+            totals['revenue'] += row['revenue'] or Decimal('0')
+
+        for row in (
+            items.annotate(date=TruncDate('order__created_at'))
+            .values('date', 'product_id')
+            .annotate(
+                product_name=Max('product_name'),
+                units=Sum('quantity'),
+                revenue=Sum(F('quantity') * F('product_price')),
+            )
+            .order_by()
+        ):
+            if row['date'] in days:
+                days[row['date']]['units'] += row['units']
+            # Rows can't be keyed on a deleted product; its sales stay in the day total
+            if row['product_id'] is None:
+                continue
+            totals = products.setdefault(
+                (row['date'], row['product_id']),
+                {'product_name': row['product_name'], 'units': 0, 'revenue': Decimal('0')},
+            )
+            totals['units'] += row['units']
+            totals['revenue'] += row['revenue'] or Decimal('0')
+
+    DailySalesRollup.objects.bulk_create(
+        [DailySalesRollup(date=date, **totals) for date, totals in days.items()],
+        batch_size=1000,
+    )
+    DailyProductSales.objects.bulk_create(
+        [
+            DailyProductSales(date=date, product_id=product_id, **totals)
+            for (date, product_id), totals in products.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('product_name', models.CharField(max_length=200)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='store.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily product sales',
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
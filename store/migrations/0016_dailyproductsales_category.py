@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_categories(apps, schema_editor):
+    """Copy each product's category onto its existing sales counters"""
+    Product = apps.get_model('store', 'Product')
+    DailyProductSales = apps.get_model('store', 'DailyProductSales')
+
+    DailyProductSales.objects.filter(product__isnull=False).update(
+        category_id=Subquery(
+            Product.objects.filter(id=OuterRef('product_id')).values('category_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_dailysalesrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_product_sales', to='store.category'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['category', 'date'], name='store_daily_categor_b7a859_idx'),
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_dailyproductsales_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCohort',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort_month', models.DateField(unique=True)),
+                ('customers', models.PositiveIntegerField(default=0)),
+                ('repeat_customers', models.PositiveIntegerField(default=0, help_text='Customers with more than one completed order')),
+                ('active_customers', models.JSONField(default=list)),
+                ('orders', models.JSONField(default=list)),
+                ('revenue', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['cohort_month'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_customercohort'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='archived_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='store.archivedorder'),
+        ),
+        migrations.AddField(
+            model_name='stripeobjectlink',
+            name='archived_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stripe_links', to='store.archivedorder'),
+        ),
+        migrations.AlterField(
+            model_name='stripeobjectlink',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stripe_links', to='store.order'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_archived_order_links'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='outboxemail',
+            constraint=models.CheckConstraint(condition=models.Q(('order__isnull', True), ('archived_order__isnull', True), _connector='OR'), name='outbox_email_has_at_most_one_order'),
+        ),
+        migrations.AddConstraint(
+            model_name='stripeobjectlink',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('archived_order__isnull', True), ('order__isnull', False)), models.Q(('archived_order__isnull', False), ('order__isnull', True)), _connector='OR'), name='stripe_link_has_one_order'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
+from .order_numbers import generate_order_number
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -17,6 +20,28 @@ class Category(models.Model):
         return self.name
     
 
+class ProductQuerySet(models.QuerySet):
+    def with_review_counts(self):
+        """
+        Annotate approved_review_count, which review_count then returns
+        instead of running a COUNT query per product
+        """
+        approved = (
+            ProductReview.objects.filter(product=models.OuterRef("pk"), is_approved=True)
+            .order_by()
+            .values("product")
+            .annotate(count=models.Count("pk"))
+            .values("count")
+        )
+        return self.annotate(
+            approved_review_count=Coalesce(models.Subquery(approved), 0)
+        )
+
+    def for_display(self):
+        """Everything ProductSerializer reads, in the same query as the products"""
+        return self.select_related("category").with_review_counts()
+
+
 class Product(models.Model):
     category = models.ForeignKey(
         Category,
@@ -39,6 +64,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
 
@@ -63,16 +90,23 @@ class Product(models.Model):
     @property
     def review_count(self):
         """Count of approved reviews"""
+        if hasattr(self, "approved_review_count"):
+            return self.approved_review_count
         return self.reviews.filter(is_approved=True).count()
     
     @property
     def rating_distribution(self):
         """Get distribution of ratings (how many 5-star, 4-star, etc.)"""
         distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        approved_reviews = self.reviews.filter(is_approved=True)
-        
-        for review in approved_reviews:
-            distribution[review.rating] += 1
+        # Counted by the database; order_by() drops the default ordering from the GROUP BY
+        counts = (
+            self.reviews.filter(is_approved=True)
+            .values("rating")
+            .annotate(count=models.Count("id"))
+            .order_by()
+        )
+        for row in counts:
+            distribution[row["rating"]] = row["count"]
         
         return distribution
 
@@ -136,7 +170,8 @@ class CartItem(models.Model):
         if self.quantity > self.product.stock:
             raise ValidationError(f"Only {self.product.stock} items available in stock.")
         
-class Order(models.Model):
+class AbstractOrder(models.Model):
+    """Columns shared by live orders and the order archive"""
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("processing", "Processing"),
@@ -154,12 +189,6 @@ class Order(models.Model):
 
     # Order identification
     order_number = models.CharField(max_length=100, unique=True, editable=False)
-    user = models.ForeignKey(
-        User,
-        on_delete=models.SET_NULL,
-        null=True,
-        related_name="orders"
-    )
 
     # Customer information (stored here in case user is deleted)
     email = models.EmailField()
@@ -179,15 +208,6 @@ class Order(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-
-    # Coupon/Discount
-    coupon = models.ForeignKey(
-        "Coupon",  # String reference since Coupon might be defined after Order
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name="orders"
-    )
     discount_amount = models.DecimalField(
         max_digits=10, 
         decimal_places=2, 
@@ -229,43 +249,218 @@ class Order(models.Model):
     shipped_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
 
-    # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-
     class Meta:
+        abstract = True
         ordering = ["-created_at"]
 
     def __str__(self):
         return f"Order {self.order_number}"
+
+class Order(AbstractOrder):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="orders"
+    )
+
+    # Coupon/Discount
+    coupon = models.ForeignKey(
+        "Coupon",  # String reference since Coupon might be defined after Order
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="orders"
+    )
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractOrder.Meta):
+        indexes = [
+            # Used by archive_orders to find finished orders past the cutoff
+            models.Index(fields=["status", "created_at"]),
+            # Used by release_stale_orders to find abandoned checkouts
+            models.Index(fields=["payment_status", "created_at"]),
+        ]
     
     def save(self, *args, **kwargs):
         """Generate order number on creation"""
         if not self.order_number:
-            # Generate unique order number
-            from datetime import datetime
-            date_str = datetime.now().strftime("%Y%m%d")
-            unique_id = str(uuid.uuid4())[:8].upper()
-            self.order_number = f"ORD-{date_str}-{unique_id}"
+            # Time-ordered so inserts append to the unique index
+            self.order_number = generate_order_number()
         super().save(*args, **kwargs)
 
-class OrderItem(models.Model):
+class StripeObjectLink(models.Model):
+    """Indexed mapping of a Stripe object id (checkout session, etc.) to its order"""
+    OBJECT_TYPE_CHOICES = [
+        ("checkout_session", "Checkout Session"),
+        ("payment_intent", "Payment Intent"),
+    ]
+
+    stripe_id = models.CharField(max_length=255, unique=True)
+    object_type = models.CharField(
+        max_length=30,
+        choices=OBJECT_TYPE_CHOICES,
+        default="checkout_session"
+    )
+    # Exactly one is set: archive_orders moves the link with its order
     order = models.ForeignKey(
         Order,
         on_delete=models.CASCADE,
-        related_name="items"
+        null=True,
+        blank=True,
+        related_name="stripe_links"
     )
-    product = models.ForeignKey(
-        Product,
-        on_delete=models.SET_NULL,
-        null=True
+    archived_order = models.ForeignKey(
+        "ArchivedOrder",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="stripe_links"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(order__isnull=False, archived_order__isnull=True)
+                    | models.Q(order__isnull=True, archived_order__isnull=False)
+                ),
+                name="stripe_link_has_one_order"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.stripe_id} -> {self.order_id or self.archived_order_id}"
+
+    @property
+    def linked_order(self):
+        """The live or archived order"""
+        return self.order or self.archived_order
+
+class StripeEvent(models.Model):
+    """
+    Durable inbox of verified Stripe webhook events
+    The webhook only inserts here; process_webhook_events does the work
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("processed", "Processed"),
+        ("failed", "Failed"),
+    ]
+
+    # Stripe's event id doubles as the deduplication key
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default="pending"
     )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-received_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+class OutboxEmail(models.Model):
+    """
+    Queued outgoing email, rendered and sent by the send_outbox worker
+    Only references are stored; templates are rendered at send time
+    """
+    MESSAGE_TYPE_CHOICES = [
+        ("order_confirmation", "Order Confirmation"),
+        ("shipping_notification", "Shipping Notification"),
+        ("order_delivered", "Order Delivered"),
+        ("low_stock_alert", "Low Stock Alert"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("dead", "Dead"),
+    ]
+
+    message_type = models.CharField(max_length=50, choices=MESSAGE_TYPE_CHOICES)
+    recipient = models.EmailField()
+    # At most one is set: archive_orders moves the email with its order
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="emails"
+    )
+    archived_order = models.ForeignKey(
+        "ArchivedOrder",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="emails"
+    )
+    # Extra template data that isn't an order (e.g. product ids)
+    context = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default="pending"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+        constraints = [
+            # Emails such as stock alerts aren't about an order at all
+            models.CheckConstraint(
+                condition=models.Q(order__isnull=True) | models.Q(archived_order__isnull=True),
+                name="outbox_email_has_at_most_one_order"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_message_type_display()} to {self.recipient}"
+
+    @property
+    def linked_order(self):
+        """The live or archived order, if the message is about one"""
+        return self.order or self.archived_order
+
+class AbstractOrderItem(models.Model):
+    """Columns shared by live order items and the order item archive"""
     product_name = models.CharField(max_length=200)
     product_price = models.DecimalField(max_digits=10, decimal_places=2)
     product_image = models.URLField(max_length=500, blank=True, null=True)
     quantity = models.PositiveIntegerField(default=1)
 
     class Meta:
+        abstract = True
         ordering = ["id"]
 
     def __str__(self):
@@ -276,6 +471,138 @@ class OrderItem(models.Model):
         """Calculate total price for this order item"""
         return self.quantity * self.product_price
 
+class OrderItem(AbstractOrderItem):
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name="items"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True
+    )
+
+class ArchivedOrder(AbstractOrder):
+    """
+    Delivered/cancelled orders moved out of the hot table by archive_orders
+    Keeps the original primary key so order URLs keep working
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="archived_orders"
+    )
+    coupon = models.ForeignKey(
+        "Coupon",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archived_orders"
+    )
+
+    # Timestamps are copied from the live order, not auto-set
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedOrderItem(AbstractOrderItem):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name="items"
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="archived_order_items"
+    )
+
+class DailySalesRollup(models.Model):
+    """
+    Completed sales per day, by order creation date
+    Kept current by SalesRollupService as payments complete or are
+    reversed, and rebuilt from the order tables by rebuild_sales_rollup
+    """
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["date"]
+
+    def __str__(self):
+        return f"Sales {self.date}: {self.orders} orders"
+
+class DailyProductSales(models.Model):
+    """Completed units and revenue per product per day"""
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="daily_sales"
+    )
+    # Stored so rows outlive a deleted product
+    product_name = models.CharField(max_length=200)
+    # Product's category when counted, so per-category reports skip the join
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="daily_product_sales"
+    )
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["date"]
+        verbose_name_plural = "Daily product sales"
+        constraints = [
+            # Also serves date-ranged top product queries
+            models.UniqueConstraint(
+                fields=["date", "product"],
+                name="unique_daily_product_sales"
+            ),
+        ]
+        indexes = [
+            # Date-ranged top products within one category
+            models.Index(fields=["category", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} {self.date}: {self.units} sold"
+
+class CustomerCohort(models.Model):
+    """
+    Customers grouped by the month of their first completed order
+    Rebuilt in full by the build_cohorts command. The JSON lists are
+    indexed by months since the cohort month.
+    """
+    cohort_month = models.DateField(unique=True)
+    customers = models.PositiveIntegerField(default=0)
+    repeat_customers = models.PositiveIntegerField(
+        default=0,
+        help_text="Customers with more than one completed order"
+    )
+    active_customers = models.JSONField(default=list)
+    orders = models.JSONField(default=list)
+    revenue = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["cohort_month"]
+
+    def __str__(self):
+        return f"Cohort {self.cohort_month:%Y-%m}: {self.customers} customers"
+
 class Coupon(models.Model):
     """Disscount coupons for orders"""
     DISCOUNT_TYPES = [
@@ -394,4 +721,5 @@ class ProductReview(models.Model):
     @property
     def is_verified_purchase(self):
         """Check if this review is from a verified purchase"""
-        return self.order is not None
+        # order_id, not order: no query to load the order
+        return self.order_id is not None
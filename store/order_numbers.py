@@ -0,0 +1,85 @@
+# store/order_numbers.py
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from django.utils import timezone
+
+# Crockford base32 (no I, L, O, U) keeps the suffix readable over the phone
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+TIMESTAMP_BITS = 48
+RANDOM_BITS = 80
+TIMESTAMP_CHARS = 10
+RANDOM_CHARS = 16
+
+
+def encode_base32(value, length):
+    """Encode an integer as a fixed-width Crockford base32 string"""
+    chars = []
+    for _ in range(length):
+        chars.append(CROCKFORD_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class OrderNumberGenerator:
+    """
+    Time-ordered (ULID-style) order number generator
+
+    Every suffix is a 48-bit millisecond timestamp followed by 80 bits of
+    randomness. Within the same millisecond the random part is incremented
+    instead of redrawn, so numbers issued by one process are strictly
+    increasing and never repeat. Across processes the 80 random bits make a
+    collision negligible, so no retry loop is needed on save, and because
+    the timestamp leads, new rows land on the right-hand edge of the
+    unique index instead of at random pages.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def _next_parts(self):
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Forked worker: don't continue the parent's random stream
+                self._pid = os.getpid()
+                self._last_ms = -1
+
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._last_random = secrets.randbits(RANDOM_BITS)
+            else:
+                # Same millisecond (or clock went backwards): stay monotonic
+                self._last_random += 1
+                if self._last_random >= 1 << RANDOM_BITS:
+                    self._last_ms += 1
+                    self._last_random = secrets.randbits(RANDOM_BITS - 1)
+
+            return self._last_ms, self._last_random
+
+    def new_order_number(self):
+        """Return a new order number like ORD-YYYYMMDD-<26 char ULID>"""
+        timestamp_ms, random_part = self._next_parts()
+        created = datetime.fromtimestamp(
+            timestamp_ms / 1000, tz=timezone.get_current_timezone()
+        )
+        suffix = (
+            encode_base32(timestamp_ms, TIMESTAMP_CHARS)
+            + encode_base32(random_part, RANDOM_CHARS)
+        )
+        return f"ORD-{created.strftime('%Y%m%d')}-{suffix}"
+
+
+_generator = OrderNumberGenerator()
+
+
+def generate_order_number():
+    """Generate a unique, time-sortable order number"""
+    return _generator.new_order_number()
@@ -0,0 +1,27 @@
+# store/pricing.py
+from decimal import Decimal
+
+
+class PricingService:
+    """
+    Service class for checkout totals
+    Kept free of database access so it can be benchmarked on its own
+    """
+    SHIPPING_COST = Decimal("5.00")
+    TAX_RATE = Decimal("0.08")
+
+    @staticmethod
+    def order_totals(subtotal, discount_amount=Decimal("0.00")):
+        """Shipping, tax and total for a new order, as create_order charges them"""
+        shipping_cost = PricingService.SHIPPING_COST
+        discounted_subtotal = subtotal - discount_amount
+        # Tax is charged on the subtotal before the discount
+        tax = subtotal * PricingService.TAX_RATE
+
+        return {
+            "subtotal": subtotal,
+            "discount_amount": discount_amount,
+            "shipping_cost": shipping_cost,
+            "tax": tax,
+            "total": discounted_subtotal + shipping_cost + tax,
+        }
@@ -0,0 +1,153 @@
+# store/profiling.py
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.text import slugify
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile='
+PROFILE_MODES = ('1', 'download')
+
+_switch_lock = threading.Lock()
+_active_samplers = 0
+_saved_switch_interval = None
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval from a second
+    thread, so the profiled code runs unmodified
+
+    Stacks are kept in the collapsed format (frames root first, joined by
+    ';', then a weight, here microseconds) that flamegraph.pl, speedscope
+    and inferno read directly.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        global _active_samplers, _saved_switch_interval
+        # The sampler can only look once the profiled thread lets go of the
+        # GIL: by default after 5ms of pure Python, but at once on a C call
+        # like a database query, so nearly every sample would land on one.
+        # A short switch interval (while any sampler runs) evens that out.
+        with _switch_lock:
+            if not _active_samplers:
+                _saved_switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(_saved_switch_interval, self.interval / 100))
+            _active_samplers += 1
+        self._thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _active_samplers
+        self._stop.set()
+        if self._thread is None:
+            return
+        self._thread.join()
+        self._thread = None
+        with _switch_lock:
+            _active_samplers -= 1
+            if not _active_samplers:
+                sys.setswitchinterval(_saved_switch_interval)
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            # Each sample stands for the time since the previous one
+            elapsed_us = int((now - last) * 1e6)
+            last = now
+            if frame is None:
+                continue
+            self.stacks[self.collapse(frame)] += elapsed_us
+            self.samples += 1
+
+    def label(self, code):
+        """'function (path:line)', with paths shortened; cached per code object"""
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for prefix in [str(settings.BASE_DIR), *sorted(sys.path, key=len, reverse=True)]:
+                if prefix and filename.startswith(prefix + os.sep):
+                    filename = filename[len(prefix) + 1:]
+                    break
+            label = self._labels[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'
+        return label
+
+    def collapse(self, frame):
+        frames = []
+        while frame is not None:
+            frames.append(self.label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    def collapsed(self):
+        """The samples as collapsed-stack text, hottest stacks first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def write_profile(sampler, name):
+    """Store the collapsed stacks in settings.PROFILER_DIR; returns the path"""
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    filename = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{slugify(name)[:80]}.folded"
+    path = os.path.join(settings.PROFILER_DIR, filename)
+    with open(path, 'w') as f:
+        f.write(sampler.collapsed())
+    return path
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a single request for staff, on demand
+
+    Send "X-Profile: 1" (or add ?_profile=1) to store the request's stacks
+    in settings.PROFILER_DIR; the file name comes back in the X-Profile
+    header. "X-Profile: download" (?_profile=download) returns the
+    collapsed stacks as the response instead; any other value is ignored.
+    Without the switch this is a dict lookup and a substring test per
+    request. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_HEADER not in request.META and PROFILE_PARAM not in request.META.get('QUERY_STRING', ''):
+            return self.get_response(request)
+        mode = request.META.get(PROFILE_HEADER) or request.GET.get('_profile')
+        if mode not in PROFILE_MODES or not request.user.is_staff:
+            return self.get_response(request)
+
+        with StackSampler(interval=settings.PROFILER_INTERVAL) as sampler:
+            response = self.get_response(request)
+
+        name = f'{request.method} {request.path}'
+        if mode == 'download':
+            response = HttpResponse(sampler.collapsed(), content_type='text/plain; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{slugify(name)}.folded"'
+        else:
+            path = write_profile(sampler, name)
+            response['X-Profile'] = f'{os.path.basename(path)}; samples={sampler.samples}'
+        return response
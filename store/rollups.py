@@ -0,0 +1,177 @@
+# store/rollups.py
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import (
+    Order,
+    OrderItem,
+    ArchivedOrder,
+    ArchivedOrderItem,
+    DailySalesRollup,
+    DailyProductSales,
+)
+
+
+class SalesRollupService:
+    """
+    Service class for the daily sales rollup tables
+    Analytics read these instead of scanning every completed order
+    """
+
+    @staticmethod
+    def start_of_day(date):
+        """Aware midnight at the start of a local date"""
+        return timezone.make_aware(datetime.combine(date, time.min))
+
+    @staticmethod
+    def aggregate_orders(orders, items):
+        """
+        Group completed orders and their items by order creation date
+        Returns (days, products): days maps date to orders/revenue/units,
+        products maps (date, product_id) to product_name/category_id/units/revenue
+        for items whose product still exists
+        """
+        days = {}
+        for row in (
+            orders.annotate(date=TruncDate('created_at'))
+            .values('date')
+            .annotate(orders=Count('id'), revenue=Sum('total'))
+            .order_by()
+        ):
+            days[row['date']] = {
+                'orders': row['orders'],
+                'revenue': row['revenue'] or Decimal('0'),
+                'units': 0,
+            }
+
+        products = {}
+        for row in (
+            items.annotate(date=TruncDate('order__created_at'))
+            .values('date', 'product_id')
+            .annotate(
+                product_name=Max('product_name'),
+                category_id=Max('product__category_id'),
+                units=Sum('quantity'),
+                revenue=Sum(F('quantity') * F('product_price')),
+            )
+            .order_by()
+        ):
+            if row['date'] in days:
+                days[row['date']]['units'] += row['units']
+            # Rows can't be keyed on a deleted product; its sales stay in the day total
+            if row['product_id'] is None:
+                continue
+            products[(row['date'], row['product_id'])] = {
+                'product_name': row['product_name'],
+                'category_id': row['category_id'],
+                'units': row['units'],
+                'revenue': row['revenue'] or Decimal('0'),
+            }
+
+        return days, products
+
+    @staticmethod
+    def record_orders(order_ids, sign=1):
+        """
+        Add orders whose payment just completed to the rollup, or take
+        them out again with sign=-1 (refunded, or corrected in the admin)
+
+        Runs in the caller's transaction, next to the payment_status
+        change, so the rollup never drifts from the orders. Rows are
+        created with one INSERT per table and then incremented in place
+        with F() updates, which is safe with concurrent workers.
+        """
+        days, products = SalesRollupService.aggregate_orders(
+            Order.objects.filter(id__in=order_ids),
+            OrderItem.objects.filter(order_id__in=order_ids),
+        )
+        if not days:
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            DailySalesRollup.objects.bulk_create(
+                [DailySalesRollup(date=date) for date in days],
+                ignore_conflicts=True,
+            )
+            DailyProductSales.objects.bulk_create(
+                [
+                    DailyProductSales(
+                        date=date,
+                        product_id=product_id,
+                        product_name=totals['product_name'],
+                        category_id=totals['category_id'],
+                    )
+                    for (date, product_id), totals in products.items()
+                ],
+                ignore_conflicts=True,
+            )
+
+            for date, totals in days.items():
+                DailySalesRollup.objects.filter(date=date).update(
+                    orders=F('orders') + sign * totals['orders'],
+                    revenue=F('revenue') + sign * totals['revenue'],
+                    units=F('units') + sign * totals['units'],
+                    updated_at=now,
+                )
+
+            for (date, product_id), totals in products.items():
+                DailyProductSales.objects.filter(date=date, product_id=product_id).update(
+                    units=F('units') + sign * totals['units'],
+                    revenue=F('revenue') + sign * totals['revenue'],
+                    updated_at=now,
+                )
+
+    @staticmethod
+    def rebuild(start_date, end_date):
+        """
+        Recompute the rollup for dates in [start_date, end_date) from the
+        live and archived order tables
+        Returns the number of days with sales in the range
+        """
+        start = SalesRollupService.start_of_day(start_date)
+        end = SalesRollupService.start_of_day(end_date)
+
+        with transaction.atomic():
+            days, products = {}, {}
+            for order_model, item_model in [(Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)]:
+                chunk_days, chunk_products = SalesRollupService.aggregate_orders(
+                    order_model.objects.filter(
+                        payment_status='completed',
+                        created_at__gte=start,
+                        created_at__lt=end,
+                    ),
+                    item_model.objects.filter(
+                        order__payment_status='completed',
+                        order__created_at__gte=start,
+                        order__created_at__lt=end,
+                    ),
+                )
+                for date, totals in chunk_days.items():
+                    merged = days.setdefault(date, {'orders': 0, 'revenue': Decimal('0'), 'units': 0})
+                    for field, value in totals.items():
+                        merged[field] += value
+                for key, totals in chunk_products.items():
+                    if key in products:
+                        products[key]['units'] += totals['units']
+                        products[key]['revenue'] += totals['revenue']
+                    else:
+                        products[key] = totals
+
+            DailySalesRollup.objects.filter(date__gte=start_date, date__lt=end_date).delete()
+            DailyProductSales.objects.filter(date__gte=start_date, date__lt=end_date).delete()
+
+            DailySalesRollup.objects.bulk_create([
+                DailySalesRollup(date=date, **totals)
+                for date, totals in days.items()
+            ])
+            DailyProductSales.objects.bulk_create([
+                DailyProductSales(date=date, product_id=product_id, **totals)
+                for (date, product_id), totals in products.items()
+            ])
+
+        return len(days)
@@ -0,0 +1,684 @@
+# store/seeding.py
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+from .models import (
+    Category,
+    Product,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    Coupon,
+    ProductReview,
+)
+from .order_numbers import encode_base32, TIMESTAMP_CHARS, RANDOM_CHARS
+
+CATALOGUE = {
+    'Candles': ['Candle', 'Tealight Set', 'Pillar Candle', 'Wax Melt', 'Candle Holder'],
+    'Crystals': ['Amethyst Cluster', 'Rose Quartz', 'Moonstone', 'Selenite Wand', 'Crystal Set'],
+    'Herbs & Teas': ['Herbal Tea', 'Dried Lavender', 'Sage Bundle', 'Chamomile Blend', 'Tea Sampler'],
+    'Incense': ['Incense Sticks', 'Resin Cones', 'Incense Burner', 'Palo Santo', 'Smudge Kit'],
+    'Jewelry': ['Pendant', 'Bracelet', 'Ring', 'Earrings', 'Anklet'],
+    'Books': ['Moon Journal', 'Almanac', 'Tarot Guide', 'Herbal Handbook', 'Astrology Primer'],
+    'Tarot & Oracle': ['Tarot Deck', 'Oracle Cards', 'Tarot Cloth', 'Card Pouch', 'Pendulum'],
+    'Home Decor': ['Tapestry', 'Altar Bowl', 'Wall Hanging', 'Lantern', 'Dreamcatcher'],
+    'Bath & Body': ['Bath Salts', 'Body Oil', 'Soap Bar', 'Bath Bomb', 'Face Mist'],
+    'Essential Oils': ['Essential Oil', 'Oil Blend', 'Diffuser', 'Roller Set', 'Room Spray'],
+}
+ADJECTIVES = [
+    'Full Moon', 'New Moon', 'Midnight', 'Silver', 'Harvest', 'Starlit', 'Lunar',
+    'Wild', 'Golden', 'Misty', 'Velvet', 'Eclipse', 'Solstice', 'Celestial', 'Forest',
+]
+FIRST_NAMES = [
+    'Ana', 'Luis', 'Maria', 'Jose', 'Sofia', 'Carlos', 'Lucia', 'Diego', 'Elena', 'Pablo',
+    'Emma', 'Liam', 'Olivia', 'Noah', 'Ava', 'Mia', 'Lena', 'Jonas', 'Clara', 'Felix',
+    'Isabel', 'Mateo', 'Valeria', 'Daniel', 'Camila', 'Hugo', 'Julia', 'Marco', 'Nora', 'Oscar',
+]
+LAST_NAMES = [
+    'Garcia', 'Rodriguez', 'Martinez', 'Lopez', 'Gonzalez', 'Perez', 'Sanchez', 'Ramirez',
+    'Torres', 'Rivera', 'Smith', 'Johnson', 'Brown', 'Miller', 'Davis', 'Wilson', 'Mueller',
+    'Schmidt', 'Fischer', 'Weber', 'Rosa', 'Cruz', 'Ortiz', 'Morales', 'Reyes', 'Vargas',
+]
+# (city, state, first digits of the postal code)
+CITIES = [
+    ('San Juan', 'PR', '009'), ('Ponce', 'PR', '007'), ('Mayaguez', 'PR', '006'),
+    ('New York', 'NY', '100'), ('Los Angeles', 'CA', '900'), ('Chicago', 'IL', '606'),
+    ('Houston', 'TX', '770'), ('Miami', 'FL', '331'), ('Orlando', 'FL', '328'),
+    ('Seattle', 'WA', '981'), ('Denver', 'CO', '802'), ('Austin', 'TX', '787'),
+    ('Portland', 'OR', '972'), ('Boston', 'MA', '021'), ('Atlanta', 'GA', '303'),
+]
+STREETS = ['Calle Luna', 'Moon St', 'Oak Ave', 'Main St', 'Calle Sol', 'Elm St', 'Harbor Rd']
+CARRIERS = ['USPS', 'FedEx', 'UPS', 'DHL']
+REVIEW_TITLES = {
+    1: ['Disappointed', 'Not as described', 'Would not buy again'],
+    2: ['Not great', 'Expected more', 'Meh'],
+    3: ['It\'s okay', 'Decent', 'Average quality'],
+    4: ['Really nice', 'Very happy', 'Good value'],
+    5: ['Love it!', 'Perfect', 'Absolutely magical', 'Exceeded expectations'],
+}
+
+# Relative order volume by month (January first) and weekday (Monday first)
+MONTH_WEIGHTS = [0.8, 0.75, 0.85, 0.9, 0.95, 0.9, 0.85, 0.9, 0.95, 1.05, 1.4, 1.7]
+WEEKDAY_WEIGHTS = [1.0, 0.95, 0.95, 1.0, 1.05, 1.15, 1.2]
+# Relative order volume by local hour of the day
+HOUR_WEIGHTS = [
+    0.3, 0.2, 0.1, 0.1, 0.1, 0.2, 0.4, 0.7, 0.9, 1.0, 1.1, 1.2,
+    1.3, 1.2, 1.1, 1.1, 1.2, 1.3, 1.5, 1.7, 1.8, 1.6, 1.1, 0.6,
+]
+
+# Columns written by insert_rows, in tuple order
+ORDER_COLUMNS = [
+    'id', 'order_number', 'idempotency_key', 'user_id', 'email', 'first_name', 'last_name',
+    'address_line1', 'address_line2', 'city', 'state', 'postal_code', 'country', 'phone',
+    'subtotal', 'coupon_id', 'discount_amount', 'shipping_cost', 'tax', 'total',
+    'status', 'payment_status', 'stripe_payment_intent_id', 'carrier', 'tracking_number',
+    'shipped_at', 'delivered_at', 'created_at', 'updated_at',
+]
+ORDER_ITEM_COLUMNS = ['id', 'order_id', 'product_id', 'product_name', 'product_price', 'quantity']
+
+RATING_WEIGHTS = [0.04, 0.05, 0.11, 0.3, 0.5]
+SHIPPING_CENTS = 500
+TAX_RATE = 0.08
+
+
+def cents(value):
+    """Integer cents as a two-place Decimal"""
+    return Decimal(int(value)).scaleb(-2)
+
+
+def normalize(weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights / weights.sum()
+
+
+@contextmanager
+def historical_timestamps(*models):
+    """
+    Let bulk_create keep the created_at/updated_at values it is given
+    instead of overwriting them with the current time
+    """
+    fields = [
+        field
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class StoreSeeder:
+    """
+    Generates a realistic synthetic store with bulk_create
+
+    Product popularity follows a Zipf distribution and a few customers
+    place most of the orders. Order times follow growth over the period,
+    a holiday peak, busier weekends and a daily cycle. Every random draw
+    comes from one generator seeded by seed, so the same seed, counts
+    and explicit end date always produce the same data.
+    """
+    BATCH_SIZE = 5000
+
+    def __init__(self, seed=42, end=None, days=730, batch_size=None,
+                 popularity_skew=1.1, password='password', log=None):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.days = days
+        self.batch_size = batch_size or StoreSeeder.BATCH_SIZE
+        self.popularity_skew = popularity_skew
+        self.password = password
+        self.log = log or (lambda message: None)
+
+        self.end_date = end or timezone.localdate()
+        # The end of the last day. Without an explicit end the history
+        # stops at now, so nothing is created in the future; a given end
+        # is kept as is, so the same seed reproduces the same data.
+        self.end_at = timezone.make_aware(datetime.combine(self.end_date + timedelta(days=1), time.min))
+        if end is None:
+            self.end_at = min(self.end_at, timezone.now())
+        self.start_at = self.end_at - timedelta(days=days)
+        self.start_utc = np.datetime64(
+            self.start_at.astimezone(dt_timezone.utc).replace(tzinfo=None), 's'
+        )
+
+    def to_datetimes(self, seconds):
+        """Seconds since the start of the period as aware UTC datetimes"""
+        times = self.start_utc + np.asarray(seconds, dtype=np.int64).astype('timedelta64[s]')
+        return [
+            value.replace(tzinfo=dt_timezone.utc)
+            for value in times.astype('datetime64[us]').tolist()
+        ]
+
+    def insert(self, model, objects):
+        """bulk_create in batches; returns the created objects with their pks"""
+        created = []
+        for start in range(0, len(objects), self.batch_size):
+            created.extend(model.objects.bulk_create(objects[start:start + self.batch_size]))
+        return created
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def insert_rows(self, model, columns, rows):
+        """
+        INSERT plain value tuples with executemany
+        Several times faster than bulk_create for the big order tables:
+        no model instances, and only dates, decimals and UUIDs are adapted
+        """
+        fields = [model._meta.get_field(column) for column in columns]
+        quote = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        adapt = [
+            i for i, field in enumerate(fields)
+            if isinstance(field, (models.DateTimeField, models.DecimalField, models.UUIDField))
+        ]
+        if adapt:
+            # The wrapper itself; every access through the connection proxy
+            # is a thread-local lookup
+            database = connections[DEFAULT_DB_ALIAS]
+            rows = [list(row) for row in rows]
+            for i in adapt:
+                prepare = fields[i].get_db_prep_save
+                for row in rows:
+                    row[i] = prepare(row[i], database)
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def reset_sequences(self, *models):
+        """Move id sequences past the explicit ids insert_rows used"""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+    def seed_categories(self, count):
+        names = list(CATALOGUE)
+        categories = []
+        for i in range(count):
+            name = names[i % len(names)]
+            if i >= len(names):
+                name = f'{name} {i // len(names) + 1}'
+            categories.append(Category(
+                name=name,
+                slug=slugify(name),
+                description=f'Everything {name.lower()} for your next full moon',
+                created_at=self.start_at,
+            ))
+        with transaction.atomic():
+            self.categories = self.insert(Category, categories)
+        return len(self.categories)
+
+    def seed_products(self, count):
+        rng = self.rng
+        names = list(CATALOGUE)
+        category_index = rng.integers(0, len(self.categories), size=count)
+        adjectives = rng.integers(0, len(ADJECTIVES), size=count)
+        nouns = rng.integers(0, 5, size=count)
+        # Log-normal prices around $25, ending in .99
+        prices = np.maximum(np.round(rng.lognormal(3.2, 0.6, size=count)), 3) * 100 - 1
+        stock = rng.integers(6, 200, size=count)
+        stock_draw = rng.random(count)
+        stock[stock_draw < 0.08] = rng.integers(1, 6, size=int((stock_draw < 0.08).sum()))
+        stock[stock_draw < 0.03] = 0
+        available = rng.random(count) >= 0.03
+        created = rng.integers(0, max(self.days // 2, 1) * 86400, size=count)
+
+        products = []
+        for i, created_at in enumerate(self.to_datetimes(created)):
+            category = self.categories[category_index[i]]
+            noun = CATALOGUE[names[category_index[i] % len(names)]][nouns[i]]
+            name = f'{ADJECTIVES[adjectives[i]]} {noun}'
+            products.append(Product(
+                category=category,
+                name=name,
+                slug=f'{slugify(name)}-{i + 1}',
+                description=f'{name} from our {category.name.lower()} collection.',
+                short_description=f'{name}, handpicked for the {category.name.lower()} shelf',
+                price=cents(prices[i]),
+                stock=int(stock[i]),
+                is_available=bool(available[i]),
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        with transaction.atomic():
+            products = self.insert(Product, products)
+
+        self.product_ids = np.array([product.pk for product in products])
+        self.product_names = [product.name for product in products]
+        self.product_prices = prices.astype(np.int64)
+        # Zipf popularity over a random ranking of the products
+        ranks = rng.permutation(count) + 1
+        popularity = 1 / ranks ** self.popularity_skew
+        popularity[~available] *= 0.05
+        self.popularity = normalize(popularity)
+        return count
+
+    def plan_orders(self, count, user_count):
+        """Creation time (seconds into the period) and customer of every order"""
+        rng = self.rng
+        days = np.arange(self.days)
+        dates = np.datetime64(self.start_at.date()) + days
+        months = dates.astype('datetime64[M]').astype(int) % 12
+        weekdays = (dates.astype(int) + 3) % 7  # 1970-01-01 was a Thursday
+        growth = 0.4 + 0.6 * days / max(self.days - 1, 1)
+        day_weights = growth * np.take(MONTH_WEIGHTS, months) * np.take(WEEKDAY_WEIGHTS, weekdays)
+
+        order_days = rng.choice(self.days, size=count, p=normalize(day_weights))
+        order_hours = rng.choice(24, size=count, p=normalize(HOUR_WEIGHTS))
+        seconds = order_days * 86400 + order_hours * 3600 + rng.integers(0, 3600, size=count)
+        seconds.sort()
+
+        # Heavy-tailed customer activity: a few regulars, many one-off buyers
+        activity = normalize(rng.lognormal(0, 1.2, size=user_count))
+        customers = rng.choice(user_count, size=count, p=activity)
+        return seconds, customers
+
+    def seed_users(self, count, order_seconds, order_customers):
+        rng = self.rng
+        period = self.days * 86400
+        # Join before the first order, or any time for customers who never ordered
+        joined = rng.integers(0, period, size=count).astype(np.int64)
+        first_order = np.full(count, period, dtype=np.int64)
+        np.minimum.at(first_order, order_customers, order_seconds)
+        has_orders = first_order < period
+        joined[has_orders] = np.maximum(
+            first_order[has_orders] - rng.integers(0, 60 * 86400, size=int(has_orders.sum())),
+            0,
+        )
+
+        first_names = rng.integers(0, len(FIRST_NAMES), size=count)
+        last_names = rng.integers(0, len(LAST_NAMES), size=count)
+        cities = rng.integers(0, len(CITIES), size=count)
+        house_numbers = rng.integers(1, 2000, size=count)
+        streets = rng.integers(0, len(STREETS), size=count)
+        postal_suffixes = rng.integers(0, 100, size=count)
+        phones = rng.integers(2_000_000_000, 9_999_999_999, size=count)
+
+        password = make_password(self.password, salt=f'seedstore{self.seed}')
+        users = []
+        for i, date_joined in enumerate(self.to_datetimes(joined)):
+            first_name = FIRST_NAMES[first_names[i]]
+            last_name = LAST_NAMES[last_names[i]]
+            username = f'{first_name}.{last_name}{i + 1}'.lower()
+            users.append(User(
+                username=username,
+                email=f'{username}@example.com',
+                first_name=first_name,
+                last_name=last_name,
+                password=password,
+                date_joined=date_joined,
+            ))
+        with transaction.atomic():
+            users = self.insert(User, users)
+        self.user_ids = np.array([user.pk for user in users])
+        # Order contact and shipping columns, one address per customer
+        self.customers = []
+        for i, user in enumerate(users):
+            city, state, postal_prefix = CITIES[cities[i]]
+            self.customers.append((
+                user.pk,
+                user.email,
+                user.first_name,
+                user.last_name,
+                f'{house_numbers[i]} {STREETS[streets[i]]}',
+                '',
+                city,
+                state,
+                f'{postal_prefix}{postal_suffixes[i]:02d}',
+                'US',
+                str(phones[i]),
+            ))
+        return count
+
+    def seed_coupons(self, count):
+        rng = self.rng
+        period = self.days * 86400
+        starts = rng.integers(0, period, size=count)
+        lengths = rng.integers(7, 61, size=count)
+        percentage = rng.random(count) < 0.7
+        values = np.where(
+            percentage, rng.choice([5, 10, 15, 20, 25, 30], size=count),
+            rng.choice([5, 10, 15, 20], size=count),
+        )
+        minimums = rng.choice([0, 0, 25, 50], size=count)
+
+        start_days = starts // 86400
+        coupons = []
+        for i, start in enumerate(self.to_datetimes(starts)):
+            valid_from = self.start_at.date() + timedelta(days=int(start_days[i]))
+            kind = 'percentage' if percentage[i] else 'fixed'
+            coupons.append(Coupon(
+                code=f'{"MOON" if percentage[i] else "SAVE"}{values[i]}-{i + 1:04d}',
+                description=f'{values[i]}% off' if percentage[i] else f'${values[i]} off',
+                discount_type=kind,
+                discount_value=Decimal(int(values[i])),
+                valid_from=valid_from,
+                valid_until=valid_from + timedelta(days=int(lengths[i])),
+                max_uses=1000,
+                minimum_purchase=Decimal(int(minimums[i])),
+                created_at=start,
+                updated_at=start,
+            ))
+        with transaction.atomic():
+            self.coupons = self.insert(Coupon, coupons)
+
+        self.coupon_percentage = percentage
+        self.coupon_values = values.astype(np.int64)
+        self.coupon_minimums = minimums.astype(np.int64) * 100
+        # Per day of the period, the coupons valid that day first
+        days = np.arange(self.days)[:, None]
+        valid = (start_days <= days) & (days <= start_days + lengths)
+        self.coupons_valid = valid.sum(axis=1)
+        self.coupons_by_day = np.argsort(~valid, axis=1, kind='stable')
+        self.coupon_uses = np.zeros(count, dtype=np.int64)
+        return count
+
+    def build_items(self, count):
+        """
+        Line items for count orders: (order index, product index, quantity)
+        A product drawn twice for one order becomes a higher quantity
+        """
+        rng = self.rng
+        lines = 1 + np.minimum(rng.poisson(0.9, size=count), 7)
+        orders = np.repeat(np.arange(count), lines)
+        products = rng.choice(len(self.product_ids), size=len(orders), p=self.popularity)
+        keys, quantities = np.unique(orders * len(self.product_ids) + products, return_counts=True)
+        extra = rng.random(len(keys)) < 0.15
+        quantities[extra] += rng.geometric(0.6, size=int(extra.sum()))
+        return keys // len(self.product_ids), keys % len(self.product_ids), quantities
+
+    def build_statuses(self, age_days):
+        """Order and payment status, and shipping delays, by order age"""
+        rng = self.rng
+        count = len(age_days)
+        draw = rng.random(count)
+        payment = np.full(count, 'completed', dtype=object)
+        payment[draw < 0.08] = 'pending'
+        payment[draw < 0.05] = 'failed'
+        payment[draw < 0.02] = 'refunded'
+
+        ship_days = rng.integers(1, 4, size=count)
+        delivery_days = ship_days + rng.integers(2, 7, size=count)
+        status = np.full(count, 'delivered', dtype=object)
+        status[age_days < delivery_days] = 'shipped'
+        status[age_days < ship_days] = 'processing'
+        # Unpaid checkouts from the last day haven't been released yet; older
+        # ones were, which fails the payment and cancels the order (and puts
+        # the stock back, so release_stale_orders has nothing left to do)
+        unpaid = np.isin(payment, ['pending', 'failed'])
+        payment[unpaid] = np.where(age_days[unpaid] < 1, 'pending', 'failed')
+        status[payment != 'completed'] = 'cancelled'
+        status[payment == 'pending'] = 'pending'
+        return status, payment, ship_days, delivery_days
+
+    def seed_orders(self, order_seconds, order_customers, review_share=0.0):
+        rng = self.rng
+        period = self.days * 86400
+        self.review_candidates = []
+        total_items = 0
+        next_order_id = self.next_id(Order)
+        next_item_id = self.next_id(OrderItem)
+        coupon_ids = [coupon.pk for coupon in self.coupons]
+        product_ids = self.product_ids.tolist()
+        product_prices = [cents(price) for price in self.product_prices.tolist()]
+        shipping = cents(SHIPPING_CENTS)
+
+        for start in range(0, len(order_seconds), self.batch_size):
+            seconds = order_seconds[start:start + self.batch_size]
+            customers = order_customers[start:start + self.batch_size]
+            count = len(seconds)
+            order_ids = np.arange(next_order_id, next_order_id + count)
+            next_order_id += count
+
+            item_orders, item_products, quantities = self.build_items(count)
+            subtotals = np.bincount(
+                item_orders,
+                weights=self.product_prices[item_products] * quantities,
+                minlength=count,
+            ).astype(np.int64)
+
+            discounts, coupon_index = self.apply_coupons(seconds, subtotals)
+            taxes = np.round(subtotals * TAX_RATE).astype(np.int64)
+            totals = subtotals - discounts + SHIPPING_CENTS + taxes
+
+            age_days = (period - seconds) / 86400
+            status, payment, ship_days, delivery_days = self.build_statuses(age_days)
+            created = self.to_datetimes(seconds)
+            shipped = self.to_datetimes(np.minimum(
+                seconds + ship_days * 86400 + rng.integers(0, 86400, size=count), period - 1
+            ))
+            delivered_seconds = np.minimum(
+                seconds + delivery_days * 86400 + rng.integers(0, 86400, size=count), period - 1
+            )
+            delivered = self.to_datetimes(delivered_seconds)
+            carriers = rng.integers(0, len(CARRIERS), size=count).tolist()
+            tracking = rng.integers(10 ** 11, 10 ** 12, size=count).tolist()
+            random_parts = rng.integers(0, 2 ** 40, size=(count, 2)).tolist()
+            keys = rng.bytes(16 * count)
+
+            orders = []
+            for i, (user, coupon) in enumerate(zip(customers.tolist(), coupon_index.tolist())):
+                created_at = created[i]
+                was_shipped = status[i] in ('shipped', 'delivered')
+                shipped_at = shipped[i] if was_shipped else None
+                delivered_at = delivered[i] if status[i] == 'delivered' else None
+                suffix = (
+                    encode_base32(int(created_at.timestamp() * 1000), TIMESTAMP_CHARS)
+                    + encode_base32((random_parts[i][0] << 40) | random_parts[i][1], RANDOM_CHARS)
+                )
+                carrier = CARRIERS[carriers[i]]
+                orders.append((
+                    int(order_ids[i]),
+                    f"ORD-{timezone.localtime(created_at):%Y%m%d}-{suffix}",
+                    uuid.UUID(bytes=keys[16 * i:16 * i + 16], version=4),
+                    *self.customers[user],
+                    cents(subtotals[i]),
+                    coupon_ids[coupon] if coupon >= 0 else None,
+                    cents(discounts[i]),
+                    shipping,
+                    cents(taxes[i]),
+                    cents(totals[i]),
+                    status[i],
+                    payment[i],
+                    f'cs_test_{suffix.lower()}',
+                    carrier if was_shipped else '',
+                    f'{carrier[:2].upper()}{tracking[i]}' if was_shipped else '',
+                    shipped_at,
+                    delivered_at,
+                    created_at,
+                    delivered_at or shipped_at or created_at,
+                ))
+
+            items = [
+                (next_item_id + i, int(order_ids[order]), product_ids[product],
+                 self.product_names[product], product_prices[product], quantity)
+                for i, (order, product, quantity) in enumerate(zip(
+                    item_orders.tolist(), item_products.tolist(), quantities.tolist()
+                ))
+            ]
+            next_item_id += len(items)
+
+            with transaction.atomic():
+                self.insert_rows(Order, ORDER_COLUMNS, orders)
+                self.insert_rows(OrderItem, ORDER_ITEM_COLUMNS, items)
+
+            total_items += len(items)
+            if review_share:
+                # Only delivered orders can be reviewed
+                keep = (rng.random(len(item_orders)) < review_share) & (
+                    status[item_orders] == 'delivered'
+                )
+                self.review_candidates.append(np.stack([
+                    customers[item_orders[keep]],
+                    item_products[keep],
+                    order_ids[item_orders[keep]],
+                    delivered_seconds[item_orders[keep]],
+                ], axis=1))
+            self.log(f'  → {start + count:,} order(s), {total_items:,} item(s)')
+
+        self.reset_sequences(Order, OrderItem)
+        if self.coupons:
+            for coupon, uses in zip(self.coupons, self.coupon_uses.tolist()):
+                coupon.times_used = uses
+                coupon.max_uses = max(uses, coupon.max_uses)
+                coupon.is_active = coupon.valid_until >= self.end_date
+            with transaction.atomic():
+                Coupon.objects.bulk_update(
+                    self.coupons, ['times_used', 'max_uses', 'is_active'], batch_size=self.batch_size
+                )
+        return total_items
+
+    def apply_coupons(self, seconds, subtotals):
+        """Discount in cents and coupon index (-1 for none) per order"""
+        count = len(seconds)
+        discounts = np.zeros(count, dtype=np.int64)
+        chosen = np.full(count, -1)
+        if not self.coupons:
+            return discounts, chosen
+
+        rng = self.rng
+        days = seconds // 86400
+        available = self.coupons_valid[days]
+        # A fifth of the customers look for a coupon and take one valid that day
+        picks = self.coupons_by_day[days, (rng.random(count) * available).astype(np.int64)]
+        valid = (
+            (rng.random(count) < 0.2)
+            & (available > 0)
+            & (subtotals >= self.coupon_minimums[picks])
+        )
+        chosen[valid] = picks[valid]
+        values = self.coupon_values[picks]
+        discounts = np.where(
+            self.coupon_percentage[picks],
+            np.round(subtotals * values / 100),
+            np.minimum(values * 100, subtotals),
+        ).astype(np.int64)
+        discounts[~valid] = 0
+        np.add.at(self.coupon_uses, picks[valid], 1)
+        return discounts, chosen
+
+    def seed_reviews(self, count):
+        if not self.review_candidates or not count:
+            return 0
+        rng = self.rng
+        candidates = np.concatenate(self.review_candidates)
+        # One review per customer and product
+        _, first = np.unique(
+            candidates[:, 1] * len(self.user_ids) + candidates[:, 0], return_index=True
+        )
+        candidates = candidates[first]
+        if len(candidates) > count:
+            candidates = candidates[np.sort(rng.choice(len(candidates), size=count, replace=False))]
+
+        count = len(candidates)
+        ratings = rng.choice(5, size=count, p=RATING_WEIGHTS) + 1
+        approved = rng.random(count) < 0.85
+        titles = rng.integers(0, 3, size=count)
+        period = self.days * 86400
+        written = np.minimum(
+            candidates[:, 3] + rng.integers(0, 30 * 86400, size=count), period - 1
+        )
+
+        reviews = []
+        for i, created_at in enumerate(self.to_datetimes(written)):
+            user, product, order_id = candidates[i, :3]
+            rating = int(ratings[i])
+            reviews.append(ProductReview(
+                product_id=int(self.product_ids[product]),
+                user_id=int(self.user_ids[user]),
+                order_id=int(order_id),
+                rating=rating,
+                title=REVIEW_TITLES[rating][titles[i] % len(REVIEW_TITLES[rating])],
+                comment=f'{rating} out of 5. {self.product_names[product]} arrived as shown.',
+                is_approved=bool(approved[i]),
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        with historical_timestamps(ProductReview), transaction.atomic():
+            self.insert(ProductReview, reviews)
+        return count
+
+    def seed_carts(self, count):
+        """Open carts for count customers, added to over the last two weeks"""
+        count = min(count, len(self.user_ids))
+        if not count:
+            return 0, 0
+        rng = self.rng
+        period = self.days * 86400
+        owners = rng.choice(len(self.user_ids), size=count, replace=False)
+        lines = rng.integers(1, 5, size=count)
+        products = rng.choice(len(self.product_ids), size=int(lines.sum()), p=self.popularity)
+        keys = np.unique(np.repeat(np.arange(count), lines) * len(self.product_ids) + products)
+        cart_index = keys // len(self.product_ids)
+        added = period - rng.integers(1, 14 * 86400, size=len(keys))
+        quantities = 1 + (rng.random(len(keys)) < 0.2)
+        opened = np.full(count, period, dtype=np.int64)
+        np.minimum.at(opened, cart_index, added)
+        changed = np.zeros(count, dtype=np.int64)
+        np.maximum.at(changed, cart_index, added)
+
+        with historical_timestamps(Cart, CartItem), transaction.atomic():
+            carts = self.insert(Cart, [
+                Cart(user_id=int(self.user_ids[owner]), created_at=created_at, updated_at=updated_at)
+                for owner, created_at, updated_at in zip(
+                    owners.tolist(), self.to_datetimes(opened), self.to_datetimes(changed)
+                )
+            ])
+            self.insert(CartItem, [
+                CartItem(
+                    cart_id=carts[cart].pk,
+                    product_id=int(self.product_ids[key % len(self.product_ids)]),
+                    quantity=quantity,
+                    added_at=added_at,
+                )
+                for cart, key, quantity, added_at in zip(
+                    cart_index.tolist(), keys.tolist(), quantities.tolist(), self.to_datetimes(added)
+                )
+            ])
+        return count, len(keys)
+
+    def run(self, categories, products, users, orders, coupons, reviews, carts):
+        """Seed everything; returns the number of rows created per model"""
+        counts = {}
+        with historical_timestamps(Category, Product, Coupon):
+            counts['categories'] = self.seed_categories(max(categories, 1))
+            self.log(f'  → {counts["categories"]:,} categories')
+            counts['products'] = self.seed_products(max(products, 1))
+            self.log(f'  → {counts["products"]:,} products')
+
+            order_seconds, order_customers = self.plan_orders(orders, max(users, 1))
+            counts['users'] = self.seed_users(max(users, 1), order_seconds, order_customers)
+            self.log(f'  → {counts["users"]:,} users')
+            counts['coupons'] = self.seed_coupons(coupons)
+            self.log(f'  → {counts["coupons"]:,} coupons')
+
+        # Keep a few times more review candidates than needed, then sample
+        expected_items = orders * 2.0
+        review_share = min(1.0, 3 * reviews / expected_items) if expected_items else 0
+        counts['orders'] = orders
+        counts['order_items'] = self.seed_orders(order_seconds, order_customers, review_share)
+        counts['reviews'] = self.seed_reviews(reviews)
+        self.log(f'  → {counts["reviews"]:,} reviews')
+        counts['carts'], counts['cart_items'] = self.seed_carts(carts)
+        self.log(f'  → {counts["carts"]:,} carts')
+        return counts
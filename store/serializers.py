@@ -2,8 +2,9 @@ from rest_framework import serializers
 from .models import Category, Product, Cart, CartItem, Order, OrderItem, Coupon, ProductReview
 from django.contrib.auth.models import User
 from decimal import Decimal
+from .instrumentation import TimedSerializerMixin
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Category model
     Converts Category objects to/from JSON
@@ -23,7 +24,7 @@ class CategorySerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Product model
     """
@@ -58,7 +59,7 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for CartItem model
     """
@@ -108,7 +109,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         
         return data
     
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Cart model
     Now includes total, shipping_cost, and discount_amount for frontend calculations
@@ -176,7 +177,7 @@ class CartSerializer(serializers.ModelSerializer):
         discount = self.get_discount_amount(obj)
         return subtotal + shipping - discount
     
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for OrderItem model
     """
@@ -205,7 +206,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
             return obj.product.image.url
         return obj.product_image
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Order model
     """
@@ -258,7 +259,33 @@ class OrderSerializer(serializers.ModelSerializer):
         """Return coupon code if exists"""
         return obj.coupon.code if obj.coupon else None
 
-class UserSerializer(serializers.ModelSerializer):
+class OrderSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Lightweight serializer for the order history list (?summary=1)
+    Item counts come from queryset annotations, not from loading items
+    """
+    item_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            'id',
+            'order_number',
+            'subtotal',
+            'discount_amount',
+            'shipping_cost',
+            'tax',
+            'total',
+            'status',
+            'payment_status',
+            'item_count',
+            'total_quantity',
+            'created_at',
+        ]
+        read_only_fields = fields
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for User model
     """
@@ -284,7 +311,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class CouponSerializer(serializers.ModelSerializer):
+class CouponSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Coupon model
     """
@@ -310,7 +337,7 @@ class CouponSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['times_used']
 
-class ProductReviewSerializer(serializers.ModelSerializer):
+class ProductReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for ProductReview model
     """
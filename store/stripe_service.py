@@ -1,6 +1,7 @@
 import stripe
 from django.conf import settings
 from decimal import Decimal
+from .instrumentation import timed
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -26,15 +27,16 @@ class StripeService:
             amount_cents = int(order.total * 100)
 
             # Create payment intent with idempotency key for safety
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency="usd",
-                metadata={
-                    "order_number": order.order_number,
-                    "order_id": order.id,
-                },
-                idempotency_key=str(order.idempotency_key),
-            )
+            with timed("stripe"):
+                intent = stripe.PaymentIntent.create(
+                    amount=amount_cents,
+                    currency="usd",
+                    metadata={
+                        "order_number": order.order_number,
+                        "order_id": order.id,
+                    },
+                    idempotency_key=str(order.idempotency_key),
+                )
 
             return intent
         
@@ -99,20 +101,21 @@ class StripeService:
                 })
 
             # Create checkout session
-            session = stripe.checkout.Session.create(
-                payment_method_types=["card"],
-                line_items=line_items,
-                mode="payment",
-                success_url=success_url,
-                cancel_url=cancel_url,
-                client_reference_id=str(order.id),
-                metadata={
-                    "order_number": order.order_number,
-                    "order_id": order.id,
-                },
-                idempotency_key=str(order.idempotency_key),
+            with timed("stripe"):
+                session = stripe.checkout.Session.create(
+                    payment_method_types=["card"],
+                    line_items=line_items,
+                    mode="payment",
+                    success_url=success_url,
+                    cancel_url=cancel_url,
+                    client_reference_id=str(order.id),
+                    metadata={
+                        "order_number": order.order_number,
+                        "order_id": order.id,
+                    },
+                    idempotency_key=str(order.idempotency_key),
 
-            )
+                )
             return session
         
         except stripe.error.StripeError as e:
@@ -130,7 +133,8 @@ class StripeService:
             Payment Intent object
         """
         try:
-            return stripe.PaymentIntent.retrieve(payment_intent_id)
+            with timed("stripe"):
+                return stripe.PaymentIntent.retrieve(payment_intent_id)
         except stripe.error.StripeError as e:
             raise Exception(f"Stripe error: {str(e)}")
         
@@ -146,6 +150,7 @@ class StripeService:
             Checkout Session object
         """
         try:
-            return stripe.checkout.Session.retrieve(session_id)
+            with timed("stripe"):
+                return stripe.checkout.Session.retrieve(session_id)
         except stripe.error.StripeError as e:
             raise Exception(f"Stripe error: {str(e)}")
@@ -1,3 +1,1633 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from .analytics import AnalyticsService
+from .analytics_cache import AnalyticsCache
+from .archive import ArchiveService
+from .benchmarking import quiet_request_logs
+from .cohorts import CohortService
+from .email_service import EmailService
+from .exports import ExportService
+from .fulfillment import FulfillmentService
+from .instrumentation import PerformanceMiddleware
+from .inventory import InventoryService
+from .loadtest import SHIPPING_ADDRESS, Journeys, fake_checkout_session
+from .metrics import MetricsService
+from .order_numbers import CROCKFORD_ALPHABET, OrderNumberGenerator
+from .rollups import SalesRollupService
+from .seeding import StoreSeeder
+from .timeseries import TimeSeriesService
+from .webhooks import WebhookService
+from .models import (
+    Category,
+    Product,
+    Cart,
+    CartItem,
+    Coupon,
+    Order,
+    OrderItem,
+    StripeObjectLink,
+    StripeEvent,
+    OutboxEmail,
+    ProductReview,
+    ArchivedOrder,
+    ArchivedOrderItem,
+    DailySalesRollup,
+    DailyProductSales,
+    CustomerCohort,
+)
+
+
+def create_order(user=None, **fields):
+    defaults = {
+        'email': 'reader@example.com',
+        'first_name': 'Ana',
+        'last_name': 'Reader',
+        'address_line1': '1 Test St',
+        'city': 'Testville',
+        'state': 'TS',
+        'postal_code': '00000',
+        'phone': '555-0000',
+        'subtotal': Decimal('20.00'),
+        'total': Decimal('20.00'),
+    }
+    defaults.update(fields)
+    return Order.objects.create(user=user, **defaults)
+
+
+class OrderNumberTests(SimpleTestCase):
+    """Order numbers are unique and sort in creation order"""
+
+    def test_numbers_are_unique_and_increasing(self):
+        generator = OrderNumberGenerator()
+        numbers = [generator.new_order_number() for _ in range(5000)]
+
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(numbers, sorted(numbers))
+        pattern = re.compile(rf'^ORD-\d{{8}}-[{CROCKFORD_ALPHABET}]{{26}}$')
+        for number in numbers[:10]:
+            self.assertRegex(number, pattern)
+
+    def test_same_millisecond_and_clock_going_back_stay_increasing(self):
+        generator = OrderNumberGenerator()
+        now_ns = time.time_ns()
+        with mock.patch('store.order_numbers.time.time_ns', return_value=now_ns):
+            same_ms = [generator.new_order_number() for _ in range(100)]
+        with mock.patch('store.order_numbers.time.time_ns', return_value=now_ns - 10 ** 9):
+            earlier_clock = generator.new_order_number()
+        with mock.patch('store.order_numbers.time.time_ns', return_value=now_ns + 10 ** 6):
+            next_ms = generator.new_order_number()
+
+        numbers = same_ms + [earlier_clock, next_ms]
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(numbers, sorted(numbers))
+
+    def test_later_numbers_sort_after_earlier_ones_across_generators(self):
+        # Separate processes share no state; the timestamp alone orders them
+        now_ns = time.time_ns()
+        with mock.patch('store.order_numbers.time.time_ns', return_value=now_ns):
+            first = OrderNumberGenerator().new_order_number()
+        with mock.patch('store.order_numbers.time.time_ns', return_value=now_ns + 10 ** 6):
+            second = OrderNumberGenerator().new_order_number()
+        self.assertLess(first, second)
+
+
+# Sections run inline: worker threads would use their own connections,
+# which neither see the test transaction nor count towards assertNumQueries
+@override_settings(ANALYTICS_DASHBOARD_WORKERS=0)
+class AnalyticsQueryCountTests(TestCase):
+    """The dashboard is built from a fixed number of aggregate queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.alice = User.objects.create_user(username='alice')
+        cls.bob = User.objects.create_user(username='bob')
+        cls.carol = User.objects.create_user(username='carol')
+        User.objects.create_user(username='staff', is_staff=True)
+        User.objects.filter(id=cls.carol.id).update(date_joined=now - timedelta(days=90))
+
+        category = Category.objects.create(name='Books', slug='books')
+        cls.book = Product.objects.create(
+            category=category, name='Book', slug='book',
+            description='A book', price=Decimal('10.00'), stock=3,
+        )
+        Product.objects.create(
+            category=category, name='Map', slug='map',
+            description='A map', price=Decimal('5.00'), stock=0,
+        )
+
+        paid_today = create_order(cls.alice, payment_status='completed', status='processing')
+        paid_last_week = create_order(
+            cls.alice, payment_status='completed', status='delivered', total=Decimal('30.00')
+        )
+        Order.objects.filter(id=paid_last_week.id).update(created_at=now - timedelta(days=10))
+        create_order(cls.bob, payment_status='pending')
+        for order in [paid_today, paid_last_week]:
+            OrderItem.objects.create(
+                order=order, product=cls.book, product_name='Book',
+                product_price=Decimal('10.00'), quantity=2,
+            )
+
+        archived = ArchivedOrder.objects.create(
+            id=999, user=cls.carol, order_number='ORD-OLD-1', email='carol@example.com',
+            first_name='Carol', last_name='Reader', address_line1='1 Test St',
+            city='Testville', state='TS', postal_code='00000', phone='555-0000',
+            subtotal=Decimal('50.00'), total=Decimal('50.00'),
+            status='delivered', payment_status='completed',
+            created_at=now - timedelta(days=400), updated_at=now - timedelta(days=400),
+        )
+        ArchivedOrderItem.objects.create(
+            id=999, order=archived, product=cls.book, product_name='Book',
+            product_price=Decimal('10.00'), quantity=5,
+        )
+
+        ProductReview.objects.create(
+            product=cls.book, user=cls.alice, rating=5, title='Great', comment='...', is_approved=True
+        )
+        ProductReview.objects.create(
+            product=cls.book, user=cls.bob, rating=2, title='Meh', comment='...'
+        )
+
+        today = timezone.localdate()
+        SalesRollupService.rebuild(today - timedelta(days=500), today + timedelta(days=1))
+
+    def test_dashboard_query_count(self):
+        with self.assertNumQueries(7):
+            AnalyticsService.get_complete_dashboard()
+
+    def test_dashboard_with_archive_query_count(self):
+        # Only the status breakdowns read the archive table
+        with self.assertNumQueries(8):
+            AnalyticsService.get_complete_dashboard(include_archived=True)
+
+    def request_queries(self, path, data=None):
+        """Queries run by one staff API request, with the session and user lookups"""
+        self.client.force_login(User.objects.get(username='staff'))
+        with CaptureQueriesContext(connection) as queries, quiet_request_logs():
+            response = self.client.get(path, data)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_analytics_endpoint_query_counts(self):
+        cache.clear()
+        counts = {
+            'sales': self.request_queries('/api/analytics/sales/'),
+            'dashboard': self.request_queries('/api/analytics/dashboard/'),
+            'archived dashboard': self.request_queries('/api/analytics/dashboard/', {'include_archived': 1}),
+        }
+        self.assertEqual(counts, {'sales': 3, 'dashboard': 9, 'archived dashboard': 10})
+
+        # More orders, customers and reviews: still the same queries
+        for i in range(20):
+            user = User.objects.create_user(username=f'customer-{i}')
+            order = create_order(user, payment_status='completed', status='delivered')
+            OrderItem.objects.create(
+                order=order, product=self.book, product_name='Book',
+                product_price=Decimal('10.00'), quantity=1,
+            )
+            ProductReview.objects.create(
+                product=self.book, user=user, rating=4, title='Good', comment='...', is_approved=True
+            )
+        cache.clear()
+        self.assertEqual(counts, {
+            'sales': self.request_queries('/api/analytics/sales/'),
+            'dashboard': self.request_queries('/api/analytics/dashboard/'),
+            'archived dashboard': self.request_queries('/api/analytics/dashboard/', {'include_archived': 1}),
+        })
+
+    def test_cached_dashboard_is_a_cache_read(self):
+        cache.clear()
+        first = AnalyticsCache.get_dashboard()
+
+        with self.assertNumQueries(0):
+            second = AnalyticsCache.get_dashboard()
+
+        self.assertEqual(first, second)
+        self.assertEqual(second['sales_overview']['total_orders'], 3)
+        self.assertIsNotNone(second['computed_at'])
+
+    def test_sales_overview_is_one_query(self):
+        with self.assertNumQueries(1):
+            overview = AnalyticsService.get_sales_overview()
+
+        # The rollup covers archived orders too
+        self.assertEqual(overview['total_orders'], 3)
+        self.assertEqual(overview['orders_today'], 1)
+        self.assertEqual(overview['orders_this_week'], 1)
+        self.assertEqual(overview['orders_this_month'], 2)
+        self.assertEqual(overview['total_revenue'], 100.0)
+        self.assertEqual(overview['revenue_today'], 20.0)
+        self.assertEqual(overview['revenue_this_month'], 50.0)
+
+    def test_top_products_and_daily_sales(self):
+        self.assertEqual(
+            [(row['product_name'], row['total_sold']) for row in AnalyticsService.get_top_products()],
+            [('Book', 9)],
+        )
+        daily = AnalyticsService.get_daily_sales(30)
+        self.assertEqual([row['orders'] for row in daily], [1, 1])
+        self.assertEqual(daily[-1]['date'], timezone.localdate())
+
+    def test_status_breakdowns(self):
+        self.assertEqual(
+            AnalyticsService.get_order_status_breakdown(),
+            {'delivered': 1, 'pending': 1, 'processing': 1},
+        )
+        self.assertEqual(
+            AnalyticsService.get_payment_status_breakdown(include_archived=True),
+            {'completed': 3, 'pending': 1},
+        )
+
+    def test_customer_statistics(self):
+        with self.assertNumQueries(1):
+            stats = AnalyticsService.get_customer_statistics()
+
+        self.assertEqual(stats, {
+            'total_customers': 3,
+            'customers_with_orders': 1,
+            'new_customers_this_month': 2,
+        })
+        archived_stats = AnalyticsService.get_customer_statistics(include_archived=True)
+        self.assertEqual(archived_stats['customers_with_orders'], 2)
+
+    def test_inventory_and_review_statistics(self):
+        with self.assertNumQueries(2):
+            inventory = AnalyticsService.get_inventory_alerts()
+            reviews = AnalyticsService.get_review_statistics()
+
+        self.assertEqual(inventory, {'low_stock_count': 1, 'out_of_stock_count': 1})
+        self.assertEqual(reviews, {
+            'total_reviews': 2,
+            'approved_reviews': 1,
+            'pending_reviews': 1,
+            'average_rating': 5.0,
+        })
+
+
+class ArchiveTests(TestCase):
+    """Archiving moves an order with everything that points at it"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader')
+        category = Category.objects.create(name='Books', slug='books')
+        self.book = Product.objects.create(
+            category=category, name='Book', slug='book',
+            description='A book', price=Decimal('10.00'), stock=3,
+        )
+
+    def create_delivered_order(self, session_id='cs_test_old'):
+        order = create_order(self.user, status='delivered', payment_status='completed')
+        OrderItem.objects.create(
+            order=order, product=self.book, product_name='Book',
+            product_price=Decimal('10.00'), quantity=2,
+        )
+        StripeObjectLink.objects.create(stripe_id=session_id, order=order)
+        OutboxEmail.objects.create(
+            message_type='order_delivered', recipient=order.email, order=order, status='sent',
+        )
+        return order
+
+    def archive(self):
+        return ArchiveService.archive_batch(timezone.now() + timedelta(seconds=1))
+
+    def test_archived_order_is_found_by_session(self):
+        order = self.create_delivered_order()
+        self.assertEqual(self.archive(), 1)
+
+        self.assertFalse(Order.objects.filter(id=order.id).exists())
+        link = StripeObjectLink.objects.get(stripe_id='cs_test_old')
+        self.assertIsNone(link.order_id)
+        self.assertEqual(link.linked_order, ArchivedOrder.objects.get(id=order.id))
+        self.assertEqual(OutboxEmail.objects.get().archived_order_id, order.id)
+
+        self.client.force_login(self.user)
+        with quiet_request_logs():
+            response = self.client.get('/api/orders/by-session/cs_test_old/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order_number'], order.order_number)
+
+        other = User.objects.create_user(username='other')
+        self.client.force_login(other)
+        with quiet_request_logs():
+            response = self.client.get('/api/orders/by-session/cs_test_old/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_archive_moves_orders_and_items_in_batches(self):
+        orders = [self.create_delivered_order(f'cs_test_{i}') for i in range(3)]
+        still_open = create_order(self.user, status='processing')
+        reviewed = create_order(self.user, status='delivered')
+        ProductReview.objects.create(
+            product=self.book, user=self.user, order=reviewed, rating=5, title='Great', comment='...'
+        )
+        expected = {
+            order.id: list(order.items.values_list('product_name', 'product_price', 'quantity'))
+            for order in orders
+        }
+
+        cutoff = timezone.now() + timedelta(seconds=1)
+        self.assertEqual(ArchiveService.archive_batch(cutoff, batch_size=2), 2)
+        self.assertEqual(ArchiveService.archive_batch(cutoff, batch_size=2), 1)
+        self.assertEqual(ArchiveService.archive_batch(cutoff, batch_size=2), 0)
+
+        self.assertEqual(
+            set(Order.objects.values_list('id', flat=True)), {still_open.id, reviewed.id}
+        )
+        self.assertFalse(OrderItem.objects.filter(order_id__in=expected).exists())
+        for order in orders:
+            archived = ArchivedOrder.objects.get(id=order.id)
+            self.assertEqual(archived.order_number, order.order_number)
+            self.assertEqual(archived.created_at, order.created_at)
+            self.assertEqual(
+                list(archived.items.values_list('product_name', 'product_price', 'quantity')),
+                expected[order.id],
+            )
+
+    def test_include_archived_pages_through_live_then_archived(self):
+        for i in range(20):
+            self.create_delivered_order(f'cs_test_{i}')
+        self.archive()
+        live = [create_order(self.user).id for _ in range(25)]
+        archived = list(ArchivedOrder.objects.values_list('id', flat=True))
+
+        self.client.force_login(self.user)
+        pages = []
+        with quiet_request_logs():
+            for page in (1, 2, 3):
+                response = self.client.get('/api/orders/', {'include_archived': 1, 'page': page})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['count'], 45)
+                pages.append([order['id'] for order in response.json()['results']])
+            self.assertEqual(
+                self.client.get('/api/orders/', {'include_archived': 1, 'page': 4}).status_code, 404
+            )
+
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        ids = [order_id for page in pages for order_id in page]
+        # Live orders first, then the archive, each exactly once
+        self.assertEqual(set(ids[:25]), set(live))
+        self.assertEqual(set(ids[25:]), set(archived))
+        self.assertEqual(len(set(ids)), 45)
+
+    def test_links_point_at_one_order(self):
+        order = self.create_delivered_order()
+        self.archive()
+        archived = ArchivedOrder.objects.get(id=order.id)
+        live = create_order(self.user)
+
+        for model, fields in [
+            (StripeObjectLink, {'stripe_id': 'cs_test_orphan'}),
+            (StripeObjectLink, {'stripe_id': 'cs_test_both', 'order': live, 'archived_order': archived}),
+            (OutboxEmail, {'message_type': 'order_delivered', 'order': live, 'archived_order': archived}),
+        ]:
+            with self.subTest(model=model.__name__, fields=sorted(fields)):
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    model.objects.create(**fields)
+        # Emails that aren't about an order are fine
+        OutboxEmail.objects.create(message_type='low_stock_alert', recipient='admin@example.com')
+
+    def test_late_webhook_for_archived_order_changes_nothing(self):
+        order = self.create_delivered_order()
+        self.archive()
+
+        with self.assertLogs('store.webhooks') as logs:
+            WebhookService.handle_checkout_expired({'id': 'cs_test_old', 'client_reference_id': str(order.id)})
+
+        self.assertIn('is archived, ignoring late expiry event', logs.output[0])
+
+        self.assertEqual(ArchivedOrder.objects.get(id=order.id).status, 'delivered')
+        self.assertEqual(Product.objects.get(id=self.book.id).stock, 3)
+
+
+class ReleaseStaleOrdersTests(TestCase):
+    """Abandoned pending orders give their stock back, exactly once"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Books', slug='books')
+        self.book = Product.objects.create(
+            category=category, name='Book', slug='book', description='A book', price=Decimal('10.00'), stock=5,
+        )
+        self.map = Product.objects.create(
+            category=category, name='Map', slug='map', description='A map', price=Decimal('5.00'), stock=1,
+        )
+        long_ago = timezone.now() - timedelta(days=2)
+        self.stale = self.order_with_items(payment_status='pending', created_at=long_ago)
+        self.fresh = self.order_with_items(payment_status='pending')
+        self.paid = self.order_with_items(payment_status='completed', status='processing', created_at=long_ago)
+
+    def order_with_items(self, created_at=None, **fields):
+        order = create_order(**fields)
+        for product, quantity in [(self.book, 2), (self.map, 3)]:
+            OrderItem.objects.create(
+                order=order, product=product, product_name=product.name,
+                product_price=product.price, quantity=quantity,
+            )
+        if created_at:
+            Order.objects.filter(id=order.id).update(created_at=created_at)
+        return order
+
+    def stock(self):
+        return dict(Product.objects.values_list('slug', 'stock'))
+
+    def test_stale_orders_are_released_once(self):
+        call_command('release_stale_orders', stdout=StringIO())
+
+        self.assertEqual(self.stock(), {'book': 7, 'map': 4})
+        self.stale.refresh_from_db()
+        self.assertEqual((self.stale.status, self.stale.payment_status), ('cancelled', 'failed'))
+        self.assertEqual(Order.objects.get(id=self.fresh.id).payment_status, 'pending')
+        self.assertEqual(Order.objects.get(id=self.paid.id).status, 'processing')
+
+        # Running again, or Stripe expiring the session afterwards, restores nothing
+        call_command('release_stale_orders', stdout=StringIO())
+        StripeObjectLink.objects.create(stripe_id='cs_test_stale', order=self.stale)
+        with self.assertNoLogs('store.webhooks'):
+            WebhookService.handle_checkout_expired({'id': 'cs_test_stale'})
+        self.assertEqual(InventoryService.release_orders([self.stale.id]), 0)
+        self.assertEqual(self.stock(), {'book': 7, 'map': 4})
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('release_stale_orders', '--dry-run', stdout=out)
+
+        self.assertIn('1 pending order(s) would be released', out.getvalue())
+        self.assertEqual(self.stock(), {'book': 5, 'map': 1})
+        self.assertEqual(Order.objects.get(id=self.stale.id).payment_status, 'pending')
+
+
+class FulfillmentTests(TestCase):
+    """Bulk shipped/delivered transitions are set-based and email once per order"""
+
+    def setUp(self):
+        self.shipped_earlier = timezone.now() - timedelta(days=3)
+        self.orders = [create_order(status='processing', email=f'reader{i}@example.com') for i in range(4)]
+        self.already_shipped = create_order(status='shipped', shipped_at=self.shipped_earlier)
+        # Sent back to processing by hand; keeps its first shipping date
+        self.reshipped = create_order(status='processing', shipped_at=self.shipped_earlier)
+
+    def test_transition_in_batches(self):
+        progress = []
+        queryset = Order.objects.all()
+        with self.assertNumQueries(1 + 3 * 5):
+            # One id query; per batch: lock, update and email insert, inside a savepoint
+            updated, skipped = FulfillmentService.transition(
+                queryset, 'shipped', batch_size=2,
+                progress=lambda done, total: progress.append((done, total)),
+            )
+
+        self.assertEqual((updated, skipped), (5, 1))
+        self.assertEqual(progress, [(2, 6), (4, 6), (6, 6)])
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'shipped'})
+
+        shipped_at = dict(Order.objects.values_list('id', 'shipped_at'))
+        # Coalesce: empty timestamps are set, existing ones are kept
+        for order in self.orders:
+            self.assertGreater(shipped_at[order.id], self.shipped_earlier)
+        self.assertEqual(shipped_at[self.already_shipped.id], self.shipped_earlier)
+        self.assertEqual(shipped_at[self.reshipped.id], self.shipped_earlier)
+
+        emails = OutboxEmail.objects.filter(message_type='shipping_notification')
+        self.assertEqual(
+            sorted(emails.values_list('order_id', flat=True)),
+            sorted([order.id for order in self.orders] + [self.reshipped.id]),
+        )
+        self.assertEqual(
+            set(emails.values_list('recipient', flat=True)),
+            {order.email for order in self.orders} | {self.reshipped.email},
+        )
+
+    def test_repeated_transition_changes_and_emails_nothing(self):
+        FulfillmentService.transition(Order.objects.all(), 'delivered')
+        delivered_at = dict(Order.objects.values_list('id', 'delivered_at'))
+
+        self.assertEqual(FulfillmentService.transition(Order.objects.all(), 'delivered'), (0, 6))
+        self.assertEqual(dict(Order.objects.values_list('id', 'delivered_at')), delivered_at)
+        self.assertEqual(OutboxEmail.objects.filter(message_type='order_delivered').count(), 6)
+
+    def test_empty_selection(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(FulfillmentService.transition(Order.objects.filter(status='returned'), 'shipped'), (0, 0))
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+class WebhookInboxTests(TestCase):
+    """Stripe events are stored once, applied once and retried with backoff"""
+
+    def setUp(self):
+        self.order = create_order(payment_status='pending')
+        StripeObjectLink.objects.create(stripe_id='cs_test_1', order=self.order)
+
+    def event(self, event_id='evt_1'):
+        return {
+            'id': event_id,
+            'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_test_1', 'client_reference_id': str(self.order.id)}},
+        }
+
+    def make_due(self):
+        StripeEvent.objects.update(next_attempt_at=timezone.now())
+
+    def test_duplicate_event_is_stored_and_applied_once(self):
+        WebhookService.record_event(self.event())
+        WebhookService.record_event(self.event())
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+        with self.assertLogs('store.webhooks') as logs:
+            self.assertEqual(WebhookService.process_pending(), (1, 0))
+            self.assertEqual(WebhookService.process_pending(), (0, 0))
+            # A redelivery under a new event id changes nothing either
+            WebhookService.record_event(self.event('evt_2'))
+            self.assertEqual(WebhookService.process_pending(), (1, 0))
+
+        self.assertEqual(logs.output, [f'INFO:store.webhooks:Payment successful for order {self.order.order_number}'])
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'completed')
+        self.assertEqual(OutboxEmail.objects.filter(message_type='order_confirmation').count(), 1)
+
+    def test_failed_event_is_retried_with_backoff(self):
+        WebhookService.record_event(self.event())
+
+        with mock.patch.object(WebhookService, 'apply_event', side_effect=RuntimeError('Stripe down')):
+            started = timezone.now()
+            self.assertEqual(WebhookService.process_pending(), (0, 1))
+            event = StripeEvent.objects.get()
+            self.assertEqual((event.status, event.attempts, event.last_error), ('pending', 1, 'Stripe down'))
+            self.assertGreaterEqual(event.next_attempt_at, started + timedelta(seconds=30))
+            self.assertLess(event.next_attempt_at, started + timedelta(seconds=60))
+
+            # Not due yet
+            self.assertEqual(WebhookService.process_pending(), (0, 0))
+
+            self.make_due()
+            started = timezone.now()
+            self.assertEqual(WebhookService.process_pending(), (0, 1))
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, 2)
+            self.assertGreaterEqual(event.next_attempt_at, started + timedelta(seconds=60))
+
+        self.make_due()
+        with self.assertLogs('store.webhooks'):
+            self.assertEqual(WebhookService.process_pending(), (1, 0))
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'processed')
+
+    def test_event_is_dead_lettered_after_max_attempts(self):
+        WebhookService.record_event(self.event())
+
+        with mock.patch.object(WebhookService, 'apply_event', side_effect=RuntimeError('bad payload')):
+            for _ in range(WebhookService.MAX_ATTEMPTS):
+                self.make_due()
+                self.assertEqual(WebhookService.process_pending(), (0, 1))
+
+            event = StripeEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), ('failed', WebhookService.MAX_ATTEMPTS))
+
+            self.make_due()
+            self.assertEqual(WebhookService.process_pending(), (0, 0))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Email backend whose server is always down"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP server unavailable')
+
+
+class EmailOutboxTests(TestCase):
+    """Queued email is sent once, retried with backoff and leased to one worker"""
+
+    def setUp(self):
+        self.order = create_order(payment_status='completed')
+        EmailService.send_order_confirmation(self.order)
+        self.email = OutboxEmail.objects.get()
+
+    def make_due(self):
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+
+    def test_queued_email_is_sent_once(self):
+        self.assertEqual(EmailService.send_batch(), (1, 0))
+        self.assertEqual(EmailService.send_batch(), (0, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.order.email])
+        self.assertIn(self.order.order_number, mail.outbox[0].subject)
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, 'sent')
+        self.assertIsNotNone(self.email.sent_at)
+
+    @override_settings(EMAIL_BACKEND='store.tests.FailingEmailBackend')
+    def test_failed_email_is_retried_with_backoff(self):
+        started = timezone.now()
+        self.assertEqual(EmailService.send_batch(), (0, 1))
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), ('pending', 1))
+        self.assertIn('SMTP server unavailable', self.email.last_error)
+        self.assertGreaterEqual(self.email.next_attempt_at, started + timedelta(seconds=60))
+        self.assertLess(self.email.next_attempt_at, started + timedelta(seconds=120))
+
+        # Not due yet
+        self.assertEqual(EmailService.send_batch(), (0, 0))
+
+        self.make_due()
+        started = timezone.now()
+        self.assertEqual(EmailService.send_batch(), (0, 1))
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.attempts, 2)
+        self.assertGreaterEqual(self.email.next_attempt_at, started + timedelta(seconds=120))
+
+    @override_settings(EMAIL_BACKEND='store.tests.FailingEmailBackend')
+    def test_email_is_dead_after_max_attempts(self):
+        for _ in range(EmailService.MAX_ATTEMPTS):
+            self.make_due()
+            self.assertEqual(EmailService.send_batch(), (0, 1))
+
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), ('dead', EmailService.MAX_ATTEMPTS))
+        self.make_due()
+        self.assertEqual(EmailService.send_batch(), (0, 0))
+
+    def test_expired_lease_is_claimed_again(self):
+        # A worker claimed the message and died; its lease is still running
+        OutboxEmail.objects.update(status='sending', next_attempt_at=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(EmailService.claim_batch(10), [])
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([email.id for email in EmailService.claim_batch(10)], [self.email.id])
+        # The new lease keeps other workers off it
+        self.assertEqual(EmailService.claim_batch(10), [])
+
+
+class SalesRollupTests(TestCase):
+    """Incremental rollup updates agree with a rebuild from the order tables"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Books', slug='books')
+        self.book = Product.objects.create(
+            category=category, name='Book', slug='book',
+            description='A book', price=Decimal('10.00'), stock=10,
+        )
+        self.order = create_order(total=Decimal('30.00'))
+        OrderItem.objects.create(
+            order=self.order, product=self.book, product_name='Book',
+            product_price=Decimal('10.00'), quantity=3,
+        )
+
+    def rollup(self):
+        return (
+            list(DailySalesRollup.objects.values_list('date', 'orders', 'revenue', 'units')),
+            list(DailyProductSales.objects.values_list('date', 'product_id', 'units', 'revenue')),
+        )
+
+    def test_payment_completion_and_refund(self):
+        today = timezone.localdate()
+        Order.objects.filter(id=self.order.id).update(payment_status='completed')
+        SalesRollupService.record_orders([self.order.id])
+        SalesRollupService.record_orders([self.order.id])
+        SalesRollupService.record_orders([self.order.id], sign=-1)
+
+        incremental = self.rollup()
+        self.assertEqual(incremental, (
+            [(today, 1, Decimal('30.00'), 3)],
+            [(today, self.book.id, 3, Decimal('30.00'))],
+        ))
+
+        SalesRollupService.rebuild(today, today + timedelta(days=1))
+        self.assertEqual(self.rollup(), incremental)
+
+        Order.objects.filter(id=self.order.id).update(payment_status='refunded')
+        SalesRollupService.record_orders([self.order.id], sign=-1)
+        self.assertEqual(AnalyticsService.get_sales_overview()['total_orders'], 0)
+
+    def test_rebuild_matches_incremental_with_a_deleted_product(self):
+        today = timezone.localdate()
+        atlas = Product.objects.create(
+            category=self.book.category, name='Atlas', slug='atlas',
+            description='An atlas', price=Decimal('5.00'), stock=10,
+        )
+        OrderItem.objects.create(
+            order=self.order, product=atlas, product_name='Atlas',
+            product_price=Decimal('5.00'), quantity=2,
+        )
+        atlas.delete()
+        Order.objects.filter(id=self.order.id).update(payment_status='completed')
+        SalesRollupService.record_orders([self.order.id])
+
+        incremental = self.rollup()
+        # The deleted product's units still count towards the day
+        self.assertEqual(incremental, (
+            [(today, 1, Decimal('30.00'), 5)],
+            [(today, self.book.id, 3, Decimal('30.00'))],
+        ))
+        SalesRollupService.rebuild(today, today + timedelta(days=1))
+        self.assertEqual(self.rollup(), incremental)
+
+
+class TimeSeriesTests(TestCase):
+    """Sales series have one bucket per period, empty ones filled with zeros"""
+
+    @classmethod
+    def setUpTestData(cls):
+        utc = timezone.get_fixed_timezone(0)
+        for created_at, total, payment_status in [
+            (datetime(2025, 3, 3, 10, 30, tzinfo=utc), '20.00', 'completed'),
+            (datetime(2025, 3, 4, 9, 0, tzinfo=utc), '99.00', 'pending'),
+            # Already 6 March in Berlin
+            (datetime(2025, 3, 5, 23, 30, tzinfo=utc), '30.00', 'completed'),
+            (datetime(2025, 4, 2, 12, 0, tzinfo=utc), '10.00', 'completed'),
+        ]:
+            order = create_order(total=Decimal(total), payment_status=payment_status)
+            Order.objects.filter(id=order.id).update(created_at=created_at)
+        SalesRollupService.rebuild(date(2025, 3, 1), date(2025, 5, 1))
+
+    def series(self, granularity, start, end, **kwargs):
+        return TimeSeriesService.get_sales_timeseries(granularity, start, end, **kwargs)
+
+    def column(self, series, name):
+        return [bucket[name] for bucket in series['buckets']]
+
+    def test_day(self):
+        series = self.series('day', date(2025, 3, 3), date(2025, 3, 7), window=2)
+
+        self.assertEqual(series['source'], 'rollup')
+        self.assertEqual(
+            self.column(series, 'start'),
+            ['2025-03-03', '2025-03-04', '2025-03-05', '2025-03-06', '2025-03-07'],
+        )
+        self.assertEqual(self.column(series, 'orders'), [1, 0, 1, 0, 0])
+        self.assertEqual(self.column(series, 'revenue'), [20.0, 0.0, 30.0, 0.0, 0.0])
+        self.assertEqual(self.column(series, 'orders_moving_average'), [1.0, 0.5, 0.5, 0.5, 0.0])
+
+    def test_day_in_another_timezone_buckets_orders(self):
+        series = self.series('day', date(2025, 3, 3), date(2025, 3, 7), tz_name='Europe/Berlin')
+
+        self.assertEqual(series['source'], 'orders')
+        self.assertEqual(self.column(series, 'orders'), [1, 0, 0, 1, 0])
+
+    def test_week(self):
+        # Weeks start on Monday, even when the range starts mid-week
+        series = self.series('week', date(2025, 3, 3), date(2025, 3, 20))
+
+        self.assertEqual(self.column(series, 'start'), ['2025-03-03', '2025-03-10', '2025-03-17'])
+        self.assertEqual(self.column(series, 'orders'), [2, 0, 0])
+        self.assertEqual(self.column(series, 'revenue'), [50.0, 0.0, 0.0])
+
+    def test_month(self):
+        series = self.series('month', date(2025, 2, 15), date(2025, 4, 10))
+
+        self.assertEqual(self.column(series, 'start'), ['2025-02-01', '2025-03-01', '2025-04-01'])
+        self.assertEqual(self.column(series, 'orders'), [0, 2, 1])
+        self.assertEqual(self.column(series, 'revenue'), [0.0, 50.0, 10.0])
+
+    def test_hour(self):
+        series = self.series('hour', date(2025, 3, 3), date(2025, 3, 3))
+
+        self.assertEqual(series['source'], 'orders')
+        self.assertEqual(len(series['buckets']), 24)
+        self.assertEqual(series['buckets'][0]['start'], '2025-03-03T00:00:00+00:00')
+        self.assertEqual(self.column(series, 'orders'), [0] * 10 + [1] + [0] * 13)
+
+    def test_bad_parameters(self):
+        for kwargs in [
+            {'granularity': 'year'},
+            {'granularity': 'day', 'window': 0},
+            {'granularity': 'day', 'tz_name': 'Mars/Olympus'},
+            {'granularity': 'day', 'start': date(2025, 3, 5), 'end': date(2025, 3, 1)},
+            {'granularity': 'hour', 'start': date(2024, 1, 1), 'end': date(2025, 3, 1)},
+        ]:
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                TimeSeriesService.get_sales_timeseries(**kwargs)
+
+
+class CohortTests(TestCase):
+    """Cohorts built from streamed chunks match the whole-table result"""
+
+    @classmethod
+    def setUpTestData(cls):
+        utc = timezone.get_fixed_timezone(0)
+        ann, ben, cy, guest = (
+            User.objects.create_user(username=name) for name in ['ann', 'ben', 'cy', 'guest']
+        )
+        orders = [
+            (ann, 1, '10.00'), (ann, 1, '5.00'), (ann, 3, '20.00'),
+            (ben, 2, '15.00'),
+            (cy, 1, '10.00'), (cy, 2, '10.00'), (cy, 2, '10.00'), (cy, 3, '10.00'),
+        ]
+        for user, month, total in orders:
+            order = create_order(user, total=Decimal(total), payment_status='completed')
+            Order.objects.filter(id=order.id).update(created_at=datetime(2025, month, 15, 12, tzinfo=utc))
+        # Unpaid and guest orders don't count
+        create_order(guest, payment_status='pending')
+        create_order(None, payment_status='completed')
+        # Neither does where the order lives: cy's last order is archived
+        ArchivedOrder.objects.create(
+            id=10 ** 6, user=cy, order_number='ORD-COHORT-ARCHIVED', email='cy@example.com',
+            first_name='Cy', last_name='Reader', address_line1='1 Test St', city='Testville',
+            state='TS', postal_code='00000', phone='555-0000', subtotal=Decimal('10.00'),
+            total=Decimal('10.00'), status='delivered', payment_status='completed',
+            created_at=datetime(2025, 4, 15, 12, tzinfo=utc), updated_at=datetime(2025, 4, 15, 12, tzinfo=utc),
+        )
+        Order.objects.filter(payment_status='pending').update(created_at=datetime(2024, 12, 15, 12, tzinfo=utc))
+
+    def stored(self):
+        return list(CustomerCohort.objects.order_by('cohort_month').values(
+            'cohort_month', 'customers', 'repeat_customers', 'active_customers', 'orders', 'revenue',
+        ))
+
+    def test_cohorts(self):
+        self.assertEqual(CohortService.build(), 2)
+        self.assertEqual(self.stored(), [
+            {
+                'cohort_month': date(2025, 1, 1), 'customers': 2, 'repeat_customers': 2,
+                'active_customers': [2, 1, 2, 1], 'orders': [3, 2, 2, 1],
+                'revenue': [25.0, 20.0, 30.0, 10.0],
+            },
+            {
+                'cohort_month': date(2025, 2, 1), 'customers': 1, 'repeat_customers': 0,
+                'active_customers': [1, 0, 0], 'orders': [1, 0, 0], 'revenue': [15.0, 0.0, 0.0],
+            },
+        ])
+
+        report = CohortService.get_report()
+        self.assertEqual(report['customers'], 3)
+        self.assertEqual(report['cohorts'][0]['retention'], [1.0, 0.5, 1.0, 0.5])
+        self.assertEqual(report['cohorts'][0]['lifetime_value'], [12.5, 22.5, 37.5, 42.5])
+
+    def test_chunked_build_matches_unchunked(self):
+        CohortService.build(chunk_size=1000)
+        expected = self.stored()
+
+        # Chunks smaller than one customer's orders carry them over several chunks
+        for chunk_size in [1, 2, 3, 4, 5, 7]:
+            with self.subTest(chunk_size=chunk_size):
+                CohortService.build(chunk_size=chunk_size)
+                self.assertEqual(self.stored(), expected)
+
+
+class OrderExportTests(TestCase):
+    """Order exports stream CSV or JSONL with the requested rows only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        category = Category.objects.create(name='Books', slug='books')
+        book = Product.objects.create(
+            category=category, name='Book, "Annotated"', slug='book',
+            description='A book', price=Decimal('12.50'), stock=10,
+        )
+        cls.shipped = create_order(last_name='O\'Neill, Jr.', status='shipped', payment_status='completed')
+        cls.pending = create_order(status='pending')
+        old = create_order(status='delivered', payment_status='completed')
+        Order.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=40))
+        for order in [cls.shipped, cls.pending, old]:
+            OrderItem.objects.create(
+                order=order, product=book, product_name=book.name,
+                product_price=book.price, quantity=2,
+            )
+        cls.archived = ArchivedOrder.objects.create(
+            id=10 ** 6, order_number='ORD-EXPORT-ARCHIVED', email='old@example.com',
+            first_name='Old', last_name='Reader', address_line1='1 Test St', city='Testville',
+            state='TS', postal_code='00000', phone='555-0000', subtotal=Decimal('25.00'),
+            total=Decimal('25.00'), status='delivered', payment_status='completed',
+            created_at=timezone.now(), updated_at=timezone.now(),
+        )
+
+    def export(self, **params):
+        self.client.force_login(self.staff)
+        with quiet_request_logs():
+            response = self.client.get('/api/analytics/export/orders/', params)
+        if response.status_code != 200:
+            return response, None
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, body = self.export(status='shipped,delivered', start=str(timezone.localdate() - timedelta(days=7)))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="orders.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual([row['order_number'] for row in rows], [self.shipped.order_number])
+        self.assertEqual(rows[0]['last_name'], "O'Neill, Jr.")
+        self.assertEqual(rows[0]['total'], '20.00')
+        self.assertEqual(list(rows[0]), [name for name, _ in ExportService.ORDER_COLUMNS])
+
+    def test_jsonl_lines_with_archive(self):
+        response, body = self.export(output='jsonl', lines=1, payment_status='completed')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['product_name'], 'Book, "Annotated"')
+        self.assertEqual((lines[0]['quantity'], Decimal(lines[0]['line_total'])), (2, Decimal('25.00')))
+
+        _, body = self.export(output='jsonl', include_archived=1)
+        numbers = [json.loads(line)['order_number'] for line in body.splitlines()]
+        self.assertEqual(len(numbers), 4)
+        # Live orders first, then the archive
+        self.assertEqual(numbers[-1], self.archived.order_number)
+
+    def test_chunks(self):
+        chunks = list(ExportService.stream(output='csv', chunk_size=1))
+        # Header, then one chunk per order
+        self.assertEqual(len(chunks), 4)
+
+    def test_bad_parameters(self):
+        for params in [
+            {'output': 'xlsx'},
+            {'status': 'shipped,lost'},
+            {'payment_status': 'maybe'},
+            {'start': '2025-13-01'},
+        ]:
+            with self.subTest(**params):
+                response, _ = self.export(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class DashboardSectionTests(SimpleTestCase):
+    """Sections run concurrently and a slow one doesn't hold up the rest"""
+
+    def test_slow_section_is_unavailable(self):
+        release = threading.Event()
+        tasks = {
+            'fast': lambda: {'fast': 1},
+            'slow': lambda: release.wait(5) and {'slow': 1},
+        }
+        started = time.monotonic()
+        try:
+            with self.assertLogs('store.analytics', 'ERROR'):
+                results, timings, unavailable = AnalyticsService.run_sections(tasks, timeout=0.2)
+        finally:
+            release.set()
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(results, {'fast': {'fast': 1}})
+        self.assertEqual(list(timings), ['fast'])
+        self.assertEqual(unavailable, ['slow'])
+
+    def test_failing_section_is_unavailable(self):
+        def fail():
+            raise RuntimeError('boom')
+
+        with self.assertLogs('store.analytics', 'ERROR') as logs:
+            results, _, unavailable = AnalyticsService.run_sections(
+                {'ok': lambda: {'ok': 1}, 'broken': fail}
+            )
+        self.assertEqual(results, {'ok': {'ok': 1}})
+        self.assertEqual(unavailable, ['broken'])
+        # The traceback is kept, so failures in the thread pool can be diagnosed
+        self.assertIn('RuntimeError: boom', logs.output[0])
+
+    @override_settings(ANALYTICS_DASHBOARD_WORKERS=0)
+    def test_failing_inline_section_is_unavailable(self):
+        def fail():
+            raise RuntimeError('boom')
+
+        with self.assertLogs('store.analytics', 'ERROR') as logs:
+            results, timings, unavailable = AnalyticsService.run_sections(
+                {'ok': lambda: {'ok': 1}, 'broken': fail}
+            )
+        self.assertEqual(results, {'ok': {'ok': 1}})
+        self.assertEqual(list(timings), ['ok'])
+        self.assertEqual(unavailable, ['broken'])
+        self.assertIn('RuntimeError: boom', logs.output[0])
+
+
+class StoreSeederTests(TestCase):
+    """Seeded data looks like data the shop itself could have written"""
+
+    def test_seeded_orders_are_consistent(self):
+        StoreSeeder(seed=3, days=30).run(
+            categories=2, products=20, users=30, orders=600, coupons=3, reviews=20, carts=5,
+        )
+
+        now = timezone.now()
+        self.assertFalse(Order.objects.filter(created_at__gt=now).exists())
+        self.assertFalse(User.objects.filter(date_joined__gt=now).exists())
+        # Unpaid orders are either still pending or were released
+        self.assertEqual(
+            set(Order.objects.exclude(payment_status='completed').values_list('payment_status', 'status')),
+            {('pending', 'pending'), ('failed', 'cancelled'), ('refunded', 'cancelled')},
+        )
+        self.assertFalse(
+            InventoryService.stale_pending_orders(now - timedelta(days=1)).exists()
+        )
+
+    def seeder_at(self, now, end):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            return StoreSeeder(end=end)
+
+    def test_explicit_end_does_not_depend_on_the_clock(self):
+        today = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        morning, evening = midnight + timedelta(hours=1), midnight + timedelta(hours=20)
+
+        early, late = self.seeder_at(morning, today), self.seeder_at(evening, today)
+        self.assertEqual((early.start_at, early.end_at), (late.start_at, late.end_at))
+        self.assertEqual(late.end_at, midnight + timedelta(days=1))
+        # Without an end the history stops at now
+        self.assertEqual(self.seeder_at(evening, None).end_at, evening)
+
+
+class LoadTestJourneyTests(SimpleTestCase):
+    """The load test only requests pages that exist"""
+
+    def test_browse_stays_within_the_product_pages(self):
+        class RecordingSession:
+            def __init__(self):
+                self.pages = []
+
+            def request(self, endpoint, method, path, data=None):
+                if endpoint == 'GET /api/products/':
+                    self.pages.append(data['page'])
+
+        products = [(i, f'book-{i}') for i in range(30)]
+        journeys = Journeys(random.Random(1), products, ['books'])
+        session = RecordingSession()
+        for _ in range(200):
+            journeys.browse_products(session)
+
+        self.assertEqual(set(session.pages), {1, 2})
+
+
+class PerformanceMiddlewareTests(TestCase):
+    """Every request reports its timings, and slow ones their repeated SQL"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Fiction', slug='fiction')
+        for i in range(3):
+            Product.objects.create(
+                category=category, name=f'Book {i}', slug=f'book-{i}',
+                description='A book', price=Decimal('10.00'), stock=5,
+            )
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        with self.assertLogs('store.performance', 'INFO') as logs:
+            response = self.client.get('/api/products/')
+
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('ser;dur=', timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'api/products/$')
+        self.assertGreater(record['db_queries'], 0)
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=False)
+    def test_header_off_for_anonymous_users(self):
+        with self.assertLogs('store.performance', 'INFO'):
+            response = self.client.get('/api/products/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(PERFORMANCE_SLOW_REQUEST_MS=0)
+    def test_slow_request_lists_repeated_sql(self):
+        def n_plus_one_view(request):
+            for product in Product.objects.all():
+                product.reviews.count()
+            return HttpResponse()
+
+        middleware = PerformanceMiddleware(n_plus_one_view)
+        with self.assertLogs('store.performance', 'WARNING') as logs:
+            middleware(RequestFactory().get('/products/'))
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertTrue(record['slow'])
+        self.assertEqual(record['repeated_sql'][0]['count'], 3)
+
+
+@override_settings(METRICS_BEARER_TOKEN='scrape-token')
+class MetricsTests(TestCase):
+    """/metrics exposes request histograms, added up over worker processes"""
+
+    def scrape(self, **headers):
+        headers.setdefault('HTTP_AUTHORIZATION', 'Bearer scrape-token')
+        with self.assertLogs('store.performance'):
+            return self.client.get('/metrics', **headers)
+
+    def test_request_histogram(self):
+        with self.assertLogs('store.performance'):
+            self.client.get('/api/categories/')
+        response = self.scrape()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE store_http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'store_http_request_duration_seconds_bucket{method="GET",view="category-list",le="+Inf"}',
+            body,
+        )
+
+    def test_only_internal_scrapers(self):
+        self.assertEqual(self.scrape(REMOTE_ADDR='203.0.113.9').status_code, 404)
+
+    def test_token_is_required_behind_a_local_proxy(self):
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='').status_code, 404)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer guess').status_code, 404)
+
+    @override_settings(METRICS_BEARER_TOKEN='')
+    def test_no_token_only_while_debugging(self):
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='').status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='').status_code, 200)
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, '999999.json'), 'w') as f:
+                json.dump({
+                    'counters': [['store_checkouts_total', [['outcome', 'success']], 5]],
+                    'histograms': [],
+                }, f)
+            with override_settings(METRICS_DIR=directory):
+                before = MetricsService.collect()[0][('store_checkouts_total', (('outcome', 'success'),))]
+                MetricsService.inc('store_checkouts_total', outcome='success')
+                MetricsService.flush()
+                body = MetricsService.render()
+
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+        self.assertIn(f'store_checkouts_total{{outcome="success"}} {int(before) + 1}', body)
+
+
+class ProfilerMiddlewareTests(TestCase):
+    """Staff can profile one request; everyone else gets the plain response"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.customer = User.objects.create_user(username='customer')
+
+    def get(self, user, path, **headers):
+        self.client.force_login(user)
+        with override_settings(PROFILER_DIR=self.directory.name), self.assertLogs('store.performance'):
+            return self.client.get(path, **headers)
+
+    def test_staff_profile_is_stored(self):
+        response = self.get(self.staff, '/api/categories/', HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, 200)
+        filename = response['X-Profile'].split(';')[0]
+        self.assertEqual(os.listdir(self.directory.name), [filename])
+        self.assertTrue(filename.endswith('-get-apicategories.folded'))
+
+    def test_staff_profile_download(self):
+        response = self.get(self.staff, '/api/categories/?_profile=download')
+
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_other_values_do_not_profile(self):
+        for path, headers in [
+            ('/api/categories/', {'HTTP_X_PROFILE': '0'}),
+            ('/api/categories/', {'HTTP_X_PROFILE': 'yes'}),
+            ('/api/categories/?_profile=0', {}),
+        ]:
+            with self.subTest(path=path, **headers), mock.patch('store.profiling.StackSampler') as sampler:
+                response = self.get(self.staff, path, **headers)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('X-Profile', response)
+                sampler.assert_not_called()
+
+    def test_customers_cannot_profile(self):
+        response = self.get(self.customer, '/api/categories/', HTTP_X_PROFILE='download')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class RolledBack(Exception):
+    """Raised to undo an atomic block on purpose"""
+
+
+def normalize_sql(sql):
+    """SQL with its literals replaced, so the queries of an N+1 group together"""
+    return re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', sql)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every router endpoint is called with 1 and with 50 related objects
+    (cart lines, orders, order items, reviews, ...): the number of queries
+    must not grow with them, and must stay within the endpoint's budget
+
+    Budgets include the session and user lookups. Lower one when an
+    endpoint gets faster; raising one needs a reason.
+    """
+    SMALL = 1
+    LARGE = 50
+
+    BUDGETS = {
+        'GET /api/': 2,
+        'GET /api/categories/': 4,
+        'GET /api/categories/{slug}/': 3,
+        'GET /api/products/': 4,
+        'GET /api/products/?category=': 4,
+        'GET /api/products/{slug}/': 3,
+        'GET /api/products/{slug}/reviews/': 5,
+        'GET /api/cart/': 6,
+        'GET /api/cart/{id}/': 5,
+        'DELETE /api/cart/{id}/': 7,
+        'GET /api/cart/current/': 5,
+        'POST /api/cart/add_item/': 10,
+        'POST /api/cart/update_item/': 7,
+        'POST /api/cart/remove_item/': 7,
+        'POST /api/cart/clear/': 5,
+        'POST /api/cart/apply_coupon/': 6,
+        'POST /api/cart/create_order/': 14,
+        'GET /api/orders/': 5,
+        'GET /api/orders/?summary=1': 4,
+        'GET /api/orders/?include_archived=1': 8,
+        'GET /api/orders/{id}/': 4,
+        'GET /api/orders/{id}/ (archived)': 5,
+        'GET /api/orders/{id}/tracking/': 3,
+        'GET /api/orders/by-session/{id}/': 3,
+        'GET /api/reviews/': 4,
+        'GET /api/reviews/?product=': 4,
+        'GET /api/reviews/{id}/': 3,
+        'GET /api/reviews/my_reviews/': 3,
+        'GET /api/reviews/{id}/rating_distribution/': 5,
+        'POST /api/reviews/': 6,
+        'PATCH /api/reviews/{id}/': 4,
+        'DELETE /api/reviews/{id}/': 4,
+        'GET /api/users/': 4,
+        'GET /api/users/{id}/': 3,
+        'POST /api/users/': 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', email='reader@example.com')
+        cls.category = Category.objects.create(name='Books', slug='books')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.sequence = 0
+
+    # Fixtures: each creates n of its related objects
+
+    def make_users(self, n):
+        start = self.sequence
+        self.sequence += n
+        return User.objects.bulk_create([
+            User(username=f'user-{i}', first_name=f'User {i}') for i in range(start, start + n)
+        ])
+
+    def make_products(self, n):
+        start = self.sequence
+        self.sequence += n
+        return Product.objects.bulk_create([
+            Product(
+                category=self.category, name=f'Book {i}', slug=f'book-{i}',
+                description='A book', price=Decimal('12.50'), stock=100,
+            )
+            for i in range(start, start + n)
+        ])
+
+    def make_reviews(self, products, users):
+        ProductReview.objects.bulk_create([
+            ProductReview(
+                product=product, user=user, rating=4, title='Good', comment='...', is_approved=True,
+            )
+            for product in products
+            for user in users
+        ])
+        return ProductReview.objects.filter(product__in=products, user__in=users).order_by('id')
+
+    def make_cart(self, n):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1) for product in self.make_products(n)
+        ])
+        return cart
+
+    def make_order(self, n, model=Order, item_model=OrderItem, **fields):
+        if model is ArchivedOrder:
+            self.sequence += 1
+            fields.update(
+                id=10 ** 6 + self.sequence, order_number=f'ORD-ARCHIVED-{self.sequence}',
+                created_at=timezone.now(), updated_at=timezone.now(),
+            )
+        order = model.objects.create(
+            user=self.user, email='reader@example.com', first_name='Ana', last_name='Reader',
+            address_line1='1 Test St', city='Testville', state='TS', postal_code='00000',
+            phone='555-0000', subtotal=Decimal('25.00'), total=Decimal('25.00'),
+            tracking_number='1Z999', carrier='UPS', **fields,
+        )
+        item_model.objects.bulk_create([
+            item_model(
+                **({'id': order.id * 1000 + i} if item_model is ArchivedOrderItem else {}),
+                order=order, product=product, product_name=product.name,
+                product_price=product.price, quantity=2,
+            )
+            for i, product in enumerate(self.make_products(n))
+        ])
+        return order
+
+    # Endpoints: each takes n and returns (method, path, data)
+
+    def api_root(self, n):
+        return 'GET', '/api/', None
+
+    def categories(self, n):
+        Category.objects.bulk_create([
+            Category(name=f'Category {i}', slug=f'category-{i}') for i in range(n)
+        ])
+        return 'GET', '/api/categories/', None
+
+    def category_detail(self, n):
+        self.make_products(n)
+        return 'GET', f'/api/categories/{self.category.slug}/', None
+
+    def products(self, n):
+        self.make_reviews(self.make_products(n), self.make_users(2))
+        return 'GET', '/api/products/', None
+
+    def products_in_category(self, n):
+        self.make_reviews(self.make_products(n), self.make_users(2))
+        return 'GET', '/api/products/', {'category': self.category.slug}
+
+    def product_detail(self, n):
+        product = self.make_products(1)[0]
+        self.make_reviews([product], self.make_users(n))
+        return 'GET', f'/api/products/{product.slug}/', None
+
+    def product_reviews(self, n):
+        product = self.make_products(1)[0]
+        self.make_reviews([product], self.make_users(n))
+        return 'GET', f'/api/products/{product.slug}/reviews/', None
+
+    def cart_list(self, n):
+        self.make_cart(n)
+        return 'GET', '/api/cart/', None
+
+    def cart_detail(self, n):
+        cart = self.make_cart(n)
+        return 'GET', f'/api/cart/{cart.id}/', None
+
+    def cart_delete(self, n):
+        cart = self.make_cart(n)
+        return 'DELETE', f'/api/cart/{cart.id}/', None
+
+    def cart_current(self, n):
+        self.make_cart(n)
+        return 'GET', '/api/cart/current/', None
+
+    def cart_add_item(self, n):
+        self.make_cart(n)
+        product = self.make_products(1)[0]
+        return 'POST', '/api/cart/add_item/', {'product_id': product.id, 'quantity': 1}
+
+    def cart_update_item(self, n):
+        item = self.make_cart(n).items.first()
+        return 'POST', '/api/cart/update_item/', {'cart_item_id': item.id, 'quantity': 3}
+
+    def cart_remove_item(self, n):
+        # One line more, so n are left to serialize
+        item = self.make_cart(n + 1).items.first()
+        return 'POST', '/api/cart/remove_item/', {'cart_item_id': item.id}
+
+    def cart_clear(self, n):
+        self.make_cart(n)
+        return 'POST', '/api/cart/clear/', None
+
+    def cart_apply_coupon(self, n):
+        self.make_cart(n)
+        today = timezone.localdate()
+        Coupon.objects.create(
+            code='SAVE10', discount_type='percentage', discount_value=Decimal('10'),
+            valid_from=today, valid_until=today, max_uses=10,
+        )
+        return 'POST', '/api/cart/apply_coupon/', {'code': 'SAVE10'}
+
+    def cart_create_order(self, n):
+        self.make_cart(n)
+        return 'POST', '/api/cart/create_order/', {**SHIPPING_ADDRESS, 'email': 'reader@example.com'}
+
+    def orders(self, n):
+        for _ in range(n):
+            self.make_order(2)
+        return 'GET', '/api/orders/', None
+
+    def orders_summary(self, n):
+        for _ in range(n):
+            self.make_order(2)
+        return 'GET', '/api/orders/', {'summary': 1}
+
+    def orders_with_archive(self, n):
+        for _ in range(n):
+            self.make_order(2)
+            self.make_order(2, ArchivedOrder, ArchivedOrderItem)
+        return 'GET', '/api/orders/', {'include_archived': 1}
+
+    def order_detail(self, n):
+        order = self.make_order(n)
+        return 'GET', f'/api/orders/{order.id}/', None
+
+    def archived_order_detail(self, n):
+        order = self.make_order(n, ArchivedOrder, ArchivedOrderItem)
+        return 'GET', f'/api/orders/{order.id}/', None
+
+    def order_tracking(self, n):
+        order = self.make_order(n)
+        return 'GET', f'/api/orders/{order.id}/tracking/', None
+
+    def order_by_session(self, n):
+        order = self.make_order(n)
+        StripeObjectLink.objects.create(stripe_id=f'cs_test_{order.id}', order=order)
+        return 'GET', f'/api/orders/by-session/cs_test_{order.id}/', None
+
+    def reviews(self, n):
+        self.make_reviews(self.make_products(1), self.make_users(n))
+        return 'GET', '/api/reviews/', None
+
+    def reviews_for_product(self, n):
+        product = self.make_products(1)[0]
+        self.make_reviews([product], self.make_users(n))
+        return 'GET', '/api/reviews/', {'product': product.id}
+
+    def review_detail(self, n):
+        review = self.make_reviews(self.make_products(1), self.make_users(n)).first()
+        return 'GET', f'/api/reviews/{review.id}/', None
+
+    def my_reviews(self, n):
+        self.make_reviews(self.make_products(n), [self.user])
+        return 'GET', '/api/reviews/my_reviews/', None
+
+    def review_rating_distribution(self, n):
+        review = self.make_reviews(self.make_products(1), self.make_users(n)).first()
+        return 'GET', f'/api/reviews/{review.id}/rating_distribution/', None
+
+    def review_create(self, n):
+        product = self.make_products(1)[0]
+        self.make_reviews([product], self.make_users(n))
+        return 'POST', '/api/reviews/', {'product': product.id, 'rating': 5, 'title': 'Great', 'comment': '...'}
+
+    def review_update(self, n):
+        product = self.make_products(1)[0]
+        self.make_reviews([product], self.make_users(n))
+        review = self.make_reviews([product], [self.user]).get()
+        return 'PATCH', f'/api/reviews/{review.id}/', {'title': 'Even better'}
+
+    def review_delete(self, n):
+        product = self.make_products(1)[0]
+        self.make_reviews([product], self.make_users(n))
+        review = self.make_reviews([product], [self.user]).get()
+        return 'DELETE', f'/api/reviews/{review.id}/', None
+
+    def users(self, n):
+        self.make_users(n)
+        return 'GET', '/api/users/', None
+
+    def user_detail(self, n):
+        self.make_users(n)
+        return 'GET', f'/api/users/{self.user.id}/', None
+
+    def user_create(self, n):
+        self.make_users(n)
+        return 'POST', '/api/users/', {'username': 'new-reader', 'password': 'a-long-password'}
+
+    ENDPOINTS = {
+        'GET /api/': api_root,
+        'GET /api/categories/': categories,
+        'GET /api/categories/{slug}/': category_detail,
+        'GET /api/products/': products,
+        'GET /api/products/?category=': products_in_category,
+        'GET /api/products/{slug}/': product_detail,
+        'GET /api/products/{slug}/reviews/': product_reviews,
+        'GET /api/cart/': cart_list,
+        'GET /api/cart/{id}/': cart_detail,
+        'DELETE /api/cart/{id}/': cart_delete,
+        'GET /api/cart/current/': cart_current,
+        'POST /api/cart/add_item/': cart_add_item,
+        'POST /api/cart/update_item/': cart_update_item,
+        'POST /api/cart/remove_item/': cart_remove_item,
+        'POST /api/cart/clear/': cart_clear,
+        'POST /api/cart/apply_coupon/': cart_apply_coupon,
+        'POST /api/cart/create_order/': cart_create_order,
+        'GET /api/orders/': orders,
+        'GET /api/orders/?summary=1': orders_summary,
+        'GET /api/orders/?include_archived=1': orders_with_archive,
+        'GET /api/orders/{id}/': order_detail,
+        'GET /api/orders/{id}/ (archived)': archived_order_detail,
+        'GET /api/orders/{id}/tracking/': order_tracking,
+        'GET /api/orders/by-session/{id}/': order_by_session,
+        'GET /api/reviews/': reviews,
+        'GET /api/reviews/?product=': reviews_for_product,
+        'GET /api/reviews/{id}/': review_detail,
+        'GET /api/reviews/my_reviews/': my_reviews,
+        'GET /api/reviews/{id}/rating_distribution/': review_rating_distribution,
+        'POST /api/reviews/': review_create,
+        'PATCH /api/reviews/{id}/': review_update,
+        'DELETE /api/reviews/{id}/': review_delete,
+        'GET /api/users/': users,
+        'GET /api/users/{id}/': user_detail,
+        'POST /api/users/': user_create,
+    }
+
+    def run_endpoint(self, endpoint, n):
+        """Create n related objects and call the endpoint, then roll it all back; returns the queries"""
+        try:
+            with transaction.atomic():
+                method, path, data = self.ENDPOINTS[endpoint](self, n)
+                with CaptureQueriesContext(connection) as queries, quiet_request_logs(), \
+                        mock.patch('stripe.checkout.Session.create', side_effect=fake_checkout_session):
+                    if method == 'GET':
+                        response = self.client.get(path, data)
+                    else:
+                        response = self.client.generic(
+                            method, path, json.dumps(data or {}), content_type='application/json'
+                        )
+                raise RolledBack
+        except RolledBack:
+            pass
+
+        self.assertLess(
+            response.status_code, 400,
+            f'{endpoint} with {n} related object(s): {response.status_code} {response.content[:300]!r}',
+        )
+        return [query['sql'] for query in queries.captured_queries]
+
+    def describe(self, queries):
+        """The repeated statements, most repeated first, for failure messages"""
+        repeated = Counter(normalize_sql(sql) for sql in queries).most_common()
+        lines = [f'  {count}x {sql}' for sql, count in repeated if count > 1]
+        return '\n'.join(lines) or '  (no statement repeats)'
+
+    def test_every_router_endpoint_is_covered(self):
+        from .urls import router
+
+        routes = set()
+        for prefix, viewset, basename in router.registry:
+            for route in router.get_routes(viewset):
+                routes.update(
+                    (route.name.format(basename=basename), method.upper())
+                    for method, action in route.mapping.items()
+                    if hasattr(viewset, action)
+                )
+        # PUT runs the same queries as PATCH; the shop never creates or edits a
+        # cart, or edits and deletes a user, through the generic routes
+        skipped = {
+            ('cart-list', 'POST'),
+            ('cart-detail', 'PUT'),
+            ('cart-detail', 'PATCH'),
+            ('review-detail', 'PUT'),
+            ('user-detail', 'PUT'),
+            ('user-detail', 'PATCH'),
+            ('user-detail', 'DELETE'),
+        }
+
+        covered = set()
+        for endpoint in self.ENDPOINTS:
+            method, path = endpoint.split(' ')[:2]
+            path = path.split('?')[0].replace('{slug}', 'slug').replace('{id}', '1')
+            covered.add((resolve(path).url_name, method))
+
+        self.assertEqual(set(self.ENDPOINTS), set(self.BUDGETS))
+        missing = sorted(routes - skipped - covered)
+        self.assertFalse(missing, f'Routes without a query budget: {missing}')
+
+    def test_query_counts_do_not_grow(self):
+        for endpoint in self.ENDPOINTS:
+            with self.subTest(endpoint=endpoint):
+                few = self.run_endpoint(endpoint, self.SMALL)
+                many = self.run_endpoint(endpoint, self.LARGE)
+                self.assertLessEqual(
+                    len(many), len(few),
+                    f'{endpoint}: {len(few)} queries with {self.SMALL} related object(s), '
+                    f'{len(many)} with {self.LARGE}. Repeated SQL:\n{self.describe(many)}',
+                )
+                self.assertLessEqual(
+                    len(many), self.BUDGETS[endpoint],
+                    f'{endpoint}: {len(many)} queries, budget {self.BUDGETS[endpoint]}. '
+                    f'Repeated SQL:\n{self.describe(many)}',
+                )
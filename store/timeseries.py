@@ -0,0 +1,185 @@
+# store/timeseries.py
+import zoneinfo
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc, TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import Order, ArchivedOrder, DailySalesRollup
+
+
+class TimeSeriesService:
+    """
+    Service class for bucketed sales time series
+    Day, week and month series in the store timezone are read from the
+    daily sales rollup; hourly series and other timezones are bucketed
+    from the order tables by the database
+    """
+    GRANULARITIES = ['hour', 'day', 'week', 'month']
+    # Default range when no start date is given, counted back from end
+    DEFAULT_SPANS = {
+        'hour': timedelta(days=1),
+        'day': timedelta(days=29),
+        'week': timedelta(weeks=12),
+        'month': timedelta(days=365),
+    }
+    MAX_BUCKETS = 5000
+
+    @staticmethod
+    def get_timezone(tz_name=None):
+        if not tz_name:
+            return timezone.get_current_timezone()
+        try:
+            return zoneinfo.ZoneInfo(tz_name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone: {tz_name}")
+
+    @staticmethod
+    def get_bucket_starts(granularity, start, end):
+        """Local start of every bucket from start to end (inclusive dates)"""
+        first_day = np.datetime64(start, 'D')
+        last_day = np.datetime64(end, 'D')
+
+        if granularity == 'hour':
+            buckets = np.arange(
+                first_day.astype('datetime64[h]'),
+                (last_day + 1).astype('datetime64[h]'),
+            )
+        elif granularity == 'day':
+            buckets = np.arange(first_day, last_day + 1)
+        elif granularity == 'week':
+            # Weeks start on Monday, like TruncWeek
+            monday = first_day - np.timedelta64(start.weekday(), 'D')
+            buckets = np.arange(monday, last_day + 1, np.timedelta64(7, 'D'))
+        else:
+            buckets = np.arange(
+                first_day.astype('datetime64[M]'),
+                last_day.astype('datetime64[M]') + 1,
+            )
+        return buckets.astype('datetime64[s]')
+
+    @staticmethod
+    def get_rollup_rows(granularity, start, end):
+        """Bucketed completed sales from the daily rollup, one grouped query"""
+        rows = DailySalesRollup.objects.filter(date__gte=start, date__lte=end)
+        if granularity == 'day':
+            bucket = F('date')
+        else:
+            bucket = TruncWeek('date') if granularity == 'week' else TruncMonth('date')
+        rows = rows.annotate(bucket=bucket).values('bucket')
+        return list(rows.annotate(orders=Sum('orders'), revenue=Sum('revenue')).order_by())
+
+    @staticmethod
+    def get_order_rows(granularity, start, end, tz):
+        """Bucketed completed sales from the live and archived orders"""
+        range_start = datetime.combine(start, time.min, tzinfo=tz)
+        range_end = datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz)
+
+        rows = []
+        for order_model in [Order, ArchivedOrder]:
+            for row in (
+                order_model.objects.filter(
+                    payment_status='completed',
+                    created_at__gte=range_start,
+                    created_at__lt=range_end,
+                )
+                .annotate(bucket=Trunc('created_at', granularity, tzinfo=tz))
+                .values('bucket')
+                .annotate(orders=Count('id'), revenue=Sum('total'))
+                .order_by()
+            ):
+                # Local wall-clock time, to line up with the bucket grid
+                row['bucket'] = timezone.localtime(row['bucket'], tz).replace(tzinfo=None)
+                rows.append(row)
+        return rows
+
+    @staticmethod
+    def moving_average(values, window):
+        """Trailing mean over the last window buckets (fewer at the start)"""
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        ends = np.arange(1, len(values) + 1)
+        starts = np.maximum(ends - window, 0)
+        return (sums[ends] - sums[starts]) / (ends - starts)
+
+    @staticmethod
+    def get_sales_timeseries(granularity='day', start=None, end=None, tz_name=None, window=None):
+        """
+        Completed orders and revenue per bucket between two dates, with
+        empty buckets filled with zeros and an optional moving average
+        Raises ValueError for bad parameters
+        """
+        if granularity not in TimeSeriesService.GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(TimeSeriesService.GRANULARITIES)}")
+        if window is not None and window < 1:
+            raise ValueError("window must be at least 1")
+
+        tz = TimeSeriesService.get_timezone(tz_name)
+        end = end or timezone.localdate(timezone=tz)
+        start = start or end - TimeSeriesService.DEFAULT_SPANS[granularity]
+        if start > end:
+            raise ValueError("start must be on or before end")
+
+        buckets = TimeSeriesService.get_bucket_starts(granularity, start, end)
+        if len(buckets) > TimeSeriesService.MAX_BUCKETS:
+            raise ValueError(
+                f"Range has {len(buckets)} {granularity} buckets; "
+                f"the maximum is {TimeSeriesService.MAX_BUCKETS}"
+            )
+
+        # The rollup is bucketed by day in the store timezone
+        if granularity != 'hour' and str(tz) == settings.TIME_ZONE:
+            source = 'rollup'
+            rows = TimeSeriesService.get_rollup_rows(granularity, start, end)
+        else:
+            source = 'orders'
+            rows = TimeSeriesService.get_order_rows(granularity, start, end, tz)
+
+        # Scatter the sparse rows onto the full bucket grid
+        orders = np.zeros(len(buckets))
+        revenue = np.zeros(len(buckets))
+        if rows:
+            keys = np.array([row['bucket'] for row in rows], dtype='datetime64[s]')
+            positions = np.minimum(np.searchsorted(buckets, keys), len(buckets) - 1)
+            on_grid = buckets[positions] == keys
+            # Repeated wall-clock hours (DST ends) share a bucket
+            np.add.at(orders, positions[on_grid], np.array([row['orders'] for row in rows])[on_grid])
+            np.add.at(
+                revenue,
+                positions[on_grid],
+                np.array([float(row['revenue'] or 0) for row in rows])[on_grid],
+            )
+
+        series = {
+            'orders': orders.astype(int).tolist(),
+            'revenue': np.round(revenue, 2).tolist(),
+        }
+        if window:
+            series['orders_moving_average'] = np.round(
+                TimeSeriesService.moving_average(orders, window), 2
+            ).tolist()
+            series['revenue_moving_average'] = np.round(
+                TimeSeriesService.moving_average(revenue, window), 2
+            ).tolist()
+
+        if granularity == 'hour':
+            labels = [
+                timezone.make_aware(bucket, tz).isoformat()
+                for bucket in buckets.tolist()
+            ]
+        else:
+            labels = [bucket.date().isoformat() for bucket in buckets.tolist()]
+
+        return {
+            'granularity': granularity,
+            'start': start,
+            'end': end,
+            'timezone': str(tz),
+            'window': window,
+            'source': source,
+            'buckets': [
+                {'start': label, **{name: values[i] for name, values in series.items()}}
+                for i, label in enumerate(labels)
+            ],
+        }
@@ -12,6 +12,9 @@ from .views import (
     analytics_sales_overview,
     analytics_top_products,
     analytics_daily_sales,
+    analytics_timeseries,
+    analytics_cohorts,
+    analytics_export_orders,
 )
 
 router = DefaultRouter()
@@ -34,4 +37,7 @@ urlpatterns = [
     path('analytics/sales/', analytics_sales_overview, name='analytics-sales'),
     path('analytics/top-products/', analytics_top_products, name='analytics-top-products'),
     path('analytics/daily-sales/', analytics_daily_sales, name='analytics-daily-sales'),
+    path('analytics/timeseries/', analytics_timeseries, name='analytics-timeseries'),
+    path('analytics/cohorts/', analytics_cohorts, name='analytics-cohorts'),
+    path('analytics/export/orders/', analytics_export_orders, name='analytics-export-orders'),
 ]
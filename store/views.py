@@ -6,25 +6,51 @@ from django.contrib.auth import authenticate, login, logout
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from django.middleware.csrf import get_token
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 import stripe
 from .stripe_service import StripeService
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Prefetch, Q, Sum, When, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_date
 from .analytics import AnalyticsService
+from .analytics_cache import AnalyticsCache
+from .cohorts import CohortService
+from .exports import ExportService
+from .metrics import MetricsService
+from .pricing import PricingService
+from .timeseries import TimeSeriesService
+from .webhooks import WebhookService
 from rest_framework.permissions import IsAdminUser
+import hmac
 import json
-from .models import Category, Product, Cart, CartItem, Order, OrderItem, Coupon, ProductReview
+from .models import (
+    Category,
+    Product,
+    Cart,
+    CartItem,
+    Order,
+    OrderItem,
+    Coupon,
+    ProductReview,
+    StripeObjectLink,
+    ArchivedOrder,
+    ArchivedOrderItem,
+)
+from .archive import ChainedQuerySet
 from .serializers import (
     CategorySerializer,
     ProductSerializer,
     CartSerializer,
     CartItemSerializer,
     OrderSerializer,
+    OrderSummarySerializer,
     UserSerializer,
     ProductReviewSerializer
 )
@@ -58,7 +84,9 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Filter products by category if specified
         """
-        queryset = super().get_queryset()
+        # Category names and review counts come with the products, not one
+        # query per product
+        queryset = super().get_queryset().for_display()
         category_slug = self.request.query_params.get("category", None)
 
         if category_slug:
@@ -73,7 +101,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         Get all approved reviews for a product
         """
         product = self.get_object()
-        reviews = product.reviews.filter(is_approved=True)
+        reviews = product.reviews.filter(is_approved=True).select_related("user")
         serializer = ProductReviewSerializer(reviews, many=True)
         
         return Response({
@@ -91,17 +119,43 @@ class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
 
+    # These change the lines first, so the lines are loaded afterwards
+    LINE_CHANGING_ACTIONS = ("add_item", "update_item", "remove_item", "clear")
+
+    @staticmethod
+    def line_prefetches():
+        """
+        Lines, their products and review counts, loaded up front so
+        serializing a cart takes the same few queries however many lines
+        it has
+        """
+        return (
+            "items",
+            Prefetch(
+                "items__product",
+                queryset=Product.objects.for_display(),
+            ),
+        )
+
     def get_queryset(self):
         """
         Return cart for current user only
         """
-        return Cart.objects.filter(user=self.request.user)
+        queryset = Cart.objects.filter(user=self.request.user)
+        if self.action in self.LINE_CHANGING_ACTIONS:
+            return queryset
+        return queryset.prefetch_related(*self.line_prefetches())
+
+    def serialize_with_lines(self, cart):
+        """The cart as it is now, after its lines changed"""
+        prefetch_related_objects([cart], *self.line_prefetches())
+        return CartSerializer(cart).data
     
     def get_object(self):
         """
         Get or create cart for current user
         """
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        cart, created = self.get_queryset().get_or_create(user=self.request.user)
         return cart
     
     @action(detail=False, methods=["get"])
@@ -143,8 +197,7 @@ class CartViewSet(viewsets.ModelViewSet):
             cart_item.quantity += quantity
             cart_item.save()
 
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_with_lines(cart))
 
     @action(detail=False, methods=['post'])
     def update_item(self, request):
@@ -170,8 +223,7 @@ class CartViewSet(viewsets.ModelViewSet):
             cart_item.quantity = quantity
             cart_item.save()
         
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_with_lines(cart))
     
     @action(detail=False, methods=['post'])
     def remove_item(self, request):
@@ -191,8 +243,7 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_with_lines(cart))
     
     @action(detail=False, methods=['post'])
     def clear(self, request):
@@ -201,8 +252,7 @@ class CartViewSet(viewsets.ModelViewSet):
         """
         cart = self.get_object()
         cart.items.all().delete()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.serialize_with_lines(cart))
     
     @action(detail=False, methods=["post"])
     def create_order(self, request):
@@ -293,15 +343,7 @@ class CartViewSet(viewsets.ModelViewSet):
             with transaction.atomic():
                 # Calculate totals
                 subtotal = cart.subtotal
-                shipping_cost = Decimal("5.00")
-
-                # Apply discount before calculation tax
-                discounted_subtotal = subtotal - discount_amount
-
-                # Calculate tax on discounted amount
-                tax = subtotal * Decimal("0.08")
-                #Final total
-                total = discounted_subtotal + shipping_cost + tax
+                totals = PricingService.order_totals(subtotal, discount_amount)
 
                 # Create order
                 order = Order.objects.create(
@@ -319,9 +361,9 @@ class CartViewSet(viewsets.ModelViewSet):
                     subtotal=subtotal,
                     coupon=coupon,
                     discount_amount=discount_amount,
-                    shipping_cost=shipping_cost,
-                    tax=tax,
-                    total=total,
+                    shipping_cost=totals["shipping_cost"],
+                    tax=totals["tax"],
+                    total=totals["total"],
                     status='pending',
                     payment_status='pending',
                 )
@@ -331,25 +373,33 @@ class CartViewSet(viewsets.ModelViewSet):
                     coupon.times_used += 1
                     coupon.save()
 
-                # Create order items from cart
-                for cart_item in cart.items.all():
+                # Create order items from cart, in one INSERT
+                cart_items = list(cart.items.all())
+                order_items = []
+                for cart_item in cart_items:
                     # Build absolute URL for product image
                     product_image_url = None
                     if cart_item.product.image:
                         product_image_url = request.build_absolute_uri(cart_item.product.image.url)
-                    
-                    OrderItem.objects.create(
+
+                    order_items.append(OrderItem(
                         order=order,
                         product=cart_item.product,
                         product_name=cart_item.product.name,
                         product_price=cart_item.product.price,
-                        product_image=product_image_url,  # Add this line
+                        product_image=product_image_url,
                         quantity=cart_item.quantity
-                    )
-                    
-                    # Reduce stock
-                    cart_item.product.stock -= cart_item.quantity
-                    cart_item.product.save()
+                    ))
+                OrderItem.objects.bulk_create(order_items)
+
+                # Reduce stock in one UPDATE; the stock CHECK constraint
+                # still fails the checkout if a product ran out meanwhile
+                Product.objects.filter(
+                    id__in=[cart_item.product_id for cart_item in cart_items]
+                ).update(stock=Case(*[
+                    When(id=cart_item.product_id, then=F("stock") - cart_item.quantity)
+                    for cart_item in cart_items
+                ]))
     
                 # Create Stripe checkout session
                 success_url = request.data.get(
@@ -367,13 +417,19 @@ class CartViewSet(viewsets.ModelViewSet):
                     cancel_url=cancel_url,
                 )
 
-                # Store Stripe session ID
+                # Store Stripe session ID and its indexed lookup row
                 order.stripe_payment_intent_id = checkout_session.id
-                order.save()
+                order.save(update_fields=["stripe_payment_intent_id", "updated_at"])
+                StripeObjectLink.objects.create(
+                    stripe_id=checkout_session.id,
+                    object_type="checkout_session",
+                    order=order,
+                )
             
                 # Clear the cart after order creation
                 cart.items.all().delete()
-            
+
+                MetricsService.inc('store_checkouts_total', outcome='success')
                 return Response({
                     'order_id': order.id,
                     'order_number': order.order_number,
@@ -384,6 +440,10 @@ class CartViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
+            MetricsService.inc('store_checkouts_total', outcome='error')
+            # Another checkout took the last units between our read and save
+            if isinstance(e, IntegrityError) and 'stock' in str(e):
+                MetricsService.inc('store_stock_reservation_conflicts_total')
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -469,11 +529,90 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
+    def is_summary_request(self):
+        """
+        ?summary=1 on the list returns header totals and item counts only
+        """
+        return (
+            self.action == "list"
+            and self.request.query_params.get("summary") in ("1", "true")
+        )
+
+    def include_archived(self):
+        """
+        ?include_archived=1 on the list appends archived orders after live ones
+        """
+        return self.request.query_params.get("include_archived") in ("1", "true")
+
+    def build_queryset(self, order_model, item_model):
+        """
+        Orders for current user only, from either the live or archive table
+        Related rows are loaded up front so serializing a page stays at a
+        fixed number of queries instead of one per order/item
+        """
+        queryset = order_model.objects.filter(user=self.request.user)
+
+        if self.is_summary_request():
+            return queryset.annotate(
+                item_count=Count("items"),
+                total_quantity=Coalesce(Sum("items__quantity"), 0),
+            ).order_by("-created_at")
+
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.select_related("coupon").prefetch_related(
+                Prefetch(
+                    "items",
+                    queryset=item_model.objects.select_related("product"),
+                )
+            )
+
+        return queryset
+
     def get_queryset(self):
         """
         Return orders for current user only
         """
-        return Order.objects.filter(user=self.request.user)
+        return self.build_queryset(Order, OrderItem)
+
+    def get_archived_queryset(self):
+        """
+        Return archived orders for current user only
+        """
+        return self.build_queryset(ArchivedOrder, ArchivedOrderItem)
+
+    def get_serializer_class(self):
+        if self.is_summary_request():
+            return OrderSummarySerializer
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        queryset = ChainedQuerySet(
+            self.filter_queryset(self.get_queryset()),
+            self.get_archived_queryset(),
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def get_object(self):
+        """
+        Fall back to the archive when an order is no longer in the live table
+        """
+        try:
+            return super().get_object()
+        except Http404:
+            order = get_object_or_404(
+                self.get_archived_queryset(), pk=self.kwargs["pk"]
+            )
+            self.check_object_permissions(self.request, order)
+            return order
 
     @action(detail=False, methods=['get'], url_path='by-session/(?P<session_id>[^/.]+)')
     def by_session(self, request, session_id=None):
@@ -482,10 +621,12 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         Get order by Stripe session ID
         """
         try:
-            order = Order.objects.get(
-                stripe_payment_intent_id=session_id,
-                user=request.user
-            )
+            # One unique-index lookup on the session mapping; the order
+            # may have been archived since
+            order = StripeObjectLink.objects.select_related("order", "archived_order").get(
+                Q(order__user=request.user) | Q(archived_order__user=request.user),
+                stripe_id=session_id,
+            ).linked_order
             return Response({
                 'order_id': order.id,
                 'order_number': order.order_number,
@@ -493,7 +634,7 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
                 'status': order.status,
                 'payment_status': order.payment_status,
             })
-        except Order.DoesNotExist:
+        except StripeObjectLink.DoesNotExist:
             return Response(
                 {'error': 'Order not found'},
                 status=status.HTTP_404_NOT_FOUND
@@ -543,7 +684,7 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
         Return reviews for a specific product
         Only show approved reviews to non-staff users
         """
-        queryset = ProductReview.objects.all()
+        queryset = ProductReview.objects.select_related("user")
 
         # Filter by product if specified
         product_id = self.request.query_params.get("product", None)
@@ -583,7 +724,7 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
         GET /api/reviews/my_reviews/
         Get all reviews by current user
         """
-        reviews = ProductReview.objects.filter(user=request.user)
+        reviews = ProductReview.objects.filter(user=request.user).select_related("user")
         serializer= self.get_serializer(reviews, many=True)
         return Response(serializer.data)
     
@@ -596,12 +737,18 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
         review = self.get_object()
         product = review.product
         distribution = product.rating_distribution
+        # Both follow from the distribution, no need to query again
+        total_reviews = sum(distribution.values())
+        average_rating = (
+            round(sum(rating * count for rating, count in distribution.items()) / total_reviews, 1)
+            if total_reviews else 0
+        )
 
         return Response({
             "product_id": product.id,
             "product_name": product.name,
-            "avarage_rating": product.avarage_rating,
-            "total_reviews": product.review_count,
+            "average_rating": average_rating,
+            "total_reviews": total_reviews,
             "distribution": distribution
         })
  
@@ -735,6 +882,8 @@ def stripe_webhook(request):
     """
     Stripe webhook endpoint
     POST /api/stripe/webhook/
+    Verifies the signature and stores the event in the inbox, so Stripe
+    gets its 200 without waiting on order updates or email
     """
     payload = request.body
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE")
@@ -755,53 +904,22 @@ def stripe_webhook(request):
         # Invalid signature
         return Response({"error": "Invalid signature"}, status=400)
 
-    # Handle the event
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        
-        # Get the order
-        order_id = session.get("client_reference_id")
-
-        try:
-            order = Order.objects.get(id=order_id)
+    # Record the event; process_webhook_events applies it out of band
+    WebhookService.record_event(json.loads(payload))
 
-            # Update order status
-            order.payment_status = "completed"
-            order.status = "processing"
-            order.save()
-
-            # Send order comfirmation email
-            from .email_service import EmailService
-            EmailService.send_order_confirmation(order)
-
-            print(f"✅ Payment successful for order {order.order_number}")
-            
-        except Order.DoesNotExist:
-            print(f"❌ Order {order_id} not found")
-
-    elif event["type"] == "checkout.session.expired":
-        session = event["data"]["object"]
-        order_id = session.get("client_reference_id")
-
-        try:
-            order = Order.objects.get(id=order_id)
-            order.payment_status = "failed"
-            order.status = "cancelled"
-            order.save()
-
-            # Restore product stock
-            for item in order.items.all():
-                product = item.product
-                if product:
-                    product.stock += item.quantity
-                    product.save()
-            
-            print(f"Checkout expired for order {order.order_number}")
+    return Response({"status": "success"})
 
-        except Order.DoesNotExist:
-            print(f"❌ Order {order_id} not found")
+def parse_date_range(params):
+    """Optional start/end YYYY-MM-DD query params; ValueError if malformed"""
+    dates = []
+    for name in ['start', 'end']:
+        value = params.get(name)
+        parsed = parse_date(value) if value else None
+        if value and not parsed:
+            raise ValueError(f"{name} must be a date in YYYY-MM-DD format")
+        dates.append(parsed)
+    return dates
 
-    return Response({"status": "success"})
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
@@ -810,7 +928,8 @@ def analytics_dashboard(request):
     GET /api/analytics/dashboard/
     Get complete dashboard analytics (Admin only)
     """
-    data = AnalyticsService.get_complete_dashboard()
+    include_archived = request.query_params.get('include_archived') in ('1', 'true')
+    data = AnalyticsCache.get_dashboard(include_archived)
     return Response(data)
 
 
@@ -829,11 +948,22 @@ def analytics_sales_overview(request):
 @permission_classes([IsAdminUser])
 def analytics_top_products(request):
     """
-    GET /api/analytics/top-products/
-    Get top-selling products (Admin only)
+    GET /api/analytics/top-products/?limit=10&start=2025-11-01&end=2025-11-30&category=books&by=revenue
+    Get top-selling products, optionally for a date range and category (Admin only)
     """
-    limit = int(request.query_params.get('limit', 5))
-    data = AnalyticsService.get_top_products(limit)
+    params = request.query_params
+    try:
+        start, end = parse_date_range(params)
+        data = AnalyticsService.get_top_products(
+            limit=int(params.get('limit', 5)),
+            start=start,
+            end=end,
+            category=params.get('category'),
+            rank_by=params.get('by', 'units'),
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     return Response(data)
 
 
@@ -847,3 +977,92 @@ def analytics_daily_sales(request):
     days = int(request.query_params.get('days', 30))
     data = AnalyticsService.get_daily_sales(days)
     return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analytics_timeseries(request):
+    """
+    GET /api/analytics/timeseries/?granularity=day&start=2025-01-01&end=2025-01-31&tz=Europe/Berlin&window=7
+    Get completed sales per hour/day/week/month, zero-filled (Admin only)
+    """
+    params = request.query_params
+    try:
+        start, end = parse_date_range(params)
+        window = int(params['window']) if params.get('window') else None
+        data = TimeSeriesService.get_sales_timeseries(
+            granularity=params.get('granularity', 'day'),
+            start=start,
+            end=end,
+            tz_name=params.get('tz'),
+            window=window,
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analytics_cohorts(request):
+    """
+    GET /api/analytics/cohorts/
+    Get monthly customer cohorts with retention and lifetime value (Admin only)
+    Computed by the build_cohorts command
+    """
+    return Response(CohortService.get_report())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analytics_export_orders(request):
+    """
+    GET /api/analytics/export/orders/?output=csv&start=2025-01-01&end=2025-12-31&status=shipped,delivered&payment_status=completed
+    Stream orders as CSV or JSONL (Admin only)
+    lines=1 exports one row per order line; include_archived=1 adds archived orders
+    """
+    params = request.query_params
+    output = params.get('output', 'csv')
+    try:
+        start, end = parse_date_range(params)
+        chunks = ExportService.stream(
+            output=output,
+            start=start,
+            end=end,
+            statuses=[value for value in params.get('status', '').split(',') if value],
+            payment_statuses=[value for value in params.get('payment_status', '').split(',') if value],
+            lines=params.get('lines') in ('1', 'true'),
+            include_archived=params.get('include_archived') in ('1', 'true'),
+        )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    content_type = 'text/csv' if output == 'csv' else 'application/x-ndjson'
+    name = 'order-lines' if params.get('lines') in ('1', 'true') else 'orders'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}.{output}"'
+    return response
+
+
+def metrics(request):
+    """
+    GET /metrics
+    Prometheus scrape endpoint, for internal scrapers only: requests from
+    outside settings.METRICS_ALLOWED_IPS or without the
+    settings.METRICS_BEARER_TOKEN bearer token get a 404 (no token is
+    needed only while DEBUG is on and none is configured)
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    token = settings.METRICS_BEARER_TOKEN
+    if token:
+        sent = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode()):
+            raise Http404
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(
+        MetricsService.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,195 @@
+# store/webhooks.py
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from .email_service import EmailService
+from .inventory import InventoryService
+from .metrics import MetricsService
+from .models import ArchivedOrder, Order, StripeEvent, StripeObjectLink
+from .rollups import SalesRollupService
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookService:
+    """
+    Service class for the Stripe webhook inbox
+    Events are recorded by the webhook view and applied later by the
+    process_webhook_events worker, with retries and backoff
+    """
+    MAX_ATTEMPTS = 8
+    BASE_BACKOFF_SECONDS = 30
+    MAX_BACKOFF_SECONDS = 3600
+    # A claimed event is retried if its worker dies before finishing
+    LEASE_SECONDS = 300
+
+    @staticmethod
+    def record_event(event):
+        """
+        Store a verified event in the inbox
+        Redeliveries of the same Stripe event id are ignored by the unique
+        constraint, in a single INSERT
+        """
+        StripeEvent.objects.bulk_create(
+            [
+                StripeEvent(
+                    event_id=event["id"],
+                    event_type=event["type"],
+                    payload=event,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def get_order_for_session(session):
+        """
+        Resolve the order for a Stripe checkout session through the indexed
+        session mapping, falling back to client_reference_id for sessions
+        created before the mapping existed
+        Archived orders come back as ArchivedOrder
+        """
+        link = StripeObjectLink.objects.select_related("order", "archived_order").filter(
+            stripe_id=session.get("id")
+        ).first()
+        if link:
+            return link.linked_order
+        return Order.objects.get(id=session.get("client_reference_id"))
+
+    @staticmethod
+    def handle_checkout_completed(session):
+        """Mark the order paid and send the confirmation email, once"""
+        order_id = session.get("client_reference_id")
+
+        try:
+            order = WebhookService.get_order_for_session(session)
+        except Order.DoesNotExist:
+            logger.warning("Order %s not found", order_id)
+            return
+        if isinstance(order, ArchivedOrder):
+            # Delivered or cancelled long ago; nothing left to change
+            logger.info("Order %s is archived, ignoring late payment event", order.order_number)
+            return
+
+        # Conditional update so a replayed event doesn't email twice
+        updated = Order.objects.filter(id=order.id).exclude(
+            payment_status="completed"
+        ).update(
+            payment_status="completed",
+            status="processing",
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            return
+
+        order.refresh_from_db()
+        SalesRollupService.record_orders([order.id])
+
+        # Queue order comfirmation email
+        EmailService.send_order_confirmation(order)
+
+        logger.info("Payment successful for order %s", order.order_number)
+
+    @staticmethod
+    def handle_checkout_expired(session):
+        """Cancel the order and restore its stock, once"""
+        order_id = session.get("client_reference_id")
+
+        try:
+            order = WebhookService.get_order_for_session(session)
+        except Order.DoesNotExist:
+            logger.warning("Order %s not found", order_id)
+            return
+        if isinstance(order, ArchivedOrder):
+            logger.info("Order %s is archived, ignoring late expiry event", order.order_number)
+            return
+
+        # Skipped if the order was paid or already released by the reaper
+        if InventoryService.release_orders([order.id]):
+            logger.info("Checkout expired for order %s", order.order_number)
+
+    @staticmethod
+    def apply_event(event):
+        """Dispatch a Stripe event payload to its handler"""
+        handlers = {
+            "checkout.session.completed": WebhookService.handle_checkout_completed,
+            "checkout.session.expired": WebhookService.handle_checkout_expired,
+        }
+        handler = handlers.get(event["type"])
+        if handler:
+            handler(event["data"]["object"])
+
+    @staticmethod
+    def get_backoff(attempts):
+        """Exponential backoff between retries, capped"""
+        return timedelta(seconds=min(
+            WebhookService.BASE_BACKOFF_SECONDS * 2 ** (attempts - 1),
+            WebhookService.MAX_BACKOFF_SECONDS,
+        ))
+
+    @staticmethod
+    def claim(event_id):
+        """
+        Take the lease on one due event
+        Returns False if another worker got it first
+        """
+        now = timezone.now()
+        return StripeEvent.objects.filter(
+            id=event_id,
+            status__in=["pending", "processing"],
+            next_attempt_at__lte=now,
+        ).update(
+            status="processing",
+            next_attempt_at=now + timedelta(seconds=WebhookService.LEASE_SECONDS),
+        ) == 1
+
+    @staticmethod
+    def process_pending(batch_size=100):
+        """
+        Apply one batch of due events, oldest first
+        Returns (processed, failed) counts for the batch
+        """
+        due_ids = list(
+            StripeEvent.objects.filter(
+                status__in=["pending", "processing"],
+                next_attempt_at__lte=timezone.now(),
+            ).order_by("received_at").values_list("id", flat=True)[:batch_size]
+        )
+
+        processed = failed = 0
+        for event_id in due_ids:
+            if not WebhookService.claim(event_id):
+                continue
+
+            event = StripeEvent.objects.get(id=event_id)
+            try:
+                with transaction.atomic():
+                    WebhookService.apply_event(event.payload)
+            except Exception as e:
+                event.attempts += 1
+                event.last_error = str(e)
+                if event.attempts >= WebhookService.MAX_ATTEMPTS:
+                    # Dead letter: left for a human in the admin
+                    event.status = "failed"
+                else:
+                    event.status = "pending"
+                    event.next_attempt_at = timezone.now() + WebhookService.get_backoff(event.attempts)
+                event.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+                MetricsService.inc("store_webhook_events_total", event_type=event.event_type, result="failed")
+                failed += 1
+                continue
+
+            event.status = "processed"
+            event.processed_at = timezone.now()
+            event.save(update_fields=["status", "processed_at"])
+            MetricsService.inc("store_webhook_events_total", event_type=event.event_type, result="processed")
+            MetricsService.observe(
+                "store_webhook_processing_lag_seconds",
+                (event.processed_at - event.received_at).total_seconds(),
+                event_type=event.event_type,
+            )
+            processed += 1
+
+        return processed, failed